@@ -0,0 +1,78 @@
+"""
+解析処理のベンチマーク: 従来の3段階 (ffprobe / volumedetect / サムネイル) と analyze_media の比較
+
+使い方:
+    python benchmarks/bench_analysis.py [--ffmpeg ffmpeg] [--ffprobe ffprobe] [--repeat 3] (files...)
+
+従来の経路は ResizerCore.get_media_info / get_peak_gain / get_thumbnail_data と同じコマンドを実行します。
+(wx を読み込まないよう、ここではコマンドのみを再現しています)
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from replayresizer.analyzer import analyze_media  # noqa: E402
+
+THUMBNAIL_SIZE = (380, 214)
+
+
+def legacy_analyze(ffmpeg: str, ffprobe: str, path: Path, tmp_dir: Path):
+    p = subprocess.run([ffprobe, "-v", "quiet", "-print_format", "json", "-show_streams", str(path)],
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+    stream = next(s for s in json.loads(p.stdout)["streams"] if s.get("codec_type") == "video")
+
+    location = int(float(stream.get("duration", 0)) * .25)
+    subprocess.run([ffmpeg, "-v", "quiet", "-ss", str(location), "-i", str(path),
+                    "-vframes", "1", "-f", "image2", "-s", f"{THUMBNAIL_SIZE[0]}x{THUMBNAIL_SIZE[1]}",
+                    "-y", str(tmp_dir / "thumbnail.tmp")],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    subprocess.run([ffmpeg, "-hide_banner", "-i", str(path),
+                    "-af", "volumedetect", "-vn", "-sn", "-dn", "-f", "null", "-"],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def single_pass_analyze(ffmpeg: str, path: Path):
+    analyze_media(ffmpeg, path, thumbnail_size=THUMBNAIL_SIZE)
+
+
+def measure(func, repeat: int):
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        results.append(time.perf_counter() - start)
+    return statistics.median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--ffprobe", default="ffprobe")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    total_legacy = total_single = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in args.files:
+            legacy = measure(lambda: legacy_analyze(args.ffmpeg, args.ffprobe, path, Path(tmp_dir)), args.repeat)
+            single = measure(lambda: single_pass_analyze(args.ffmpeg, path), args.repeat)
+            total_legacy += legacy
+            total_single += single
+            print(f"{path.name}: legacy={legacy:.3f}s single-pass={single:.3f}s "
+                  f"({(1 - single / legacy) * 100:+.1f}% reduction)")
+
+    print(f"TOTAL: legacy={total_legacy:.3f}s single-pass={total_single:.3f}s "
+          f"({(1 - total_single / total_legacy) * 100:+.1f}% reduction)")
+
+
+if __name__ == '__main__':
+    main()
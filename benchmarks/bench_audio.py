@@ -0,0 +1,66 @@
+"""
+音声解析のベンチマーク: volumedetect と NumPy 解析 (全体 / サンプリング) の速度とピークの誤差
+
+使い方:
+    python benchmarks/bench_audio.py [--ffmpeg ffmpeg] [--windows 12] [--window-seconds 5] (files...)
+
+volumedetect の経路は ReplayResizer.get_peak_gain と同じコマンドを実行します。
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from replayresizer.analyzer import parse_input_header  # noqa: E402
+from replayresizer.audio import analyze_audio  # noqa: E402
+
+MAX_VOLUME_REG = re.compile(r"max_volume: (-?\d+\.\d*) dB")
+
+
+def volumedetect(ffmpeg: str, path: Path):
+    p = subprocess.run([ffmpeg, "-hide_banner", "-i", str(path),
+                        "-af", "volumedetect", "-vn", "-sn", "-dn", "-f", "null", "-"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    lines = p.stderr.decode(errors="ignore").splitlines()
+    info, _ = parse_input_header(lines)
+    peak = next((float(m.group(1)) for m in map(MAX_VOLUME_REG.search, lines) if m), None)
+    return peak, float(info["duration"]) if info and "duration" in info else None
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--windows", type=int, default=12)
+    parser.add_argument("--window-seconds", type=float, default=5.)
+    args = parser.parse_args()
+
+    for path in args.files:
+        (peak, duration), t_detect = timed(lambda: volumedetect(args.ffmpeg, path))
+        full, t_full = timed(lambda: analyze_audio(args.ffmpeg, path))
+        sampled, t_sampled = timed(lambda: analyze_audio(
+            args.ffmpeg, path, duration=duration, sample_windows=args.windows, window_seconds=args.window_seconds))
+
+        print(f"{path.name} ({round(duration or 0, 1)}s)")
+        print(f"  volumedetect : {t_detect:7.3f}s peak={peak}")
+        for name, stats, seconds in (("numpy full", full, t_full), ("numpy sampled", sampled, t_sampled)):
+            if stats is None:
+                print(f"  {name:13}: {seconds:7.3f}s (no audio)")
+                continue
+            error = f"{stats.peak_db - peak:+.2f} dB" if peak is not None and stats.peak_db is not None else "n/a"
+            print(f"  {name:13}: {seconds:7.3f}s peak={stats.peak_db} (error {error}) "
+                  f"rms={stats.rms_db} loudness={stats.loudness} speedup={t_detect / seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+試しエンコードによるサイズ予測のベンチマーク: 予測なし / ありでファイルを実際にリサイズし、
+予測にかかった時間と、それによって省けた再エンコードの回数・時間を比較します
+
+使い方:
+    python benchmarks/bench_sample_predict.py [--config appconfig.json] [--size-limit 24950]
+                                              [--ffmpeg ffmpeg] [--ffprobe ffprobe] (files...)
+
+HeadlessResizer で実行するため、エンコードの設定 (段階・2パス・補正など) は --config の設定ファイルに従います。
+履歴やキャッシュは一時フォルダに作るため、補正 (calibration) は両方とも履歴なしの状態から始まります。
+"""
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from replayresizer.headless import HeadlessResizer  # noqa: E402
+
+
+def run(files, base_config: dict, *, sample_predict: bool, work_dir: Path):
+    app_dir = work_dir / ("predict" if sample_predict else "baseline")
+    output = app_dir / "out"
+    output.mkdir(parents=True)
+
+    config = dict(base_config, output_directory=str(output), sample_predict=sample_predict,
+                  speculative_encode=False, backlog_scan=False, job_journal=False, max_workers=1)
+    config_file = app_dir / "appconfig.json"
+    config_file.write_text(json.dumps(config), encoding="utf8")
+
+    main = HeadlessResizer(app_dir, config_file=config_file)
+    main.config.load_from_json_file(save_default=False)
+    main.setup_caches()
+
+    start = time.perf_counter()
+    main.run(files)
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    for entry in main.finished:
+        steps = entry.telemetry.steps
+        sample = sum(seconds for label, seconds, _ in steps if label == "sample")
+        results[entry.source.name] = dict(
+            encodes=entry.telemetry.encodes,
+            sample=sample,
+            encode=entry.telemetry.encode_seconds - sample,
+            size=entry.resized_size,
+            hit=entry.telemetry.encodes == 1 and bool(entry.telemetry.hit_target),
+        )
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--config", type=Path, help="元にする設定ファイル")
+    parser.add_argument("--size-limit", type=int)
+    parser.add_argument("--ffmpeg")
+    parser.add_argument("--ffprobe")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    args = parser.parse_args()
+
+    HeadlessResizer.setup_logging(logging.DEBUG if args.verbose else logging.WARNING, redirect_stdio=False)
+
+    base_config = json.loads(args.config.read_text(encoding="utf8")) if args.config else {}
+    for key, value in (("size_limit", args.size_limit), ("ffmpeg_command", args.ffmpeg),
+                       ("ffprobe_command", args.ffprobe)):
+        if value:
+            base_config[key] = value
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        baseline, baseline_total = run(args.files, base_config, sample_predict=False, work_dir=Path(tmp_dir))
+        predict, predict_total = run(args.files, base_config, sample_predict=True, work_dir=Path(tmp_dir))
+
+    avoided = saved = cost = 0.
+    for path in args.files:
+        a = baseline.get(path.name)
+        b = predict.get(path.name)
+        if a is None or b is None:
+            print(f"{path.name}: failed")
+            continue
+
+        avoided += a["encodes"] - b["encodes"]
+        saved += a["encode"] - b["encode"]
+        cost += b["sample"]
+        print(f"{path.name}: baseline x{a['encodes']} {a['encode']:.1f}s {a['size']:.0f}KB "
+              f"hit={a['hit']} | predict x{b['encodes']} {b['encode']:.1f}s + sample {b['sample']:.1f}s "
+              f"{b['size']:.0f}KB hit={b['hit']}")
+
+    print(f"TOTAL: retry encodes avoided={avoided:+.0f} encode time saved={saved:.1f}s "
+          f"predictor cost={cost:.1f}s (net {saved - cost:+.1f}s) "
+          f"wall baseline={baseline_total:.1f}s predict={predict_total:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
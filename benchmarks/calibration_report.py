@@ -0,0 +1,59 @@
+"""
+エンコード履歴から、1回目で制限に収まった割合を補正なし / 補正ありで比較します
+
+使い方:
+    python benchmarks/calibration_report.py [encodehistory.jsonl] [--fill 97] [--min-samples 5]
+
+記録された実績に加えて、各記録をそれ以前の記録だけで補正した場合に収まったかどうかを再現します。
+(結果サイズは指定サイズに比例すると仮定)
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from replayresizer.calibration import EncodeHistory, get_size_ratio  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("history", nargs="?", type=Path, default=Path("encodehistory.jsonl"))
+    parser.add_argument("--fill", type=float, default=97.)
+    parser.add_argument("--min-samples", type=int, default=5)
+    args = parser.parse_args()
+
+    history = EncodeHistory(args.history, max_records=10 ** 6)
+    history.load()
+    print("recorded:")
+    for line in history.report():
+        print(f"  {line}")
+
+    replay = EncodeHistory(args.history.with_name(args.history.name + ".replay"), max_records=10 ** 6)
+    results = {}
+    for record in history.records:
+        ratio = get_size_ratio(record)
+        if ratio is None:
+            continue
+        group = results.setdefault((record["preset"], record["mode"]), [0, 0, 0])
+
+        group[0] += 1
+        preset_adjust = record.get("size_adjust_preset", record["size_adjust_first"])
+        if ratio * preset_adjust <= 100:
+            group[1] += 1
+
+        adjust = replay.predict_size_adjust(record["preset"], record["mode"], record["duration"],
+                                            fill=args.fill, min_samples=args.min_samples)
+        if ratio * (adjust if adjust is not None else preset_adjust) <= 100:
+            group[2] += 1
+
+        replay.records.append(record)
+
+    print("replayed:")
+    print(f"  {'preset':16} {'mode':8} {'count':>6} {'before':>7} {'after':>7}")
+    for (preset, mode), (count, before, after) in sorted(results.items()):
+        print(f"  {preset:16} {mode:8} {count:6} {before / count * 100:6.1f}% {after / count * 100:6.1f}%")
+
+
+if __name__ == '__main__':
+    main()
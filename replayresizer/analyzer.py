@@ -0,0 +1,288 @@
+"""
+ffmpeg を1回だけ起動して、ストリーム情報・ピークゲイン・サムネイルを同時に取得する解析エンジン
+
+    ffmpeg -skip_frame:v nokey -i (in)
+        -map 0:v:0 -vf scale,showinfo -f rawvideo pipe:1   ... キーフレームのみをサムネイル候補として出力
+        -vn -af volumedetect -f null -                     ... 音声のピーク (ffmpeg の既定の音声ストリーム)
+
+ストリーム情報は ffmpeg の入力ヘッダ出力 (stderr) から読み取ります。
+"""
+import re
+import subprocess
+import threading
+from logging import getLogger
+from pathlib import Path
+from typing import Optional, Tuple, Dict, List, Callable
+
+from replayresizer.entry import MediaInfo
+from replayresizer.errors import ProcessCodeError
+from replayresizer.tools import subprocess_startup_info
+
+log = getLogger(__name__)
+
+DURATION_REG = re.compile(r"^\s*Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+STREAM_REG = re.compile(r"^\s*Stream #0:(\d+)\S*: (Video|Audio): (\w+)(.*)$")
+SCALE_REG = re.compile(r"\b(\d{2,5})x(\d{2,5})\b")
+BIT_RATE_REG = re.compile(r"\b(\d+) kb/s")
+FPS_REG = re.compile(r"\b(\d+(?:\.\d+)?)(k?) fps\b")
+SHOWINFO_REG = re.compile(r"\bn:\s*(\d+) .*\bpts_time:\s*(-?\d+(?:\.\d+)?)")
+MAX_VOLUME_REG = re.compile(r"max_volume: (-?\d+\.\d*) dB")
+
+
+class _ThumbnailCollector(threading.Thread):
+    """
+    stdout から rawvideo のフレームを読み、目標位置に最も近いフレームだけを保持します
+
+    フレームと pts は別々のパイプから届くため、pts が未確定のフレームは一時的に保持します。
+    目標位置が未確定の間は、最新のフレームだけを保持します
+    """
+
+    def __init__(self, stream, frame_size: int, on_found: Optional[Callable[[bytes], None]] = None):
+        """
+        :param on_found: 目標位置のフレームが見つかった時点で (解析の完了を待たずに) 呼ばれます
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.stream = stream
+        self.frame_size = frame_size
+        self.on_found = on_found
+        self.target = None  # type: Optional[float]
+        self.pts_times = {}  # type: Dict[int, float]
+        self.frames = {}  # type: Dict[int, bytes]
+        self.found = None  # type: Optional[int]
+        self.delivered = False
+        self._lock = threading.Lock()
+
+    def set_target(self, target: float):
+        with self._lock:
+            self.target = target
+            self._prune()
+        self._deliver()
+
+    def set_pts(self, index: int, pts_time: float):
+        with self._lock:
+            self.pts_times[index] = pts_time
+            self._prune()
+        self._deliver()
+
+    def run(self) -> None:
+        index = 0
+        while True:
+            data = self.stream.read(self.frame_size)
+            if not data or len(data) < self.frame_size:
+                break
+
+            with self._lock:
+                if self.found is None:
+                    self.frames[index] = data
+                    self._prune()
+            self._deliver()
+            index += 1
+
+    def _deliver(self):
+        with self._lock:
+            if self.delivered or self.found is None or not self.on_found:
+                return
+            self.delivered = True
+            frame = self.frames.get(self.found)
+        if frame is not None:
+            self.on_found(frame)
+
+    def _prune(self):
+        if self.found is not None:
+            return
+        if self.target is None:
+            if len(self.frames) > 1:
+                newest = max(self.frames)
+                self.frames = {newest: self.frames[newest]}
+            return
+
+        before = None
+        for index in sorted(self.frames):
+            pts_time = self.pts_times.get(index)
+            if pts_time is None:
+                continue
+            if pts_time >= self.target:
+                self.found = index
+                break
+            if before is not None:
+                self.frames.pop(before, None)
+            before = index
+
+        if self.found is not None:
+            self.frames = {self.found: self.frames[self.found]}
+
+    @property
+    def frame(self) -> Optional[bytes]:
+        with self._lock:
+            if self.found is not None:
+                return self.frames.get(self.found)
+            if self.frames:
+                return self.frames[max(self.frames)]
+
+
+def parse_input_header(lines: List[str]) -> Tuple[Optional[Dict[str, str]], bool]:
+    """
+    ffmpeg の入力ヘッダから、最初の映像ストリームの情報を ffprobe の show_streams 形式で返します
+
+    :return: (映像ストリームの情報 or None, 音声ストリームの有無)
+    """
+    duration = None
+    video = None
+    has_audio = False
+
+    for line in lines:
+        if line.startswith("Output #") or line.startswith("Stream mapping:"):
+            break
+
+        m = DURATION_REG.search(line)
+        if m:
+            duration = int(m.group(1)) * 60 * 60 + int(m.group(2)) * 60 + float(m.group(3))
+            continue
+
+        m = STREAM_REG.search(line)
+        if not m:
+            continue
+
+        if m.group(2) == "Audio":
+            has_audio = True
+            continue
+
+        if video is not None:
+            continue
+
+        video = dict(index=m.group(1), codec_type="video", codec_name=m.group(3))
+        detail = m.group(4)
+
+        m = SCALE_REG.search(detail)
+        if m:
+            video["width"], video["height"] = m.group(1), m.group(2)
+
+        m = BIT_RATE_REG.search(detail)
+        if m:
+            video["bit_rate"] = str(int(m.group(1)) * 1000)
+
+        m = FPS_REG.search(detail)
+        if m:
+            fps = float(m.group(1)) * (1000 if m.group(2) else 1)
+            video["avg_frame_rate"] = f"{round(fps * 1000)}/1000"
+
+    if video is not None and duration is not None:
+        video["duration"] = str(duration)
+
+    return video, has_audio
+
+
+def analyze_media(ffmpeg_command: str, path: Path, *,
+                  thumbnail_size: Optional[Tuple[int, int]] = None, thumbnail_position: float = .25,
+                  peak_gain: bool = True, audio: bool = True,
+                  on_started: Optional[Callable[[subprocess.Popen], None]] = None,
+                  on_thumbnail: Optional[Callable[[Tuple[int, int], bytes], None]] = None) -> Optional[MediaInfo]:
+    """
+    1回の ffmpeg 実行でメディア情報を取得します
+
+    :param thumbnail_size: サムネイルのサイズ。None ならサムネイルを取得しない
+    :param thumbnail_position: サムネイルを取得する位置 (再生時間に対する割合)
+    :param peak_gain: 音声のピークゲインを取得する
+    :param audio: False なら音声ストリームを無視する (音声の無いファイルの再実行用)
+    :param on_started: ffmpeg の起動直後に呼ばれます (優先度の設定など)
+    :param on_thumbnail: 目標位置のサムネイルが得られた時点で、解析の完了を待たずに呼ばれます。
+                         呼ばれなかった場合は、最後に得られたフレームを MediaInfo.thumbnail に設定します
+    :return: 映像ストリームが無ければ None
+    """
+    command_args = [ffmpeg_command, "-hide_banner", "-nostdin"]
+    if thumbnail_size:
+        command_args.extend(["-skip_frame:v", "nokey"])
+    command_args.extend(["-i", str(path)])
+
+    if thumbnail_size:
+        width, height = thumbnail_size
+        command_args.extend([
+            "-map", "0:v:0", "-vf", f"scale={width}:{height},showinfo", "-vsync", "passthrough",
+            "-an", "-sn", "-dn", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1",
+        ])
+    else:
+        command_args.extend(["-map", "0:v:0", "-frames:v", "1", "-an", "-sn", "-dn", "-f", "null", "-"])
+
+    measure_gain = peak_gain and audio
+    if measure_gain:
+        # 従来の volumedetect と同じく、音声ストリームは ffmpeg の既定の選択に任せる
+        command_args.extend(["-af", "volumedetect", "-vn", "-sn", "-dn", "-f", "null", "-"])
+
+    log.debug("analyze command_line: '%s'", "' '".join(command_args))
+
+    p = subprocess.Popen(
+        command_args,
+        stdout=subprocess.PIPE if thumbnail_size else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
+        startupinfo=subprocess_startup_info()
+    )
+    if on_started:
+        on_started(p)
+
+    collector = None
+    if thumbnail_size:
+        collector = _ThumbnailCollector(
+            p.stdout, thumbnail_size[0] * thumbnail_size[1] * 3,
+            on_found=(lambda frame: on_thumbnail(thumbnail_size, frame)) if on_thumbnail else None,
+        )
+        collector.start()
+
+    header = []  # type: List[str]
+    in_header = True
+    info = None
+    has_audio = False
+    gain = None
+
+    for line in p.stderr:
+        line = line.decode(errors="ignore").rstrip()
+
+        if in_header:
+            header.append(line)
+            if line.startswith("Output #") or line.startswith("Stream mapping:"):
+                in_header = False
+                info, has_audio = parse_input_header(header)
+                if collector and info and "duration" in info:
+                    collector.set_target(float(info["duration"]) * thumbnail_position)
+            continue
+
+        if "Parsed_showinfo" in line:
+            m = SHOWINFO_REG.search(line)
+            if m and collector:
+                collector.set_pts(int(m.group(1)), float(m.group(2)))
+            continue
+
+        log.debug(f" > {line}")
+        m = MAX_VOLUME_REG.search(line)
+        if m:
+            gain = float(m.group(1))
+
+    return_code = p.wait()
+    if collector:
+        collector.join()
+
+    if in_header:
+        info, has_audio = parse_input_header(header)
+
+    if info is None:
+        if return_code != 0 and not any(STREAM_REG.search(line) for line in header):
+            log.error(f"analyze_media() returned {return_code} code!")
+            raise ProcessCodeError(p, "\n".join(header))
+        return None
+
+    if return_code != 0:
+        if measure_gain and not has_audio:
+            log.debug("no audio stream, retrying without volumedetect")
+            return analyze_media(ffmpeg_command, path, thumbnail_size=thumbnail_size,
+                                 thumbnail_position=thumbnail_position, peak_gain=peak_gain, audio=False,
+                                 on_started=on_started, on_thumbnail=on_thumbnail)
+
+        log.error(f"analyze_media() returned {return_code} code!")
+        raise ProcessCodeError(p, "\n".join(header))
+
+    log.debug(f"analyze_media: {info}")
+    media_info = MediaInfo(**info)
+    media_info.peak_gain = gain
+    if collector and not collector.delivered and collector.frame:
+        media_info.thumbnail = (thumbnail_size, collector.frame)
+    return media_info
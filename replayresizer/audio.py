@@ -0,0 +1,183 @@
+"""
+NumPy による音声解析
+
+ffmpeg でステレオにダウンミックスした PCM (f32le) をチャンク単位で読み込み、ピーク・RMS・おおよその統合ラウドネスを求めます。
+sample_windows を指定すると、ファイル全体ではなく等間隔の区間だけをシークして読み込みます。
+
+ラウドネスは BS.1770 のゲーティング (400ms ブロック, 絶対 -70 LUFS / 相対 -10 LU) のみを再現しており、
+K 特性フィルタは省略しているため近似値です。
+"""
+import math
+import subprocess
+from logging import getLogger
+from pathlib import Path
+from typing import Optional, List, Callable
+
+from replayresizer.tools import subprocess_startup_info
+
+numpy = None  # 解析するときに load_numpy() で読み込む (任意の依存)
+_numpy_checked = False
+
+log = getLogger(__name__)
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+CHUNK_SECONDS = 1.
+SUB_BLOCK_SECONDS = .1  # ラウドネスのブロック (400ms, 75% 重複) を 100ms 単位で集計する
+
+
+def load_numpy():
+    """numpy を読み込みます。インストールされていなければ None"""
+    global numpy, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+        except ImportError:
+            log.debug("numpy is not installed")
+    return numpy
+
+
+def is_available() -> bool:
+    return load_numpy() is not None
+
+
+class AudioStats(object):
+    def __init__(self, peak_db: Optional[float], rms_db: Optional[float], loudness: Optional[float],
+                 seconds: float, sampled: bool):
+        self.peak_db = peak_db
+        self.rms_db = rms_db
+        self.loudness = loudness
+        self.seconds = seconds
+        self.sampled = sampled
+
+    def __repr__(self):
+        return f"<{type(self).__name__} peak={self.peak_db} rms={self.rms_db} loudness={self.loudness} " \
+               f"seconds={round(self.seconds, 1)} sampled={self.sampled}>"
+
+
+class _Accumulator(object):
+    def __init__(self):
+        self.peak = 0.
+        self.square_sum = 0.
+        self.samples = 0
+        self.sub_blocks: List[float] = []  # 100ms ごとの平均二乗
+        self._rest = numpy.zeros((0, CHANNELS), dtype=numpy.float32)
+
+    def feed(self, data: bytes):
+        frames = numpy.frombuffer(data, dtype=numpy.float32)
+        frames = frames[:len(frames) - len(frames) % CHANNELS].reshape(-1, CHANNELS)
+        if not len(frames):
+            return
+
+        self.peak = max(self.peak, float(numpy.abs(frames).max()))
+        squares = numpy.square(frames, dtype=numpy.float64)
+        self.square_sum += float(squares.sum())
+        self.samples += squares.size
+
+        frames = numpy.concatenate((self._rest, frames)) if len(self._rest) else frames
+        block = int(SAMPLE_RATE * SUB_BLOCK_SECONDS)
+        count = len(frames) // block
+        if count:
+            blocks = numpy.square(frames[:count * block], dtype=numpy.float64).reshape(count, block * CHANNELS)
+            self.sub_blocks.extend((blocks.mean(axis=1) * CHANNELS).tolist())  # チャンネルの和
+        self._rest = frames[count * block:]
+
+    def break_sequence(self):
+        """サンプリング区間の境界。区間をまたいだブロックを作らないよう端数を捨てます"""
+        self._rest = numpy.zeros((0, CHANNELS), dtype=numpy.float32)
+        self.sub_blocks.append(math.nan)
+
+    def loudness(self) -> Optional[float]:
+        sub_blocks = numpy.array(self.sub_blocks, dtype=numpy.float64)
+        if len(sub_blocks) < 4:
+            return None
+
+        # 400ms ブロック (100ms ずつずらす)。区間の境界 (nan) を含むブロックは除外
+        blocks = numpy.convolve(sub_blocks, numpy.full(4, .25), mode="valid")
+        blocks = blocks[~numpy.isnan(blocks) & (blocks > 0)]
+        if not len(blocks):
+            return None
+
+        levels = -0.691 + 10 * numpy.log10(blocks)
+        blocks = blocks[levels > -70]
+        if not len(blocks):
+            return None
+
+        relative = -0.691 + 10 * math.log10(blocks.mean()) - 10
+        blocks = blocks[-0.691 + 10 * numpy.log10(blocks) > relative]
+        return round(-0.691 + 10 * math.log10(blocks.mean()), 2)
+
+    def result(self, *, sampled: bool) -> AudioStats:
+        peak_db = round(20 * math.log10(self.peak), 2) if self.peak > 0 else None
+        rms_db = round(10 * math.log10(self.square_sum / self.samples), 2) if self.square_sum > 0 else None
+        seconds = self.samples / CHANNELS / SAMPLE_RATE
+        return AudioStats(peak_db, rms_db, self.loudness(), seconds, sampled)
+
+
+def _read_pcm(ffmpeg_command: str, path: Path, accumulator: _Accumulator, *,
+              start: float = None, length: float = None,
+              on_started: Optional[Callable[[subprocess.Popen], None]] = None) -> int:
+    command_args = [ffmpeg_command, "-v", "error", "-nostdin"]
+    if start is not None:
+        command_args.extend(["-ss", f"{start:.3f}"])
+    command_args.extend(["-i", str(path)])
+    if length is not None:
+        command_args.extend(["-t", f"{length:.3f}"])
+    command_args.extend(["-map", "0:a:0", "-vn", "-sn", "-dn",
+                         "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "-f", "f32le", "pipe:1"])
+
+    p = subprocess.Popen(
+        command_args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        stdin=subprocess.DEVNULL,
+        startupinfo=subprocess_startup_info()
+    )
+    if on_started:
+        on_started(p)
+
+    chunk_size = int(SAMPLE_RATE * CHUNK_SECONDS) * CHANNELS * 4
+    while True:
+        data = p.stdout.read(chunk_size)
+        if not data:
+            break
+        accumulator.feed(data)
+
+    return p.wait()
+
+
+def analyze_audio(ffmpeg_command: str, path: Path, *, duration: float = None,
+                  sample_windows: int = 0, window_seconds: float = 5.,
+                  on_started: Optional[Callable[[subprocess.Popen], None]] = None) -> Optional[AudioStats]:
+    """
+    :param duration: 再生時間。サンプリングする場合に必要
+    :param sample_windows: 0 なら全体を解析、それ以外は等間隔の区間数
+    :param window_seconds: サンプリングする区間の長さ
+    :param on_started: ffmpeg の起動直後に呼ばれます
+    :return: 音声が無いか解析できなければ None
+    """
+    if load_numpy() is None:
+        raise RuntimeError("numpy is not installed")
+
+    accumulator = _Accumulator()
+    sampled = bool(sample_windows and duration and duration > sample_windows * window_seconds * 2)
+
+    if sampled:
+        step = duration / sample_windows
+        for index in range(sample_windows):
+            start = step * index + (step - window_seconds) / 2
+            if _read_pcm(ffmpeg_command, path, accumulator, start=start, length=window_seconds,
+                         on_started=on_started) != 0:
+                return None
+            accumulator.break_sequence()
+
+    elif _read_pcm(ffmpeg_command, path, accumulator, on_started=on_started) != 0:
+        return None
+
+    if not accumulator.samples:
+        return None
+
+    stats = accumulator.result(sampled=sampled)
+    log.debug(f"analyze_audio: {stats!r}")
+    return stats
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+from typing import Optional, Tuple
+
+from replayresizer.entry import MediaInfo
+
+log = getLogger(__name__)
+
+
+def get_file_key(path: Path) -> Optional[str]:
+    """(解決済みパス, サイズ, 更新日時 ns) によるファイルの識別キー"""
+    try:
+        path = path.resolve()
+        stat = path.stat()
+    except OSError:
+        return None
+    return f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class MediaInfoCache(object):
+    """
+    MediaInfo とピークゲインをディスクに保存するキャッシュ
+
+    ファイルが変更されるとキーが変わるため、古いデータは使われずに LRU で追い出されます。
+    put() はメモリ上の更新だけを行い、ファイルへは flush() でまとめて書き込みます
+    """
+
+    def __init__(self, path: Path, *, max_entries: int = 500):
+        self._path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # type: OrderedDict[str, dict]
+        self._dirty = False  # 保存していない変更がある
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not self._path.is_file():
+            return
+
+        try:
+            with self._path.open(encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            log.warning(f"failed to load media cache: {self._path}", exc_info=True)
+            return
+
+        with self._lock:
+            self._entries = OrderedDict((key, value) for key, value in data.items() if isinstance(value, dict))
+            self._trim()
+        log.debug(f"media cache loaded: {len(self._entries)} entries")
+
+    def save(self):
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        with self._lock:
+            try:
+                with tmp.open("w", encoding="utf-8") as file:
+                    json.dump(self._entries, file, ensure_ascii=False)
+                os.replace(tmp, self._path)
+                self._dirty = False
+            except OSError:
+                log.warning(f"failed to save media cache: {self._path}", exc_info=True)
+
+    def flush(self):
+        """変更があれば保存します"""
+        if self._dirty:
+            self.save()
+
+    def get(self, path: Path, *, peek=False) -> Optional[MediaInfo]:
+        """
+        :param peek: ヒット率と LRU の順序に反映しない (解析の前に見積もりだけに使う場合)
+        """
+        if self.max_entries <= 0:
+            return None
+
+        key = get_file_key(path)
+        with self._lock:
+            value = self._entries.get(key) if key else None
+            if not peek:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+
+        if not peek:
+            log.info(f"media cache {'hit' if value else 'miss'}: {path.name} "
+                     f"(hits={self.hits}, misses={self.misses})")
+        if value is None:
+            return None
+
+        media_info = MediaInfo(**value["info"])
+        media_info.peak_gain = value.get("peak_gain")
+        media_info.rms_db = value.get("rms_db")
+        media_info.loudness = value.get("loudness")
+        media_info.spatial_complexity = value.get("spatial_complexity")
+        media_info.temporal_complexity = value.get("temporal_complexity")
+        return media_info
+
+    def put(self, path: Path, media_info: MediaInfo):
+        if self.max_entries <= 0:
+            return
+
+        key = get_file_key(path)
+        if key is None:
+            return
+
+        with self._lock:
+            self._entries[key] = dict(info=media_info.info, peak_gain=media_info.peak_gain,
+                                      rms_db=media_info.rms_db, loudness=media_info.loudness,
+                                      spatial_complexity=media_info.spatial_complexity,
+                                      temporal_complexity=media_info.temporal_complexity)
+            self._entries.move_to_end(key)
+            self._trim()
+            self._dirty = True
+
+    def _trim(self):
+        while len(self._entries) > max(0, self.max_entries):
+            self._entries.popitem(last=False)
+
+
+class ThumbnailCache(object):
+    """サムネイル (rgb24) をメモリに保持する LRU キャッシュ"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # type: OrderedDict[str, bytes]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: Path, size: Tuple[int, int]) -> Optional[str]:
+        key = get_file_key(path)
+        return f"{key}|{size[0]}x{size[1]}" if key else None
+
+    def get(self, path: Path, size: Tuple[int, int]) -> Optional[bytes]:
+        key = self._key(path, size)
+        with self._lock:
+            data = self._entries.get(key) if key else None
+            if data is not None:
+                self._entries.move_to_end(key)
+        return data
+
+    def put(self, path: Path, size: Tuple[int, int], data: bytes):
+        key = self._key(path, size)
+        if key is None or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,169 @@
+"""
+エンコード履歴によるビットレート補正
+
+完了したエントリごとに (プリセット, モード, 再生時間, ソースのビットレート, 解像度, fps, 指定ビットレート, 結果サイズ) を記録し、
+プリセットごとに「指定したサイズに対して実際に何倍のサイズになったか」の比率を学習します。
+次回からは、その比率で size_adjust を補正し、1回目のエンコードで制限に収まるようにします。
+"""
+import json
+import statistics
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import List, Optional, Dict
+
+from replayresizer.entry import ResizeEntry
+
+log = getLogger(__name__)
+
+RECENT_SAMPLES = 30
+DURATION_CLASSES = (60, 300)  # 短い動画はコンテナのオーバーヘッド等で比率が変わるため区別する
+
+
+def get_duration_class(duration: float) -> int:
+    for index, limit in enumerate(DURATION_CLASSES):
+        if duration < limit:
+            return index
+    return len(DURATION_CLASSES)
+
+
+def get_size_ratio(record: dict) -> Optional[float]:
+    """結果サイズ / 指定サイズ (size_limit * size_adjust)"""
+    expected = record["size_limit"] * record["size_adjust"] / 100
+    if expected <= 0 or record["size"] <= 0:
+        return None
+    return record["size"] / expected
+
+
+class EncodeHistory(object):
+    def __init__(self, path: Path, *, max_records: int = 2000):
+        self._path = path
+        self.max_records = max_records
+        self.records = []  # type: List[dict]
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not self._path.is_file():
+            return
+
+        records = []
+        try:
+            with self._path.open(encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except OSError:
+            log.warning(f"failed to load encode history: {self._path}", exc_info=True)
+            return
+
+        with self._lock:
+            self.records = records[-self.max_records:]
+
+        if len(records) > self.max_records:
+            self._rewrite()
+
+        log.debug(f"encode history loaded: {len(self.records)} records")
+
+    def _rewrite(self):
+        with self._lock:
+            try:
+                with self._path.open("w", encoding="utf-8") as file:
+                    for record in self.records:
+                        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                log.warning(f"failed to write encode history: {self._path}", exc_info=True)
+
+    def record(self, entry: ResizeEntry, size_limit: float):
+        info = entry.media_info
+        width, height = info.scale_wh
+        record = dict(
+            time=int(time.time()),
+            preset=entry.preset_name,
+            mode=entry.telemetry.mode,
+            duration=round(info.duration, 3),
+            source_bit_rate=info.bit_rate,
+            resolution=f"{width}x{height}",
+            fps=info.frame_rate,
+            spatial_complexity=info.spatial_complexity,
+            temporal_complexity=info.temporal_complexity,
+            bit_rate=round(entry.bit_rate, 2),
+            size_adjust=round(entry.size_adjust, 3),
+            size_adjust_first=round(entry.size_adjust_first, 3),
+            size_adjust_preset=round(entry.size_adjust_preset or entry.size_adjust_first, 3),
+            size=round(entry.resized_size, 1),
+            size_limit=size_limit,
+            encodes=entry.telemetry.encodes,
+            encode_seconds=round(entry.telemetry.encode_seconds, 2),
+            first_try_hit=entry.telemetry.encodes == 1 and bool(entry.telemetry.hit_target),
+            calibrated=entry.calibrated,
+            sample_ratio=None if entry.sample_ratio is None else round(entry.sample_ratio, 4),
+        )
+
+        with self._lock:
+            self.records.append(record)
+            self.records = self.records[-self.max_records:]
+            try:
+                with self._path.open("a", encoding="utf-8") as file:
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                log.warning(f"failed to append encode history: {self._path}", exc_info=True)
+
+    def _ratios(self, preset: str, mode: str, duration_class: Optional[int]) -> List[float]:
+        with self._lock:
+            records = [r for r in self.records if r.get("preset") == preset and r.get("mode") == mode]
+
+        if duration_class is not None:
+            records = [r for r in records if get_duration_class(r.get("duration", 0)) == duration_class]
+
+        ratios = [get_size_ratio(r) for r in records[-RECENT_SAMPLES:]]
+        return [r for r in ratios if r]
+
+    def predict_size_adjust(self, preset: str, mode: str, duration: float, *,
+                            fill: float = 97., min_samples: int = 5) -> Optional[float]:
+        """
+        直近の比率の中央値から、制限の fill % に収まる size_adjust を返します
+
+        同じ長さの区分で記録が足りなければプリセット全体の記録を使い、それでも足りなければ None を返します
+        """
+        ratios = self._ratios(preset, mode, get_duration_class(duration))
+        if len(ratios) < min_samples:
+            ratios = self._ratios(preset, mode, None)
+        if len(ratios) < min_samples:
+            return None
+
+        ratio = statistics.median(ratios)
+        adjust = max(50., min(110., fill / ratio))
+        log.debug(f"calibration {preset} {mode}: ratio={round(ratio, 3)} ({len(ratios)} samples) "
+                  f"-> size_adjust={round(adjust, 2)}%")
+        return adjust
+
+    def predict_encode_speed(self, preset: str, *, min_samples: int = 3) -> Optional[float]:
+        """直近の (エンコード時間 / 再生時間) の中央値。記録が足りなければ None"""
+        with self._lock:
+            records = [r for r in self.records if r.get("preset") == preset and r.get("encode_seconds")]
+
+        speeds = [r["encode_seconds"] / r["duration"] for r in records[-RECENT_SAMPLES:] if r.get("duration")]
+        if len(speeds) < min_samples:
+            return None
+        return statistics.median(speeds)
+
+    def report(self) -> List[str]:
+        """プリセットごとの1回目で制限に収まった割合 (補正なし / 補正あり)"""
+        with self._lock:
+            records = list(self.records)
+
+        groups: Dict[tuple, Dict[bool, List[bool]]] = {}
+        for record in records:
+            group = groups.setdefault((record.get("preset"), record.get("mode")), {False: [], True: []})
+            group[bool(record.get("calibrated"))].append(bool(record.get("first_try_hit")))
+
+        def _rate(hits: List[bool]):
+            return f"{sum(hits) / len(hits) * 100:5.1f}% ({len(hits):4})" if hits else "    - (   0)"
+
+        lines = [f"{'preset':16} {'mode':8} {'before':>13} {'after':>13}"]
+        for (preset, mode), group in sorted(groups.items(), key=lambda i: (str(i[0][0]), str(i[0][1]))):
+            lines.append(f"{str(preset):16} {str(mode):8} {_rate(group[False]):>13} {_rate(group[True]):>13}")
+        return lines
@@ -0,0 +1,82 @@
+"""
+起動処理
+
+--headless が指定されていれば wxPython を読み込まずに HeadlessResizer で実行し、それ以外は GUI を起動します。
+
+    python -m replayresizer --headless --input (監視フォルダ) --output (出力フォルダ) [--watch]
+    python -m replayresizer --headless --output (出力フォルダ) files...
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import List
+
+
+def run_gui(args: List[str], app_directory: Path):
+    import wx
+
+    app = wx.App()
+
+    instance = wx.SingleInstanceChecker("ReplayResizer-" + wx.GetUserId())
+
+    if instance.IsAnotherRunning():
+        wx.MessageDialog(None, "すでに起動しています。", caption="リプレイリサイザ", style=wx.OK).ShowModal()
+        wx.Exit()
+
+    from replayresizer.replayresizer import ReplayResizer
+
+    main = ReplayResizer(app, app_directory=app_directory)
+    main.setup_logging()
+    main.launch(args)
+    app.MainLoop()
+
+
+def run_headless(args: List[str], app_directory: Path) -> int:
+    parser = argparse.ArgumentParser(prog="replayresizer --headless")
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--config", type=Path, help="設定ファイル (キャッシュ等も同じフォルダに保存されます)")
+    parser.add_argument("--input", help="入力フォルダ (設定の input_directory を上書き)")
+    parser.add_argument("--output", help="出力フォルダ (設定の output_directory を上書き)")
+    parser.add_argument("--size-limit", type=int, help="サイズ制限 KB")
+    parser.add_argument("--workers", type=int, help="同時にエンコードするエントリ数")
+    parser.add_argument("--watch", action="store_true", help="入力フォルダを監視し続ける (デーモン)")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("files", nargs="*", type=Path,
+                        help="処理するファイル。省略すると入力フォルダ内の未処理のファイルを処理します")
+    options = parser.parse_args(args)
+
+    from replayresizer.headless import HeadlessResizer
+
+    if options.config:
+        app_directory = options.config.parent
+    main = HeadlessResizer(app_directory, config_file=options.config)
+    main.setup_logging(logging.DEBUG if options.verbose else logging.INFO, redirect_stdio=False)
+
+    try:
+        main.config.load_from_json_file(save_default=False)
+    except ValueError as e:
+        print(f"failed to load config: {e}", file=sys.stderr)
+        return 2
+
+    if options.input is not None:
+        main.config.input_directory = options.input
+    if options.output is not None:
+        main.config.output_directory = options.output
+    if options.size_limit:
+        main.config.size_limit = options.size_limit
+    if options.workers:
+        main.config.max_workers = options.workers
+
+    main.setup_caches()
+
+    return main.run(options.files, watch=options.watch)
+
+
+def main(args: List[str] = None, *, app_directory: Path = Path(".")):
+    args = sys.argv[1:] if args is None else args
+
+    if "--headless" in args:
+        sys.exit(run_headless(args, app_directory))
+
+    run_gui(args, app_directory)
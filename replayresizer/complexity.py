@@ -0,0 +1,153 @@
+"""
+NumPy による映像の複雑さの推定
+
+再生時間を等分した位置から、縮小したグレースケールの連続フレームを ffmpeg (rawvideo) で数枚ずつ取り出し、
+空間的な複雑さ (輝度の勾配の大きさの平均) と時間的な複雑さ (隣り合うフレームの差の平均) を求めます。
+どちらも 0 - 1 の範囲で、メニュー画面のような静止した映像ほど小さくなります。
+
+bit_demand() は基準の映像に対して、同じ画質に必要なビットレートのおおよその倍率を返します。
+"""
+import subprocess
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Optional, Callable, List, Tuple
+
+from replayresizer.tools import subprocess_startup_info
+
+numpy = None  # 解析するときに load_numpy() で読み込む (任意の依存)
+_numpy_checked = False
+
+log = getLogger(__name__)
+
+FRAME_WIDTH = 160
+FRAME_HEIGHT = 90
+FRAMES_PER_SAMPLE = 3
+# 一般的なゲームプレイ映像の値 (160x90 グレースケール)。bit_demand() が 1 になる
+SPATIAL_REFERENCE = .08
+TEMPORAL_REFERENCE = .03
+TEMPORAL_OFFSET = .005  # 静止した映像でも 0 にしない
+MIN_DEMAND = .5
+MAX_DEMAND = 2.
+
+
+def load_numpy():
+    """numpy を読み込みます。インストールされていなければ None"""
+    global numpy, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+        except ImportError:
+            log.debug("numpy is not installed")
+    return numpy
+
+
+def is_available() -> bool:
+    return load_numpy() is not None
+
+
+class ComplexityStats(object):
+    def __init__(self, spatial: float, temporal: float, samples: int, seconds: float):
+        self.spatial = spatial
+        self.temporal = temporal
+        self.samples = samples
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"<{type(self).__name__} spatial={self.spatial} temporal={self.temporal} " \
+               f"samples={self.samples} seconds={round(self.seconds, 2)}>"
+
+
+def bit_demand(spatial: float, temporal: float) -> float:
+    """基準の映像に対する、必要なビットレートの倍率 (MIN_DEMAND - MAX_DEMAND)"""
+    demand = (max(spatial, 1e-4) / SPATIAL_REFERENCE) ** .4 \
+        * ((temporal + TEMPORAL_OFFSET) / (TEMPORAL_REFERENCE + TEMPORAL_OFFSET)) ** .4
+    return max(MIN_DEMAND, min(MAX_DEMAND, demand))
+
+
+def measure_frames(frames: "numpy.ndarray") -> Tuple[float, Optional[float]]:
+    """
+    :param frames: (フレーム数, 高さ, 幅) の uint8
+    :return: (空間的な複雑さ, 時間的な複雑さ)。フレームが1枚なら時間的な複雑さは None
+    """
+    frames = frames.astype(numpy.float32) / 255
+    dx = numpy.abs(numpy.diff(frames, axis=2)).mean()
+    dy = numpy.abs(numpy.diff(frames, axis=1)).mean()
+    spatial = float(dx + dy)
+    temporal = float(numpy.abs(numpy.diff(frames, axis=0)).mean()) if len(frames) > 1 else None
+    return spatial, temporal
+
+
+def _start_reader(ffmpeg_command: str, path: Path, start: float) -> subprocess.Popen:
+    return subprocess.Popen(
+        [ffmpeg_command, "-v", "error", "-nostdin", "-ss", f"{start:.3f}", "-i", str(path),
+         "-map", "0:v:0", "-an", "-sn", "-dn", "-frames:v", str(FRAMES_PER_SAMPLE),
+         "-vf", f"scale={FRAME_WIDTH}:{FRAME_HEIGHT}:flags=area,format=gray",
+         "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        stdin=subprocess.DEVNULL,
+        startupinfo=subprocess_startup_info()
+    )
+
+
+def _read_frames(p: subprocess.Popen) -> Optional["numpy.ndarray"]:
+    frame_size = FRAME_WIDTH * FRAME_HEIGHT
+    data = p.stdout.read()
+    if p.wait() != 0:
+        return None
+
+    count = len(data) // frame_size
+    if not count:
+        return None
+    return numpy.frombuffer(data[:count * frame_size], dtype=numpy.uint8).reshape(count, FRAME_HEIGHT, FRAME_WIDTH)
+
+
+def analyze_complexity(ffmpeg_command: str, path: Path, *, duration: float, samples: int = 6,
+                       on_started: Optional[Callable[[subprocess.Popen], None]] = None) -> Optional[ComplexityStats]:
+    """
+    :param samples: フレームを取り出す位置の数。位置ごとの ffmpeg は同時に起動します
+    :param on_started: ffmpeg の起動直後に呼ばれます
+    :return: フレームを取り出せなければ None
+    """
+    if load_numpy() is None:
+        raise RuntimeError("numpy is not installed")
+
+    started = time.perf_counter()
+
+    samples = max(1, samples)
+    step = duration / samples
+    processes: List[subprocess.Popen] = []
+    try:
+        for index in range(samples):
+            p = _start_reader(ffmpeg_command, path, step * (index + .5))
+            processes.append(p)
+            if on_started:
+                on_started(p)
+    except (Exception,):
+        for p in processes:
+            p.kill()
+        raise
+
+    spatials: List[float] = []
+    temporals: List[float] = []
+    for p in processes:
+        frames = _read_frames(p)
+        if frames is None:
+            continue
+        spatial, temporal = measure_frames(frames)
+        spatials.append(spatial)
+        if temporal is not None:
+            temporals.append(temporal)
+
+    if not spatials:
+        return None
+
+    stats = ComplexityStats(
+        round(float(numpy.median(spatials)), 4),
+        round(float(numpy.median(temporals)), 4) if temporals else 0.,
+        len(spatials), time.perf_counter() - started,
+    )
+    log.debug(f"analyze_complexity: {stats!r}")
+    return stats
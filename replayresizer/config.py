@@ -2,9 +2,10 @@ import json
 import re
 from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from typing import Pattern
 
+from replayresizer.presets import PresetTable
 from replayresizer.tools import color16_to_colour, colour_to_color16
 
 
@@ -40,7 +41,7 @@ class AppConfiguration(object):
         self.output_directory = ""
         self.ffmpeg_command = "ffmpeg"
         self.ffprobe_command = "ffprobe"
-        self.listen_delay = 0
+        self.listen_delay = 0  # stable_seconds より長ければ、録画完了とみなすまでの安定時間として使う
         self.color = 0x592e31
         self.thumbnail = True
         self.draw_media_info = False
@@ -81,10 +82,84 @@ class AppConfiguration(object):
         # target files
         self.targets = ["1:\\.mp4$"]
         self.ignores = ["1:^\\."]
+        # advanced
+        # 設定画面には表示しない項目 (load_from_panel / load_to_panel では扱わない)。appconfig.json を直接編集して変更する
+        #   ワーカーと解析
+        self.max_workers = 1  # 同時に処理するエントリの数
+        self.prefetch_entries = 2  # エンコード中に先読み解析する待機中のエントリの数
+        self.single_pass_analysis = True  # メディア情報・ピークゲイン・サムネイルを1回の ffmpeg で取得する
+        self.media_cache_size = 500  # mediacache.json に残すメディア情報の数
+        self.thumbnail_cache_size = 32  # メモリに残すサムネイルの数
+        #   エンコードのモード
+        self.two_pass_encode = True  # libx264 / libvpx-vp9 を2パスでエンコードする (リアルタイム指定のパラメータでは1パス)
+        self.overshoot_abort = True  # 最終サイズが制限を超えると予測したらエンコードを中断して再試行する
+        self.overshoot_min_progress = 0.15  # 予測を始める進捗
+        self.overshoot_margin = 3.0  # 予測サイズが制限をこの % 超えたら中断する
+        self.segment_encode = False  # 長い動画をキーフレームで分割して並列にエンコードする
+        self.segment_count = 4
+        self.segment_workers = 4
+        self.segment_min_duration = 120  # 秒。これより短い動画は分割しない
+        #   投機的エンコード。1回目を size_adjust をずらした複数のビットレートで同時に実行し、制限に収まる最大のものを使う
+        self.speculative_encode = False
+        self.speculative_variants = 3  # 2 なら (そのまま, 下げる)、3 なら (上げる, そのまま, 下げる)
+        self.speculative_spread = 6.0  # size_adjust をずらす幅 %
+        #   試しエンコードによるサイズ予測 (2パスで、エンコーダーのパラメータに -crf などの品質の指定がある場合のみ)。
+        #   本番の前に短い区間を同じ設定でエンコードし、size_adjust を補正する
+        self.sample_predict = False
+        self.sample_predict_count = 5
+        self.sample_predict_seconds = 2.0
+        self.sample_predict_workers = 0  # 同時に実行する区間の数 (0 なら全区間)
+        self.sample_predict_max_correction = 20.0  # size_adjust を補正する上限 %
+        #   履歴による size_adjust の補正
+        self.calibration = True
+        self.calibration_min_samples = 5  # 補正に使う履歴の最小件数 (段階・モードごと)
+        self.calibration_fill = 97.0  # 補正後に狙うサイズ (制限に対する %)
+        #   ジャーナルと入力フォルダの監視
+        self.job_journal = True  # jobjournal.jsonl に記録し、未完了のジョブを次回の起動時に再開する
+        self.job_journal_flush_interval = 1.0
+        self.backlog_scan = True  # 監視の開始時に、入力フォルダの未処理のファイルをキューに追加する
+        self.stable_seconds = 1.0  # サイズと更新日時がこの時間変化しなければ録画完了とみなす
+        self.stable_poll_interval = 0.25
+        self.event_coalesce_seconds = 0.2  # 同じファイルのイベントをまとめる時間
+        #   待機キュー
+        self.queue_priority = {"order": 0, "manual": 1, "watcher": 2}  # 待機キューの優先度 (小さいほど先)
+        self.queue_policy = "fifo"  # 同じ優先度の中での順序: fifo / sjf (短いものから) / aging (sjf + 待ち時間)
+        self.queue_aging_rate = 1.0  # aging: 待ち時間1秒あたり、見積もり時間から差し引く秒数
+        self.preemption = False  # 優先度の高いエントリのために、エンコード中のプロセスを一時停止する
+        self.preempt_cost_ratio = 0.25  # 同じ区分では、見積もり時間が残り時間のこの割合以下なら一時停止する
+        #   負荷とアイドル待ち
+        self.process_nice = 0  # ffmpeg の nice 値 (0 なら変更しない。Windows では 1 以上で「通常以下」、15 以上で「低」)
+        self.process_affinity = []  # ffmpeg に割り当てる CPU 番号。空なら制限しない
+        self.thread_budget = 0  # 同時に実行するエンコードで分け合う ffmpeg のスレッド数。0 なら制限しない
+        self.load_limit = 0.0  # CPU 1つあたりの負荷 (自分のエンコードを除く) がこれを超えたらエンコードを一時停止。0 なら監視しない
+        self.load_resume = 0.0  # 一時停止中にこれを下回ったら再開 (0 なら load_limit の 8 割)
+        self.load_check_interval = 5.0
+        self.deferred_encode = False  # エンコードをアイドル時 (または quiet_hours の間) まで待たせる。解析はすぐに行う
+        self.idle_load = 0.3  # CPU 1つあたりの負荷 (自分のエンコードを除く) がこれ未満ならアイドル
+        self.idle_seconds = 60.0  # この時間アイドルが続いたらエンコードを開始する
+        self.quiet_hours = ""  # "HH:MM-HH:MM" の間はアイドルでなくてもエンコードする (日をまたいでもよい)
+        #   音声の解析
+        self.volume_loudness_target = 0.0  # LUFS (0 で無効)
+        self.audio_analysis = "volumedetect"  # volumedetect / numpy / numpy_sampled
+        self.audio_sample_windows = 12  # numpy_sampled: 読み込む区間の数と長さ (秒)
+        self.audio_window_seconds = 5.0
+        #   映像の複雑さ (complexity.py)。段階の選択と size_adjust、解像度の自動選択の bpp の下限に反映する
+        self.complexity_analysis = False  # numpy が必要
+        self.complexity_samples = 6
+        self.complexity_size_adjust = 5.0  # 必要なビットレートが基準の 2倍 (1/2) の映像で size_adjust を下げる (上げる) %
+        #   段階の表 (presets.py)。空なら上の HQ / LQ / ULQ の設定を使う
+        self.presets = []
+        #   解像度とフレームレートの自動選択。有効なら段階の解像度・fps の代わりに、bpp が下限以上の最大の組み合わせを使う
+        self.adaptive_resolution = False
+        self.resolution_ladder = [1080, 900, 720, 576, 480, 360, 270, 180]  # 高さ
+        self.fps_ladder = [60, 30, 24, 15]
+        self.fps_floor = 30  # これ未満のフレームレートは、最小の解像度でも bpp が下限に届かない場合だけ使う
+        self.bpp_floor = 0.05  # 1ピクセル・1フレームあたりのビット数の下限 (段階の bpp_floor が優先)
 
         # cached
         self._active_targets = []  # type: List[Pattern]
         self._active_ignores = []  # type: List[Pattern]
+        self._active_presets: Optional[PresetTable] = None
         self.compile_targets()
 
     def load_from_panel(self, panel):
@@ -205,6 +280,8 @@ class AppConfiguration(object):
 
             setattr(self, key, data.get(key))
 
+        self.compile_targets()
+
     def save_to_json_file(self):
         Path(self._path.parent).mkdir(parents=True, exist_ok=True)
 
@@ -231,6 +308,12 @@ class AppConfiguration(object):
     def active_ignores(self) -> List[Pattern]:
         return self._active_ignores
 
+    @property
+    def active_presets(self) -> PresetTable:
+        if self._active_presets is None:
+            self._active_presets = PresetTable.from_config(self)
+        return self._active_presets
+
     @property
     def close_action_enum(self):
         try:
@@ -257,3 +340,4 @@ class AppConfiguration(object):
     def compile_targets(self):
         self._active_targets = [re.compile(entry[2:]) for entry in self.targets if entry.startswith("1:")]
         self._active_ignores = [re.compile(entry[2:]) for entry in self.ignores if entry.startswith("1:")]
+        self._active_presets = None  # 次に使うときに作り直す
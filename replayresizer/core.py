@@ -0,0 +1,1869 @@
+"""
+監視・解析・エンコードの本体 (wxPython に依存しない部分)
+
+GUI (ReplayResizer) とヘッドレス (HeadlessResizer) はこのクラスを継承し、
+メインスレッドでの呼び出しと、エントリの状態が変わったときの表示を実装します。
+"""
+import json
+import logging
+import math
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import getLogger
+from pathlib import Path
+from typing import Tuple, List, Optional, Callable, Dict, Hashable
+
+from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileModifiedEvent
+from watchdog.observers import Observer
+
+from replayresizer import audio, complexity
+from replayresizer.analyzer import analyze_media
+from replayresizer.cache import MediaInfoCache, ThumbnailCache
+from replayresizer.calibration import EncodeHistory
+from replayresizer.config import AppConfiguration
+from replayresizer.entry import ResizeEntry, MediaInfo, PopupMessage, OrderOption
+from replayresizer.errors import ProcessCodeError
+from replayresizer.events import EventCoalescer
+from replayresizer.governor import ResourceGovernor
+from replayresizer.jobqueue import JobQueue, QueueClass, QueuePolicy, get_file_identity, get_schedule_score
+from replayresizer.journal import JobJournal, JobState
+from replayresizer.orderscript import OrderScriptManager
+from replayresizer.presets import PresetTier, select_ladder_rung
+from replayresizer.projection import SizeProjector
+from replayresizer.sampling import plan_excerpts, predict_video_rate
+from replayresizer.scanner import InputIndex
+from replayresizer.stability import StabilityWatcher
+from replayresizer.segments import get_keyframe_times, plan_segments, write_concat_list
+from replayresizer.tools import *
+
+CONFIG_FILE = Path("appconfig.json")
+MEDIA_CACHE_FILE = Path("mediacache.json")
+ENCODE_HISTORY_FILE = Path("encodehistory.jsonl")
+JOB_JOURNAL_FILE = Path("jobjournal.jsonl")
+INPUT_INDEX_FILE = Path("inputindex.json")
+TWO_PASS_CODECS = ("libx264", "libvpx-vp9")
+REALTIME_PARAMS = re.compile(r"-(?:deadline|quality)\s+realtime\b")  # libvpx は2パス目でリアルタイム指定を使わない
+QUALITY_PARAMS = re.compile(r"(?:^|\s)-(?:crf|cq|qp|q:v|global_quality)\s")  # 品質の指定 (ビットレートは上限として扱われる)
+ASSUMED_SOURCE_BIT_RATE = 20000  # kbps  再生時間が不明な場合に、ファイルサイズから推定するためのビットレート
+DEFAULT_ENCODE_SPEED = 1.  # 履歴が無い場合の (エンコード時間 / 再生時間)
+
+log = getLogger(__name__)
+
+
+class ResizerCore(FileSystemEventHandler):
+    def __init__(self, app_directory: Path, *, config_file: Path = None):
+        self.app_directory = app_directory
+        self.config = AppConfiguration(config_file or app_directory / CONFIG_FILE)
+        self.media_cache = MediaInfoCache(app_directory / MEDIA_CACHE_FILE)
+        self.thumbnail_cache = ThumbnailCache()
+        self.encode_history = EncodeHistory(app_directory / ENCODE_HISTORY_FILE)
+        self.journal = JobJournal(app_directory / JOB_JOURNAL_FILE)
+        self.input_index = InputIndex(app_directory / INPUT_INDEX_FILE)
+        self.script = OrderScriptManager()
+        self.governor = ResourceGovernor()
+        self.governor.on_busy_changed = lambda busy: self.call_main_thread(self.on_system_busy, busy)
+        self.governor.on_release_changed = lambda released: self.call_main_thread(self.on_encode_released, released)
+        # watchdog
+        self.observer = None  # type: Optional[Observer]
+        self.event_coalescer = None  # type: Optional[EventCoalescer]
+        self.stability = StabilityWatcher(lambda path: self.call_main_thread(self.on_recorded, path))  # 録画完了待ち
+        self.entries = JobQueue()  # キューされたエントリ
+        self.active_entries = list()  # type: List[ResizeEntry]  # 処理中、または閉じる待ち
+        self._active_keys: Dict[Hashable, ResizeEntry] = {}  # 処理中のエントリの file_key
+        self._prefetch_task = None  # type: Optional[BackgroundTask]
+        self._checked_ffmpeg = None  # type: Optional[Tuple[str, str]]  # 確認済みの (ffmpeg, ffprobe)
+        self.lock = WithLock()
+        self._pause_menu = False
+
+    # main
+
+    def setup_caches(self):
+        """設定の読み込み後に、キャッシュと履歴を準備します"""
+        self.media_cache.max_entries = int(self.config.media_cache_size)
+        self.media_cache.load()
+        self.thumbnail_cache.max_entries = int(self.config.thumbnail_cache_size)
+        self.encode_history.load()
+        self.input_index.load()
+        for line in self.encode_history.report():
+            log.info(f"first-try hit rate: {line}")
+
+    def start_governor(self):
+        """設定を反映し、負荷の監視を (再) 開始します"""
+        self.governor.stop()
+        self.governor.nice = int(self.config.process_nice or 0)
+        self.governor.affinity = [int(cpu) for cpu in self.config.process_affinity or []]
+        self.governor.thread_budget = max(0, int(self.config.thread_budget or 0))
+        self.governor.concurrency = max(1, int(self.config.max_workers or 1))
+        self.governor.load_limit = float(self.config.load_limit or 0)
+        self.governor.load_resume = float(self.config.load_resume or 0)
+        self.governor.check_interval = max(1., float(self.config.load_check_interval))
+        self.governor.deferred = bool(self.config.deferred_encode)
+        self.governor.idle_load = float(self.config.idle_load)
+        self.governor.idle_seconds = float(self.config.idle_seconds)
+        self.governor.quiet_hours = str(self.config.quiet_hours or "")
+        self.governor.start()
+        if self.is_deferred:
+            log.info("deferred encoding: waiting for idle time")
+
+    def on_system_busy(self, busy: bool):
+        """負荷が高い間はエンコードを一時停止します。メインスレッドで呼ばれます"""
+        if not busy:
+            self.next_entry()
+            return
+
+        with self.lock:
+            for entry in self.running_entries:
+                # 解析中のエントリも、エンコードを開始しないように一時停止状態にする
+                self.suspend_entry(entry, force=True)
+        self.update_entries()
+
+    def on_encode_released(self, released: bool):
+        """アイドル待ちの状態が変わりました。メインスレッドで呼ばれます"""
+        if released:
+            self.next_entry()
+        else:
+            self.update_entries()
+
+    @property
+    def is_deferred(self) -> bool:
+        """アイドル待ちで、待機中のエントリのエンコードを開始しない"""
+        return self.governor.deferred and not self.governor.released
+
+    def resume_jobs(self):
+        """ジャーナルを開き、前回終了時に未完了だったジョブを再びキューに追加します"""
+        if not self.config.job_journal:
+            return
+
+        self.journal.flush_interval = float(self.config.job_journal_flush_interval)
+        for job in self.journal.open():
+            output = job.get("output")
+            if job.get("state") == JobState.ENCODING and output and Path(output) != Path(job["source"]):
+                log.info(f"deleting partial output: {output}")
+                try:
+                    Path(output).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    log.warning(f"failed to delete: {e}")
+
+            work_dir = job.get("work_dir")
+            if job.get("state") == JobState.ENCODING and work_dir and Path(work_dir).is_dir():
+                log.info(f"deleting work directory: {work_dir}")
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            source = Path(job["source"])
+            entry = ResizeEntry(source, size_limit=int(job.get("size_limit") or self.config.size_limit))
+            entry.job_id = job["id"]
+            entry.is_script_order = bool(job.get("is_script_order"))
+            entry.custom_outname = job.get("custom_outname")
+            entry.order_options = int(job.get("order_options") or 0)
+            entry.queue_class = job.get("queue_class") or QueueClass.WATCHER
+
+            if not source.is_file():
+                log.warning(f"resume job: source not found: {source}")
+                self.set_job_state(entry, JobState.FAILED, reason="source not found")
+                continue
+
+            log.info(f"resume job: {source.name!r} (was {job.get('state')})")
+            self.add_entry(entry)
+
+    def set_job_state(self, entry: ResizeEntry, state: str, **values):
+        """ジャーナルに記録し、処理を終えたファイルは入力フォルダの索引に追加します"""
+        self.journal.write(entry, state, **values)
+
+        if state in JobState.FINISHED:
+            self.input_index.add(entry.source, save=False)
+            if entry.resized and entry.resized.parent.resolve() == entry.source.parent.resolve():
+                self.input_index.add(entry.resized, save=False)  # 出力先が入力フォルダと同じ場合
+            self.input_index.save()
+
+    def scan_backlog(self, *, seed=True):
+        """
+        入力フォルダにある未処理のファイルとオーダースクリプトをキューに追加します
+
+        seed が True で、このフォルダを初めてスキャンする場合は、既存のファイルを処理せずに索引へ登録だけします
+        """
+        directory = Path(self.config.input_directory)
+        if not self.config.input_directory or not directory.is_dir():
+            return
+
+        start = time.perf_counter()
+        seeding = seed and not self.input_index.has_directory(directory)
+        try:
+            orders, files = self.input_index.scan(directory, self.check_filename, self.script.is_script_file)
+        except OSError:
+            log.warning("exception in backlog scan", exc_info=True)
+            return
+        log.info(f"backlog scan: {len(files)} new files, {len(orders)} orders "
+                 f"({round((time.perf_counter() - start) * 1000, 1)} ms)")
+
+        for path in orders:
+            try:
+                entry = self.script.process_script_entry(path, size_limit=self.config.size_limit)
+            except (Exception,):
+                log.warning(f"exception in order script: {path}", exc_info=True)
+                continue
+            if entry:
+                self.add_entry(entry)
+
+        if seeding:
+            log.info("backlog scan: first scan, indexing existing files without processing")
+            for path in files:
+                self.input_index.add(path, save=False)
+            files = []
+
+        self.input_index.mark_directory(directory)
+        self.input_index.save()
+
+        for path in files:
+            self.wait_recorded(path)
+
+    def wait_recorded(self, path: Path):
+        """ファイルの書き込みが終わってから on_recorded を呼びます"""
+        self.stability.stable_seconds = max(float(self.config.stable_seconds), float(self.config.listen_delay or 0))
+        self.stability.poll_interval = float(self.config.stable_poll_interval)
+        self.stability.watch(path)
+
+    def start_watchdog(self):
+        self.stop_watchdog()
+
+        if self.config.input_directory and Path(self.config.input_directory).is_dir():
+            self.event_coalescer = EventCoalescer(
+                self, Path(self.config.input_directory),
+                check_filename=self.check_filename, is_order=self.script.is_script_file,
+                targets=self.config.active_targets, delay=float(self.config.event_coalesce_seconds),
+            )
+            self.observer = Observer()
+            self.observer.setDaemon(True)
+            self.observer.schedule(self.event_coalescer, self.config.input_directory)
+            log.info("observer started: %s", self.config.input_directory)
+            self.observer.start()
+
+            if self.config.backlog_scan:
+                self.scan_backlog()
+
+    def stop_watchdog(self):
+        if self.observer is not None:
+            log.debug("stopping observer")
+            try:
+                if self.observer.is_alive():
+                    self.observer.stop()
+                    self.observer.join(2)
+            except (Exception,):
+                log.exception("exception in observer shutdown")
+            else:
+                log.info("observer stopped")
+
+            self.observer = None
+
+        if self.event_coalescer is not None:
+            self.event_coalescer.stop()
+            log.info(f"watchdog events: {self.event_coalescer.stats}")
+            self.event_coalescer = None
+
+        self.stability.clear()
+
+    def on_recorded(self, path: Path, *, queue_class=QueueClass.WATCHER):
+        file_key = get_file_identity(path)
+        if file_key is None or not path.is_file():
+            return
+
+        with self.lock:
+            if file_key in self._active_keys:
+                log.warning(f"ignore queuing for running file: {path}")
+                return
+
+            if self.entries.find(file_key) is not None or self.entries.find_path(path) is not None:
+                log.warning(f"ignore queuing for already queued: {path}")
+                return
+
+        entry = ResizeEntry(path, size_limit=self.config.size_limit)
+        entry.queue_class = queue_class
+        entry.file_key = file_key
+        self.add_entry(entry)
+
+    def get_queue_priority(self, entry: ResizeEntry, queued_at: float) -> Tuple[float, float]:
+        """(区分の優先度, スケジューリング方針によるスコア)"""
+        priorities = self.config.queue_priority or {}
+        try:
+            class_priority = float(priorities[entry.queue_class])
+        except (KeyError, TypeError, ValueError):
+            defaults = QueueClass.DEFAULT_PRIORITY
+            class_priority = float(defaults.get(entry.queue_class, defaults[QueueClass.WATCHER]))
+
+        policy = self.config.queue_policy
+        if policy not in QueuePolicy.ALL or policy == QueuePolicy.FIFO:
+            return class_priority, 0.
+
+        cost = entry.estimated_cost = self.estimate_job_cost(entry)
+        score = get_schedule_score(policy, cost, queued_at, aging_rate=float(self.config.queue_aging_rate))
+        log.debug(f"queue {policy}: {entry.source.name!r} cost={round(cost, 1)}s score={round(score, 1)}")
+        return class_priority, score
+
+    def estimate_job_cost(self, entry: ResizeEntry) -> float:
+        """
+        エンコード時間の見積もり (秒)
+
+        再生時間はキャッシュ済みの MediaInfo か、無ければファイルサイズから推定し、
+        選ばれるはずのプリセットの履歴のエンコード速度を掛けます
+        """
+        info = entry.media_info or self.media_cache.get(entry.source, peek=True)
+        if info is not None and info.duration > 0:
+            duration = info.duration
+        else:
+            duration = entry.source_size * 8 / ASSUMED_SOURCE_BIT_RATE
+        duration = max(1., duration)
+
+        preset = entry.preset_name or self.select_preset(duration).name
+        speed = self.encode_history.predict_encode_speed(preset)
+        return duration * (DEFAULT_ENCODE_SPEED if speed is None else speed)
+
+    def add_entry(self, entry: ResizeEntry):
+        if entry.is_script_order:
+            entry.queue_class = QueueClass.ORDER
+        if entry.file_key is None:
+            entry.file_key = get_file_identity(entry.source)
+
+        log.info(f"queueing: {entry.source.name!r} ({entry.queue_class})")
+        if entry.is_script_order:
+            log.info(f"  is order: {entry.order_filename!r}")
+        self.set_job_state(entry, JobState.QUEUED)
+
+        queued_at = entry.queued_at = time.monotonic()
+        priority = entry.queue_priority = self.get_queue_priority(entry, queued_at)
+        if self.config.preemption and entry.estimated_cost is None:
+            entry.estimated_cost = self.estimate_job_cost(entry)
+
+        with self.lock:
+            victim = None
+            if not self.has_free_worker and not self.is_paused_menu and not self.governor.busy \
+                    and not self.is_deferred:
+                victim = self.find_preempt_victim(entry)
+
+            if victim is not None and self.suspend_entry(victim):
+                log.info(f"preempt: {entry.source.name!r} suspends {victim.source.name!r}")
+                entry.preempting = True
+                victim.preempted_by = entry
+                try:
+                    if not self.process(entry):
+                        self.entries.push(entry, priority)  # 開始できるまで victim は再開しない
+                except (Exception,):
+                    log.exception("exception in process entry")
+
+            elif not self.has_free_worker or self.is_paused_menu or self.governor.busy or self.is_deferred:
+                log.debug(f"running:{self.running_entries!r} isPausedMenu:{self.is_paused_menu!r} "
+                          f"busy:{self.governor.busy!r} deferred:{self.is_deferred!r}")
+                self.entries.push(entry, priority)
+                self.call_main_thread(self.prefetch_entries)
+            else:
+                try:
+                    self.process(entry)
+                except (Exception,):
+                    log.exception("exception in process entry")
+
+    def find_preempt_victim(self, entry: ResizeEntry) -> Optional[ResizeEntry]:
+        """
+        entry のために一時停止するエンコード中のエントリ
+
+        区分の優先度が entry より低いもの、または同じ区分で残りの見積もり時間が
+        entry の見積もり時間の 1 / preempt_cost_ratio 倍以上のものから、残り時間が最も長いものを選びます
+        """
+        if not self.config.preemption or entry.estimated_cost is None:
+            return None
+
+        ratio = float(self.config.preempt_cost_ratio)
+        class_priority = entry.queue_priority[0]
+        victim = None
+        victim_remaining = 0.
+        for running in self.running_entries:
+            if not running.is_encoding or running.preempting or running.queue_priority is None:
+                continue
+
+            remaining = self.estimate_job_cost(running) * max(0., 1 - (running.encode_progress or 0))
+            if running.queue_priority[0] > class_priority or \
+                    running.queue_priority[0] == class_priority and entry.estimated_cost <= remaining * ratio:
+                if victim is None or remaining > victim_remaining:
+                    victim, victim_remaining = running, remaining
+        return victim
+
+    def suspend_entry(self, entry: ResizeEntry, *, force=False) -> bool:
+        """
+        エンコード中のプロセスを一時停止し、ワーカーを空けます
+
+        :param force: エンコード中でなくても一時停止状態にする (次のプロセスの開始を待たせる)
+        """
+        with entry.process_lock:
+            if entry.suspended or not (entry.is_encoding or force):
+                return False
+
+            suspended = [p for p in entry.processes if suspend_process(p)]
+            if not suspended and not force:
+                return False
+
+            entry.suspended = True
+            entry.suspended_at = time.monotonic()
+            entry.resume_event.clear()
+            for threads in entry.thread_leases:
+                self.governor.release_threads(threads)  # 停止中のプロセスの分は、他のエンコードに回す
+
+        log.info(f"suspended: {entry!r} at {round((entry.encode_progress or 0) * 100)}%")
+        return True
+
+    def is_preempted(self, entry: ResizeEntry) -> bool:
+        """entry を一時停止させたエントリが、まだ一時停止中か待機中なら True (先に再開・開始させる)"""
+        preempting = entry.preempted_by
+        if preempting is None:
+            return False
+        if preempting.suspended or preempting in self.entries:
+            return True
+        entry.preempted_by = None
+        return False
+
+    def resume_entry(self, entry: ResizeEntry):
+        with entry.process_lock:
+            if not entry.suspended:
+                return
+
+            for threads in entry.thread_leases:
+                self.governor.acquire_threads(threads)
+            for process in entry.processes:
+                resume_process(process)
+
+            entry.suspended = False
+            entry.suspended_seconds += time.monotonic() - entry.suspended_at
+            entry.resume_event.set()
+
+        log.info(f"resumed: {entry!r}")
+
+    def clear_suspended(self, entry: ResizeEntry):
+        """
+        一時停止したまま終了したエントリ (エラー・スキップ) の一時停止状態を解除します
+
+        停止中のプロセスを終了し、再開を待っているスレッド (分割エンコードの区間など) には
+        次のプロセスを開始させずに戻らせます。スレッド数の割り当ては、各スレッドが終了時に返却します
+        """
+        with entry.process_lock:
+            if not entry.suspended:
+                return
+            entry.stopped = True
+            self.kill_processes(entry)
+            for threads in entry.thread_leases:
+                self.governor.acquire_threads(threads)  # release_entry_threads で返却される
+            entry.suspended = False
+            entry.suspended_seconds += time.monotonic() - entry.suspended_at
+            entry.resume_event.set()
+
+    # events
+
+    def on_created(self, event: FileCreatedEvent):
+        try:
+            log.debug("onCreated: %s (%s)", event.src_path, get_file_size_label(get_file_size(event.src_path)))
+        except FileNotFoundError:
+            return
+
+        path = Path(event.src_path)
+        if self.check_filename(path):
+            self.wait_recorded(path)
+
+    def on_modified(self, event: FileModifiedEvent):
+        try:
+            log.debug("onModified: %s (%s)", event.src_path, get_file_size_label(get_file_size(event.src_path)))
+        except FileNotFoundError:
+            return
+
+        try:
+            path = Path(event.src_path)
+
+            entry = self.script.process_script_entry(path, size_limit=self.config.size_limit)
+            if entry:
+                self.add_entry(entry)
+
+        except (Exception,):
+            log.exception("")
+
+    #
+
+    def process(self, entry: ResizeEntry) -> bool:
+        """
+        :return: ffmpeg を利用できず、処理を開始しなかった場合は False
+        """
+        if not self.has_free_worker:
+            raise RuntimeError(f"No free worker: {self.running_entries!r}")
+
+        if not self.check_ffmpeg():
+            self.on_ffmpeg_unavailable()
+            return False
+
+        self.active_entries.append(entry)
+        if entry.file_key is not None:
+            self._active_keys[entry.file_key] = entry
+        log.info(f"Resize START: {entry!r}")
+        self.on_process_started(entry)
+
+        self.start_background(lambda: self._process_sync(entry))
+        return True
+
+    def _process_sync(self, entry: ResizeEntry):
+        self.set_job_state(entry, JobState.ANALYZING)
+        try:
+            self.analyze_entry(entry, on_update=lambda: self.call_main_thread(self.update_entries))
+        except ProcessCodeError as e:
+            self._on_failed(entry, PopupMessage(
+                f"メディア情報を取得できません (終了コード {e.return_code})",
+                description=entry.source.name,
+            ))
+            return
+        except Exception as e:
+            self._on_failed(entry, PopupMessage(
+                "メディア情報を取得できませんでした",
+            ).with_traceback(e))
+            return
+
+        if not entry.media_info:
+            self._on_failed(entry, None if self.config.ignore_error else PopupMessage(
+                "ビデオストリームがありません",
+                description=entry.source.name,
+            ))
+            return
+
+        if not entry.needs_encode:
+            entry.completed = True
+            self.set_job_state(entry, JobState.DONE)
+            self.call_main_thread(self._on_finished, entry)
+            return
+
+        def go_encode():
+            self.apply_encode_params(entry)
+            self.update_entries()
+
+            if entry.bit_rate < 16:
+                self._on_failed(entry, PopupMessage(
+                    "動画が長すぎます... X(",
+                    description=f"出力ビットレート:  {'-'if entry.bit_rate < 0 else ''}{get_bit_rate_label(abs(entry.bit_rate))}"
+                ))
+                return
+            self.start_background(lambda: self.encode(entry))
+
+        self.call_main_thread(go_encode)
+
+    def analyze_entry(self, entry: ResizeEntry, *, on_update=None):
+        """
+        メディア情報、サムネイル、ピークゲインを取得してエントリに保存します
+
+        解析済みのエントリでは何もしません。先読みと同時に呼ばれた場合は、先に始まった解析の完了を待ちます。
+        メディア情報とピークゲインはキャッシュにあればそれを使用します
+        """
+        with entry.analyze_lock:
+            if entry.analyzed:
+                return
+
+            if entry.media_info is None:
+                entry.media_info = self.media_cache.get(entry.source)
+
+            self._analyze_entry(entry, on_update=on_update)
+            if entry.media_info is not None and entry.needs_encode \
+                    and entry.media_info.spatial_complexity is None and self.use_complexity_analysis:
+                self.measure_complexity(entry.source, entry.media_info)
+            entry.analyzed = True
+
+            if entry.media_info is not None:
+                self.media_cache.put(entry.source, entry.media_info)
+
+    def _analyze_entry(self, entry: ResizeEntry, *, on_update=None):
+        measure_gain = self.config.normalized_volume and entry.needs_encode
+        thumbnail_size = self.thumbnail_size
+
+        # ピークゲインの取得で全体を読む場合のみ、1回の ffmpeg でまとめて解析する
+        if entry.media_info is None and measure_gain and self.config.single_pass_analysis \
+                and not self.use_numpy_audio:
+            def _on_thumbnail(size: Tuple[int, int], data: bytes):
+                # ピークゲインの解析 (全体のデコード) を待たずにポップアップへ表示する
+                self.thumbnail_cache.put(entry.source, size, data)
+                self.set_thumbnail(entry, size, data)
+                if on_update:
+                    on_update()
+
+            entry.media_info = analyze_media(
+                self.config.ffmpeg_command, entry.source, thumbnail_size=thumbnail_size,
+                on_started=self.governor.apply, on_thumbnail=_on_thumbnail,
+            )
+            if entry.media_info is None:
+                return
+
+            if entry.media_info.thumbnail:
+                _on_thumbnail(*entry.media_info.thumbnail)
+                entry.media_info.thumbnail = None
+            return
+
+        if entry.media_info is None:
+            json_info = self.get_media_info(entry.source)
+            if not json_info:
+                return
+            entry.media_info = MediaInfo(**json_info)
+
+        if thumbnail_size and entry.thumbnail_cache is None:
+            data = self.get_thumbnail_data(entry.source, int(entry.media_info.duration * .25), thumbnail_size)
+            if data is not None:
+                self.set_thumbnail(entry, thumbnail_size, data)
+            if on_update:
+                on_update()
+
+        if measure_gain and entry.media_info.peak_gain is None:
+            log.debug("peak gain ...")
+            if self.use_numpy_audio:
+                self.measure_audio(entry.source, entry.media_info)
+            else:
+                entry.media_info.peak_gain = self.get_peak_gain(entry.source)
+
+    def prefetch_entries(self):
+        """待機中の先頭エントリを、エンコード中に1件ずつ先読み解析します"""
+        if self._prefetch_task is not None:
+            return
+
+        count = max(0, int(self.config.prefetch_entries or 0))
+        if self.is_deferred:
+            count = len(self.entries)  # アイドル待ちの間に、すべてのエントリを解析しておく
+        with self.lock:
+            targets = [e for e in self.entries.peek(count) if not e.analyzed]
+
+        if not targets:
+            return
+
+        entry = targets[0]
+
+        def _prefetch():
+            log.debug(f"prefetch: {entry!r}")
+            try:
+                self.analyze_entry(entry)
+            except (Exception,):
+                log.warning(f"exception in prefetch (ignored): {entry!r}", exc_info=True)
+
+        def _done(_):
+            self._prefetch_task = None
+            if self.is_deferred:
+                self.call_main_thread(self.update_entries)  # 待機中の一覧に再生時間を表示する
+            self.prefetch_entries()
+
+        self._prefetch_task = self.start_background(_prefetch, _done)
+
+    def _on_finished(self, entry: ResizeEntry):
+        """処理が完了したエントリ。メインスレッドで呼ばれます"""
+        self.clear_suspended(entry)
+        self.next_entry()
+
+    def _on_failed(self, entry: ResizeEntry, message: Optional[PopupMessage]):
+        """
+        エラーで処理を終了したエントリのワーカーを解放します。バックグラウンドスレッドから呼び出し可能
+        """
+        self.clear_suspended(entry)
+        entry.failed = True
+        entry.encode_progress = None
+        self.set_job_state(entry, JobState.FAILED, reason=message.title if message else None)
+        self.call_main_thread(self.remove_entry, entry)
+
+    def remove_entry(self, entry: ResizeEntry):
+        self.clear_suspended(entry)
+        with self.lock:
+            self.entries.remove(entry)  # 処理を始める前のエントリ
+            try:
+                self.active_entries.remove(entry)
+            except ValueError:
+                pass
+            if entry.file_key is not None and self._active_keys.get(entry.file_key) is entry:
+                del self._active_keys[entry.file_key]
+
+            entry.thumbnail_cache = None
+
+        self.next_entry()
+
+    def next_entry(self):
+        with self.lock:
+            if self.is_paused_menu:
+                log.debug("next_entry -> ignored by pause")
+            elif self.governor.busy:
+                log.debug("next_entry -> ignored by system load")
+            elif self.is_deferred:
+                log.debug("next_entry -> deferred until idle")
+            else:
+                # 一時停止したエントリは、一時ファイルやパスログを持っているため待機中のエントリより先に再開する
+                for suspended in sorted(self.suspended_entries, key=lambda e: e.queue_priority or (0., 0.)):
+                    if not self.has_free_worker:
+                        break
+                    if self.is_preempted(suspended):
+                        continue
+                    self.resume_entry(suspended)
+
+                popped = False
+                while self.entries and self.has_free_worker:
+                    entry = self.entries.pop()
+                    if not self.process(entry):
+                        # 開始できなければ残しておく (追加時刻は entry.queued_at のまま)
+                        self.entries.push(entry, entry.queue_priority or (0., 0.))
+                        break
+                    self.entries.record_wait(entry)
+                    popped = True
+
+                if popped and not self.entries:
+                    log.info(f"queue drained ({self.config.queue_policy}): wait {self.entries.wait_report()}")
+
+        if not self.entries and not self.active_entries:
+            self.media_cache.flush()  # すべて処理し終えた時点でまとめて保存する
+
+        self.prefetch_entries()
+        self.update_entries()
+
+    def skip_entry(self, entry: Optional[ResizeEntry]):
+        if entry is None:
+            return
+
+        with self.lock:
+            dequeued = self.entries.remove(entry)
+        if dequeued:
+            log.info(f"dequeued: {entry!r}")
+            entry.skipped = True
+            self.set_job_state(entry, JobState.SKIPPED)
+            self.update_entries()
+            return
+
+        if entry.is_encoding:
+            log.info(f"ffmpeg canceling... {entry!r}")
+            entry.skipped = True
+            self.resume_entry(entry)  # 停止したままでは終了の入力を受け付けない
+            self.quit_processes(entry)
+            log.info("send Quit")
+
+    @staticmethod
+    def quit_processes(entry: ResizeEntry):
+        for process in list(entry.processes):
+            if process.returncode is None:
+                try:
+                    process.stdin.write(b"q")
+                    process.stdin.flush()
+                except (OSError, ValueError):
+                    pass
+
+    @staticmethod
+    def kill_processes(entry: ResizeEntry):
+        """終了の入力を待たずに強制終了します (一時停止中のプロセスも終了できます)"""
+        for process in list(entry.processes):
+            if process.returncode is None:
+                try:
+                    process.kill()
+                except OSError:
+                    pass
+
+    @property
+    def running_entries(self) -> List[ResizeEntry]:
+        return [e for e in self.active_entries if e.is_processing and not e.suspended]
+
+    @property
+    def suspended_entries(self) -> List[ResizeEntry]:
+        return [e for e in self.active_entries if e.suspended]
+
+    @property
+    def has_free_worker(self) -> bool:
+        return len(self.running_entries) < max(1, int(self.config.max_workers or 1))
+
+    def pause_menu(self, *, paused: bool) -> bool:
+        if self._pause_menu == paused:
+            return True
+
+        if paused:
+            if not self.active_entries:
+                self._pause_menu = True
+                return True
+        else:
+            self._pause_menu = False
+            self.call_main_thread(self.next_entry)
+            return True
+        return False
+
+    @property
+    def is_paused_menu(self):
+        return self._pause_menu
+
+    # frontend
+
+    def call_main_thread(self, func, *args, **kwargs):
+        """func をメインスレッド (イベントループ) で呼び出します"""
+        raise NotImplementedError
+
+    def start_background(self, task, done=None) -> BackgroundTask:
+        background = BackgroundTask(task, done or (lambda r: None), call_after=self.call_main_thread)
+        background.start()
+        return background
+
+    def update_entries(self):
+        """エントリの状態が変わったときに、メインスレッドで呼ばれます"""
+
+    def on_process_started(self, entry: ResizeEntry):
+        """エントリがワーカーに割り当てられたとき"""
+
+    def on_ffmpeg_unavailable(self):
+        log.error("ffmpeg / ffprobe is not available")
+
+    @property
+    def thumbnail_size(self) -> Optional[Tuple[int, int]]:
+        """サムネイルを作成する場合はそのサイズ"""
+        return None
+
+    def set_thumbnail(self, entry: ResizeEntry, size: Tuple[int, int], data: bytes):
+        """rgb24 のサムネイルをエントリに保存します"""
+
+    #
+
+    def check_filename(self, source: Path):
+        for regex in self.config.active_targets:
+            if regex.search(source.name):
+                break
+        else:
+            return False
+
+        for regex in self.config.active_ignores:
+            if regex.search(source.name):
+                return False
+
+        return True
+
+    def calc_bit_rate(self, duration: float, adjust: float, audio_rate: int):
+        return self.config.size_limit * 1000 / duration / 128 * adjust - audio_rate
+
+    def apply_encode_params(self, entry: ResizeEntry):
+        if entry.media_info is None:
+            raise ValueError("media_info is None!")
+
+        info = entry.media_info
+
+        demand = self.get_bit_demand(info)
+        tier = self.select_preset(info.duration, demand)
+        entry.preset_name = tier.name
+        entry.width = tier.width
+        entry.height = tier.height
+        entry.frames = tier.get_frames(info.frame_rate)
+        entry.encoder_params = tier.encoder_params
+        entry.video_codec = tier.video_codec
+        entry.ext = tier.ext
+        entry.audio_codec = tier.audio_codec
+        entry.audio_bit_rate = tier.audio_bit_rate
+        entry.size_adjust = entry.size_adjust_first = tier.size_adjust
+        entry.bit_rate = self.calc_bit_rate(info.duration, tier.size_adjust / 100, tier.audio_bit_rate)
+
+        if self.config.calibration:
+            self.apply_calibration(entry)
+
+        if demand != 1. and self.config.complexity_size_adjust:
+            self.apply_complexity_adjust(entry, demand)
+
+        if self.config.adaptive_resolution:
+            self.apply_adaptive_scale(entry, tier, demand)
+
+        if self.config.normalized_volume and info.peak_gain is not None:
+            limit_db = self.config.volume_normalize_limit_db
+            gain = self.config.volume_db - info.peak_gain
+            if self.config.volume_loudness_target and info.loudness is not None:
+                # 十分に大きい音声は、ピークに余裕があってもラウドネスの目標値までしか上げない
+                gain = min(gain, self.config.volume_loudness_target - info.loudness)
+            gain = max(-limit_db, min(limit_db, gain))
+
+            if abs(gain) >= 2.5:
+                entry.fix_gain = gain
+
+    def apply_adaptive_scale(self, entry: ResizeEntry, tier: PresetTier, demand: float = 1.):
+        """
+        映像ビットレートから、画質の下限を保てる最大の解像度とフレームレートを選びます
+
+        段階の解像度とフレームレートを上限とし、それより下げる場合だけ entry を書き換えます
+        :param demand: 映像の複雑さによる bpp の下限の倍率
+        """
+        info = entry.media_info
+        source_width, source_height = info.scale_wh
+        if source_width <= 0 or source_height <= 0:
+            return
+
+        # 段階の指定による出力の高さとフレームレート
+        if tier.height > 0:
+            tier_height = tier.height
+        elif tier.width > 0:
+            tier_height = round(source_height * tier.width / source_width)
+        else:
+            tier_height = source_height
+        tier_height = min(tier_height, source_height)
+        tier_fps = float(entry.frames or info.frame_rate or 30.)
+
+        bpp_floor = (tier.bpp_floor or float(self.config.bpp_floor)) * demand
+        rung = select_ladder_rung(
+            entry.bit_rate, info.scale_wh, info.frame_rate,
+            heights=self.config.resolution_ladder or [], fps_ladder=self.config.fps_ladder or [],
+            bpp_floor=bpp_floor, fps_floor=float(self.config.fps_floor or 0),
+            max_height=tier_height, max_fps=tier_fps,
+        )
+        if rung is None:
+            return
+
+        width, height, fps, bpp = rung
+        if height >= tier_height and fps >= tier_fps:
+            return  # 段階の指定のままで下限を保てる
+
+        entry.width = 0
+        entry.height = 0 if height == source_height else height
+        entry.frames = 0 if fps == (info.frame_rate or 30.) else round(fps, 3)  # 29.97 などを切り捨てない
+        log.info(f"adaptive scale: {source_width}x{source_height}@{info.frame_rate} -> {width}x{height}@{fps} "
+                 f"(bpp={round(bpp, 4)}, floor={round(bpp_floor, 4)})")
+
+    def select_preset(self, duration: float, demand: float = 1.) -> PresetTier:
+        """
+        制限サイズに収まる映像ビットレート (音声 96kbps を除く) から、プリセットの段階を選びます
+
+        :param demand: 映像の複雑さによる、必要なビットレートの倍率。複雑な映像ほど低いビットレートとして選びます
+        """
+        rate = self.config.size_limit * 1000 / duration / 128 - 96
+        return self.config.active_presets.select(rate / demand)
+
+    def get_bit_demand(self, info: MediaInfo) -> float:
+        """映像の複雑さによる、必要なビットレートの倍率。未解析なら 1"""
+        if info.spatial_complexity is None or not self.config.complexity_analysis:
+            return 1.
+        return complexity.bit_demand(info.spatial_complexity, info.temporal_complexity or 0.)
+
+    def apply_complexity_adjust(self, entry: ResizeEntry, demand: float):
+        """
+        複雑な映像は目標サイズを超えやすく、静止した映像は下回りやすいため、size_adjust を補正します
+
+        demand が 2 (1/2) で complexity_size_adjust % 下げ (上げ) ます
+        """
+        info = entry.media_info
+        percent = -math.log2(demand) * float(self.config.complexity_size_adjust)
+        adjust = entry.size_adjust * (1 + percent / 100)
+
+        log.info(f"complexity size_adjust: {round(entry.size_adjust, 2)}% -> {round(adjust, 2)}% "
+                 f"(spatial={info.spatial_complexity}, temporal={info.temporal_complexity}, "
+                 f"demand={round(demand, 2)})")
+        if entry.size_adjust_preset is None:
+            entry.size_adjust_preset = entry.size_adjust
+        entry.size_adjust = entry.size_adjust_first = adjust
+        entry.bit_rate = self.calc_bit_rate(info.duration, adjust / 100, entry.audio_bit_rate)
+
+    def get_expected_encode_mode(self, entry: ResizeEntry) -> str:
+        """encode() で選ばれるはずのモード (キーフレームを調べないので分割は推定)"""
+        if self.config.segment_encode and entry.media_info.duration >= self.config.segment_min_duration:
+            return "segment"
+        elif self.use_two_pass(entry):
+            return "2pass"
+        return "1pass"
+
+    def use_two_pass(self, entry: ResizeEntry) -> bool:
+        """
+        2パスでエンコードするか
+
+        リアルタイム指定 (-deadline realtime) のパラメータでは、最終パスでその指定が使われず、
+        解析のパスも加わって大幅に遅くなるため1パスにします
+        """
+        if not self.config.two_pass_encode or entry.video_codec not in TWO_PASS_CODECS:
+            return False
+        return not REALTIME_PARAMS.search(entry.encoder_params or "")
+
+    def apply_calibration(self, entry: ResizeEntry):
+        info = entry.media_info
+        adjust = self.encode_history.predict_size_adjust(
+            entry.preset_name, self.get_expected_encode_mode(entry), info.duration,
+            fill=float(self.config.calibration_fill),
+            min_samples=max(1, int(self.config.calibration_min_samples)),
+        )
+        if adjust is None:
+            return
+
+        log.info(f"calibrated size_adjust: {entry.size_adjust}% -> {round(adjust, 2)}%")
+        entry.size_adjust_preset = entry.size_adjust
+        entry.size_adjust = entry.size_adjust_first = adjust
+        entry.bit_rate = self.calc_bit_rate(info.duration, adjust / 100, entry.audio_bit_rate)
+        entry.calibrated = True
+
+    def apply_sample_prediction(self, entry: ResizeEntry, mode: str):
+        """
+        本番のエンコードの前に、短い区間を同じ設定で試しにエンコードして映像ビットレートを予測し、size_adjust を補正します
+
+        補正後は calibration_fill % のサイズを狙います。区間の数が少ない短い動画では何もしません。
+        1パス (分割を含む) は minrate = maxrate の固定ビットレートで、試しても指定どおりの値になるため何もしません。
+        2パスでも品質の指定 (-crf など) が無ければ、平均ビットレートが指定どおりになるよう制御されるため何もしません
+
+        :param mode: encode() で決まったモード (2pass / 1pass / segment)
+        """
+        if mode != "2pass":
+            log.info(f"sample prediction skipped: {mode} encodes at a constant bit rate")
+            return
+        if not QUALITY_PARAMS.search(entry.encoder_params or ""):
+            log.info("sample prediction skipped: 2pass without a quality target (-crf) encodes at the average bit rate")
+            return
+
+        info = entry.media_info
+        count = int(self.config.sample_predict_count)
+        seconds = float(self.config.sample_predict_seconds)
+        if info.duration < count * seconds * 2:
+            log.info(f"sample prediction skipped: {round(info.duration, 1)}s is shorter than "
+                     f"{count} x {seconds}s x 2")
+            return
+        excerpts = plan_excerpts(info.duration, count, seconds)
+        if not excerpts:
+            return
+
+        def _commands(segment: Tuple[float, float], output: Path, passlog: Path) -> List[List[str]]:
+            return [self.build_encode_args(entry, output, pass_no=1, passlog=passlog, segment=segment),
+                    self.build_encode_args(entry, output, pass_no=2, passlog=passlog, segment=segment)]
+
+        def _on_started(p: subprocess.Popen):
+            with entry.process_lock:
+                entry.processes.append(p)
+                self.governor.apply(p)
+                if entry.stopped:
+                    p.kill()
+                elif entry.suspended:
+                    suspend_process(p)
+
+        start = time.perf_counter()
+        suspended_seconds = entry.suspended_seconds
+        try:
+            prediction = predict_video_rate(
+                _commands, excerpts, entry.ext,
+                workers=max(0, int(self.config.sample_predict_workers or 0)), work_dir=entry.work_dir,
+                on_started=_on_started,
+                lease_threads=lambda fanout: self.lease_entry_threads(entry, fanout),
+                release_threads=lambda threads: self.release_entry_threads(entry, threads),
+            )
+        except (Exception,):
+            log.warning("exception in sample prediction (ignored)", exc_info=True)
+            return
+        finally:
+            elapsed = time.perf_counter() - start - (entry.suspended_seconds - suspended_seconds)
+            entry.telemetry.add_step("sample", elapsed)
+
+        if prediction is None or entry.skipped or entry.stopped:
+            return
+
+        ratio = entry.sample_ratio = prediction.video_rate / entry.bit_rate
+        target = self.calc_bit_rate(info.duration, float(self.config.calibration_fill) / 100, entry.audio_bit_rate)
+        adjust = (target / ratio + entry.audio_bit_rate) * info.duration * 128 / (self.config.size_limit * 1000) * 100
+        limit = float(self.config.sample_predict_max_correction) / 100
+        adjust = max(entry.size_adjust * (1 - limit), min(entry.size_adjust * (1 + limit), adjust))
+
+        log.info(f"sample prediction: {round(prediction.video_rate, 2)} kbps for {round(entry.bit_rate, 2)} kbps "
+                 f"(ratio {round(ratio, 3)}, {prediction.excerpts} excerpts, {round(prediction.seconds, 2)}s), "
+                 f"size_adjust {round(entry.size_adjust, 2)}% -> {round(adjust, 2)}%")
+        if entry.size_adjust_preset is None:
+            entry.size_adjust_preset = entry.size_adjust
+        entry.size_adjust = entry.size_adjust_first = adjust
+        entry.bit_rate = self.calc_bit_rate(info.duration, adjust / 100, entry.audio_bit_rate)
+
+    # noinspection PyMethodMayBeStatic
+    def finish_script(self, entry: ResizeEntry):
+        if entry.order_options & OrderOption.DELETE_SOURCE_WHEN_COMPLETE:
+            entry.delete_source_file()
+
+    # ffmpeg
+
+    def check_ffmpeg(self):
+        commands = (self.config.ffmpeg_command, self.config.ffprobe_command)
+        if self._checked_ffmpeg == commands:
+            return True
+
+        try:
+            if subprocess.Popen(
+                [self.config.ffmpeg_command, "-version"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                startupinfo=subprocess_startup_info()
+            ).wait() != 0:
+                return False
+
+            if subprocess.Popen(
+                [self.config.ffprobe_command, "-version"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                startupinfo=subprocess_startup_info()
+            ).wait() != 0:
+                return False
+
+            self._checked_ffmpeg = commands
+            return True
+
+        except (Exception,):
+            return False
+
+    def get_media_info(self, path: Path):
+        p = subprocess.Popen(
+            [self.config.ffprobe_command, "-v", "quiet", "-print_format", "json", "-show_streams", str(path)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            startupinfo=subprocess_startup_info()
+        )
+        self.governor.apply(p)
+        return_code = p.wait()
+        if return_code != 0:
+            log.error(f"get_media_info() returned {return_code} code!")
+            lines = []
+            for line in p.stdout:
+                line = line.decode(errors='ignore').rstrip()
+                log.debug(f" > {line}")
+                lines.append(line)
+
+            lines = "\n".join(lines)
+            raise ProcessCodeError(p, lines)
+
+        for stream in json.load(p.stdout)["streams"]:
+            if stream.get("codec_type") == "video":
+                log.debug(f"get_media_info: {stream}")
+
+                if stream.get("codec_name") == "vp9":
+                    m = re.search(r"^(\d{2}):(\d{2}):(\d{2})\.(\d*)$", stream.get("tags", {}).get("DURATION", ""))
+                    if m:
+                        duration = int(m.group(1)) * 60 * 60
+                        duration += int(m.group(2)) * 60
+                        duration += int(m.group(3))
+                        stream["duration"] = duration
+
+                return stream
+
+    def get_thumbnail_data(self, path: Path, location: int, size: Tuple[int, int]) -> Optional[bytes]:
+        data = self.thumbnail_cache.get(path, size)
+        if data is not None:
+            log.debug(f"thumbnail cache hit: {path.name}")
+            return data
+
+        frame_size = size[0] * size[1] * 3
+        try:
+            p = subprocess.Popen(
+                [self.config.ffmpeg_command, "-v", "quiet", "-ss", str(location), "-i", str(path),
+                 "-vframes", "1", "-s", f"{size[0]}x{size[1]}",
+                 "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                stdin=subprocess.DEVNULL,
+                startupinfo=subprocess_startup_info()
+            )
+            self.governor.apply(p)
+            data = p.stdout.read(frame_size)
+            p.wait()
+
+            if len(data) == frame_size:
+                self.thumbnail_cache.put(path, size, data)
+                return data
+        except (Exception,):
+            log.warning("exception in get_thumbnail (ignored)")
+
+    @property
+    def use_numpy_audio(self) -> bool:
+        if self.config.audio_analysis not in ("numpy", "numpy_sampled"):
+            return False
+        if not audio.is_available():
+            log.warning("numpy audio analysis is disabled! (numpy modules not installed)")
+            return False
+        return True
+
+    @property
+    def use_complexity_analysis(self) -> bool:
+        if not self.config.complexity_analysis:
+            return False
+        if not complexity.is_available():
+            log.warning("complexity analysis is disabled! (numpy modules not installed)")
+            return False
+        return True
+
+    def measure_complexity(self, path: Path, media_info: MediaInfo):
+        try:
+            stats = complexity.analyze_complexity(
+                self.config.ffmpeg_command, path, duration=media_info.duration,
+                samples=max(1, int(self.config.complexity_samples)), on_started=self.governor.apply,
+            )
+        except (Exception,):
+            log.warning("exception in complexity analysis (ignored)", exc_info=True)
+            return
+
+        if stats:
+            log.info(f"complexity: spatial={stats.spatial} temporal={stats.temporal} "
+                     f"({stats.samples} samples, {round(stats.seconds, 2)}s)")
+            media_info.spatial_complexity = stats.spatial
+            media_info.temporal_complexity = stats.temporal
+
+    def measure_audio(self, path: Path, media_info: MediaInfo):
+        sampled = self.config.audio_analysis == "numpy_sampled"
+        try:
+            stats = audio.analyze_audio(
+                self.config.ffmpeg_command, path, duration=media_info.duration,
+                sample_windows=int(self.config.audio_sample_windows) if sampled else 0,
+                window_seconds=float(self.config.audio_window_seconds),
+                on_started=self.governor.apply,
+            )
+        except (Exception,):
+            log.warning("exception in audio analysis (ignored)", exc_info=True)
+            return
+
+        if stats:
+            media_info.peak_gain = stats.peak_db
+            media_info.rms_db = stats.rms_db
+            media_info.loudness = stats.loudness
+
+    def get_peak_gain(self, path: Path):
+        log.debug("start gain detect")
+        try:
+            p = subprocess.Popen(
+                [self.config.ffmpeg_command, "-hide_banner", "-i", str(path),
+                 "-af", "volumedetect", "-vn", "-sn", "-dn", "-f", "null", "/dev/null"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                startupinfo=subprocess_startup_info()
+            )
+            self.governor.apply(p)
+            reg = re.compile(r"max_volume: (-?\d+\.\d*) dB")
+            for line in p.stderr:
+                line = line.decode(errors="ignore").rstrip()
+                log.debug(f" > {line}")
+                m = reg.search(line)
+                if m:
+                    return float(m.group(1))
+        except (Exception,):
+            log.warning("exception in gain detect (ignored)", exc_info=True)
+
+    def get_output_path(self, entry: ResizeEntry) -> Path:
+        output = Path(self.config.output_directory)
+
+        if entry.custom_outname:
+            output = output / Path(entry.custom_outname + "." + entry.ext)
+            output.parent.mkdir(parents=True, exist_ok=True)
+
+        else:
+            output.mkdir(parents=True, exist_ok=True)
+
+            if output.resolve() != Path(self.config.input_directory).resolve():
+                output = Path(output / entry.source.name).with_suffix("." + entry.ext)
+            else:
+                try:
+                    _filename = self.config.rename_format.format(name=entry.source.stem, ext=entry.ext)
+                except KeyError as e:
+                    log.warning(f"rename format error: {e}")
+                    _filename = "{name}_resized.{ext}".format(name=entry.source.stem, ext=entry.ext)
+
+                output = Path(output / _filename)
+
+        return output
+
+    def build_encode_args(self, entry: ResizeEntry, output: Path, *,
+                          pass_no: int = 0, passlog: Optional[Path] = None,
+                          segment: Optional[Tuple[float, float]] = None, bit_rate: float = None) -> List[str]:
+        """
+        :param pass_no: 0 なら1パス (固定ビットレート)、1, 2 なら2パスエンコードの各パス
+        :param segment: 分割エンコードの区間 (開始秒, 終了秒)。音声は含まない
+        :param bit_rate: 映像ビットレート。省略時は entry.bit_rate
+        """
+        video_rate = f"{round(entry.bit_rate if bit_rate is None else bit_rate, 2)}k"
+        command_args = [self.config.ffmpeg_command, "-hide_banner", "-progress", "pipe:1"]
+        if segment:
+            start, end = segment
+            command_args.extend(["-ss", f"{start:.6f}", "-i", str(entry.source), "-t", f"{end - start:.6f}", "-an"])
+        else:
+            command_args.extend(["-i", str(entry.source)])
+
+        if entry.audio_codec and pass_no != 1 and not segment:
+            audio_rate = f"{entry.audio_bit_rate}k"
+            command_args.extend(["-c:a", entry.audio_codec,
+                                 "-b:a", audio_rate, "-minrate:a", audio_rate, "-maxrate:a", audio_rate, "-ac", "2"])
+            if entry.fix_gain:
+                command_args.extend(["-af", f"volume={entry.fix_gain}dB"])
+
+        command_args.extend([
+            "-c:v", entry.video_codec,
+            "-b:v", video_rate,
+        ])
+        if not pass_no:
+            command_args.extend([
+                "-minrate:v", video_rate,
+                "-maxrate:v", video_rate,
+            ])
+
+        filters = []
+        if entry.width or entry.height:
+            width = entry.width if entry.width >= 1 else -2
+            height = entry.height if entry.height >= 1 else -2
+            filters.append(f"scale={width}:{height}")
+        if entry.frames:
+            filters.append(f"fps={entry.frames}")
+
+        if filters:
+            command_args.extend(["-vf", ",".join(filters)])
+
+        if entry.encoder_params:
+            command_args.extend(shlex.split(entry.encoder_params))
+
+        if pass_no:
+            command_args.extend(["-pass", str(pass_no), "-passlogfile", str(passlog)])
+
+        if pass_no == 1:
+            command_args.extend(["-an", "-f", "null", "-"])
+        else:
+            command_args.extend(["-y", str(output)])
+        return command_args
+
+    def build_audio_args(self, entry: ResizeEntry, output: Path) -> List[str]:
+        """分割エンコード用に、音声だけをエンコードするコマンド"""
+        audio_rate = f"{entry.audio_bit_rate}k"
+        command_args = [self.config.ffmpeg_command, "-hide_banner", "-progress", "pipe:1",
+                        "-i", str(entry.source), "-vn", "-sn", "-dn",
+                        "-c:a", entry.audio_codec,
+                        "-b:a", audio_rate, "-minrate:a", audio_rate, "-maxrate:a", audio_rate, "-ac", "2"]
+        if entry.fix_gain:
+            command_args.extend(["-af", f"volume={entry.fix_gain}dB"])
+        command_args.extend(["-y", str(output)])
+        return command_args
+
+    def lease_entry_threads(self, entry: ResizeEntry, fanout: int = 1) -> int:
+        """エントリのプロセス1つ分のスレッド数を割り当てます。一時停止中は再開するまで数えません"""
+        with entry.process_lock:
+            threads = self.governor.lease_threads(fanout)
+            entry.thread_leases.append(threads)
+            if entry.suspended:
+                self.governor.release_threads(threads)
+        return threads
+
+    def release_entry_threads(self, entry: ResizeEntry, threads: int):
+        with entry.process_lock:
+            if threads not in entry.thread_leases:
+                return
+            entry.thread_leases.remove(threads)
+            if not entry.suspended:
+                self.governor.release_threads(threads)
+
+    def run_encoder(self, entry: ResizeEntry, command_args: List[str], *, label: Optional[str] = "encode",
+                    progress_range: Tuple[float, float] = (0., 1.), track_size=True,
+                    projector: Optional[SizeProjector] = None,
+                    on_progress: Optional[Callable[[float, float], None]] = None,
+                    fanout: int = 1) -> Tuple[int, List[str]]:
+        """
+        ffmpeg を実行し、-progress の出力からエントリの進捗とサイズを更新します
+
+        projector が指定されていれば、最終サイズが制限を超えると予測された時点でプロセスを中断します。
+        on_progress が指定されていれば、エントリを直接更新せずに (出力時間 秒, サイズ KB) を渡します。
+        label が None なら記録 (telemetry) に残しません
+
+        :param fanout: このエントリで同時に実行するプロセス数 (スレッド数の割り当て用)
+        :return: (終了コード, 出力行)
+        """
+        time_reg = re.compile(r"out_time_ms=(\d+)")
+        size_reg = re.compile(r"total_size=(\d+)")
+        progress_start, progress_end = progress_range
+
+        stdout = []
+        entry.resume_event.wait()  # 一時停止中は次のパスを開始しない
+        if entry.stopped:
+            return -1, []  # 一時停止したまま終了したエントリ
+        start = time.perf_counter()
+        suspended_seconds = entry.suspended_seconds
+        ratio = out_time = size_kb = 0.
+
+        threads = self.lease_entry_threads(entry, fanout)
+        if threads:
+            # -threads は出力ファイルの前に置く出力オプション
+            command_args = command_args[:-1] + ["-threads", str(threads)] + command_args[-1:]
+        log.debug(f"{label} command_line: '%s'", "' '".join(command_args))
+
+        try:
+            with entry.process_lock:
+                p = subprocess.Popen(
+                    command_args,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    stdin=subprocess.PIPE,
+                    startupinfo=subprocess_startup_info()
+                )
+                entry.processes.append(p)
+                self.governor.apply(p)
+                if entry.suspended:
+                    suspend_process(p)
+        except BaseException:
+            self.release_entry_threads(entry, threads)
+            raise
+
+        try:
+            for line in p.stdout:
+                line = line.decode(errors="ignore").rstrip()
+                stdout.append(line)
+                log.debug(f" > {line}")
+
+                m = time_reg.search(line)
+                if m:
+                    out_time = int(m.group(1)) / 1000000
+                    ratio = out_time / entry.media_info.duration
+                    if on_progress is None:
+                        entry.encode_progress = progress_start + (progress_end - progress_start) * ratio
+
+                m = size_reg.search(line)
+                if m:
+                    size_kb = int(m.group(1)) / 1024
+                    if on_progress is None and track_size:
+                        entry.resized_size = size_kb
+
+                if line.lower() == "progress=continue":
+                    if on_progress:
+                        on_progress(out_time, size_kb)
+                    self.call_main_thread(self.update_entries)
+
+                    if projector and (projector.update(ratio, size_kb) or projector.cancelled) \
+                            and projector.should_abort():
+                        projector.aborted = True
+                        if projector.cancelled:
+                            log.info(f"CANCEL: at {round(ratio * 100, 1)}% ({round(size_kb, 1)} KB)")
+                        else:
+                            log.warning(f"ABORT: projected {round(projector.projected)} KB > {projector.size_limit} KB "
+                                        f"at {round(ratio * 100, 1)}% ({round(size_kb, 1)} KB)")
+                        p.kill()
+
+        finally:
+            return_code = p.wait()
+            self.release_entry_threads(entry, threads)
+            if label:
+                elapsed = time.perf_counter() - start - (entry.suspended_seconds - suspended_seconds)
+                entry.telemetry.add_step(label + ("(aborted)" if projector and projector.aborted else ""),
+                                         elapsed, entry.resized_size if track_size else None)
+
+        return return_code, stdout
+
+    def plan_encode_segments(self, entry: ResizeEntry) -> List[Tuple[float, float]]:
+        if not self.config.segment_encode or entry.media_info.duration < self.config.segment_min_duration:
+            return []
+
+        try:
+            keyframes = get_keyframe_times(self.config.ffprobe_command, entry.source, on_started=self.governor.apply)
+        except (Exception,):
+            log.warning("exception in get_keyframe_times (segment encode disabled)", exc_info=True)
+            return []
+
+        segments = plan_segments(keyframes, entry.media_info.duration, max(2, int(self.config.segment_count)))
+        log.debug(f"encode segments: {[(round(a, 2), round(b, 2)) for a, b in segments]}")
+        return segments
+
+    def run_segmented_encoder(self, entry: ResizeEntry, output: Path,
+                              segments: List[Tuple[float, float]]) -> Tuple[int, List[str]]:
+        """
+        区間ごとに映像を並列エンコードし、別途エンコードした音声と無劣化で結合します
+
+        各区間は同じビットレート、つまり区間の長さに比例したサイズ配分でエンコードされます
+        """
+        work_dir = Path(tempfile.mkdtemp(prefix="replayresizer_", dir=entry.work_dir))
+        start = time.perf_counter()
+        suspended_seconds = entry.suspended_seconds
+        states = [(0., 0.)] * len(segments)  # type: List[Tuple[float, float]]  # (出力時間 秒, サイズ KB)
+        lock = threading.Lock()
+
+        def _on_progress(index: int):
+            def _update(out_time: float, size_kb: float):
+                with lock:
+                    states[index] = (out_time, size_kb)
+                    entry.encode_progress = sum(t for t, _ in states) / entry.media_info.duration
+                    entry.resized_size = sum(s for _, s in states)
+            return _update
+
+        segment_files = [work_dir / f"segment_{index:03}.{entry.ext}" for index in range(len(segments))]
+        audio_file = work_dir / f"audio.{entry.ext}" if entry.audio_codec else None
+        result = None  # type: Optional[Tuple[int, List[str]]]
+
+        workers = max(1, int(self.config.segment_workers))
+        fanout = min(workers, len(segments) + (1 if audio_file else 0))
+        aborted = threading.Event()
+
+        def _run(command_args: List[str], on_progress) -> Tuple[int, List[str]]:
+            if aborted.is_set():
+                return 0, []  # 他の区間の失敗で中止
+            return self.run_encoder(entry, command_args, label=None, on_progress=on_progress, fanout=fanout)
+
+        def _abort(kill: bool):
+            aborted.set()
+            for _future in futures:
+                _future.cancel()
+            # プールを抜ける前に他の区間を終了させる (終了を待つため)
+            if kill:
+                self.kill_processes(entry)
+            else:
+                self.quit_processes(entry)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(_run, self.build_encode_args(entry, file, segment=segment), _on_progress(index))
+                    for index, (segment, file) in enumerate(zip(segments, segment_files))
+                ]
+                if audio_file:
+                    futures.append(pool.submit(_run, self.build_audio_args(entry, audio_file), lambda *_: None))
+
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    try:
+                        return_code, stdout = future.result()
+                    except BaseException:
+                        _abort(kill=True)
+                        raise
+                    if return_code != 0 and result is None:
+                        result = return_code, stdout
+                        _abort(kill=False)
+
+            if result is not None or entry.skipped:
+                return result or (0, [])
+
+            list_file = work_dir / "segments.txt"
+            write_concat_list(segment_files, list_file)
+
+            command_args = [self.config.ffmpeg_command, "-hide_banner", "-progress", "pipe:1",
+                            "-f", "concat", "-safe", "0", "-i", str(list_file)]
+            if audio_file:
+                command_args.extend(["-i", str(audio_file), "-map", "0:v:0", "-map", "1:a:0"])
+            command_args.extend(["-c", "copy", "-y", str(output)])
+
+            return self.run_encoder(entry, command_args, label=None, on_progress=lambda *_: None)
+
+        except BaseException:
+            self.quit_processes(entry)
+            raise
+
+        finally:
+            elapsed = time.perf_counter() - start - (entry.suspended_seconds - suspended_seconds)
+            entry.telemetry.add_step(f"segments({len(segments)})", elapsed, entry.resized_size)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def run_speculative_encoder(self, entry: ResizeEntry, output: Path, passlog: Optional[Path],
+                                progress_range: Tuple[float, float]) -> Optional[Tuple[int, List[str]]]:
+        """
+        size_adjust をずらした複数のビットレートで同時にエンコードし、制限に収まる最大の出力を output に移動します
+
+        制限を超えると予測された時点で、そのビットレート以上のエンコードを中断し、
+        制限に収まって完了した時点で、それより低いビットレートのエンコードを中断します。
+        2パスの場合は、完了済みの1パス目の解析結果 (passlog) をエンコードごとに複製して使います
+
+        :return: 制限に収まる出力が無ければ None (再試行用に entry.size_adjust を更新します)
+        """
+        adjust = entry.size_adjust
+        spread = float(self.config.speculative_spread) / 100
+        steps = (1, 0, -1) if int(self.config.speculative_variants) >= 3 else (0, -1)
+        adjusts = [adjust * (1 + spread * step) for step in steps]  # 降順
+        bit_rates = [self.calc_bit_rate(entry.media_info.duration, a / 100, entry.audio_bit_rate) for a in adjusts]
+        log.info(f"speculative encode: size_adjust {[round(a, 2) for a in adjusts]} "
+                 f"bit_rate {[round(b, 2) for b in bit_rates]}")
+
+        work_dir = Path(tempfile.mkdtemp(prefix="replayresizer_", dir=entry.work_dir))
+        start = time.perf_counter()
+        suspended_seconds = entry.suspended_seconds
+        progress_start, progress_end = progress_range
+        states = [(0., 0.)] * len(adjusts)  # type: List[Tuple[float, float]]  # (出力時間 秒, サイズ KB)
+        lock = threading.Lock()
+
+        projectors = [
+            SizeProjector(self.config.size_limit, min_progress=self.config.overshoot_min_progress,
+                          margin=self.config.overshoot_margin / 100)
+            for _ in adjusts
+        ]
+        files = [work_dir / f"variant_{index}.{entry.ext}" for index in range(len(adjusts))]
+        results = [None] * len(adjusts)  # type: List[Optional[Tuple[int, List[str]]]]
+        passlogs = [work_dir / f"variant_{index}_2pass" if passlog else None
+                    for index in range(len(adjusts))]  # type: List[Optional[Path]]
+
+        def _on_progress(index: int):
+            def _update(out_time: float, size_kb: float):
+                with lock:
+                    states[index] = (out_time, size_kb)
+                    live = [s for s, p in zip(states, projectors) if not p.aborted and not p.cancelled]
+                    if live:
+                        ratio = max(t for t, _ in live) / entry.media_info.duration
+                        entry.encode_progress = progress_start + (progress_end - progress_start) * ratio
+                        entry.resized_size = max(s for _, s in live)
+            return _update
+
+        def _run(index: int) -> Tuple[int, List[str]]:
+            command_args = self.build_encode_args(entry, files[index], pass_no=2 if passlog else 0,
+                                                  passlog=passlogs[index], bit_rate=bit_rates[index])
+            result = self.run_encoder(entry, command_args, label=None, projector=projectors[index],
+                                      on_progress=_on_progress(index), fanout=len(adjusts))
+            with lock:
+                if projectors[index].aborted and not projectors[index].cancelled:
+                    # 制限を超えるなら、それより高いビットレートも超える
+                    for projector in projectors[:index]:
+                        projector.cancel()
+                elif result[0] == 0 and not projectors[index].aborted \
+                        and get_file_size(files[index]) <= self.config.size_limit:
+                    for projector in projectors[index + 1:]:
+                        projector.cancel()
+            return result
+
+        try:
+            if passlog:
+                # 同じ passlog を複数の ffmpeg で同時に開かないようにする
+                for file in passlog.parent.glob(passlog.name + "-*"):
+                    suffix = file.name[len(passlog.name):]  # -0.log, -0.log.mbtree
+                    for variant_passlog in passlogs:
+                        shutil.copyfile(file, variant_passlog.with_name(variant_passlog.name + suffix))
+
+            with ThreadPoolExecutor(max_workers=len(adjusts)) as pool:
+                futures = {pool.submit(_run, index): index for index in range(len(adjusts))}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+
+            if entry.skipped:
+                return 0, []
+
+            best = None  # type: Optional[int]
+            best_size = 0.
+            for index, (result, projector, file) in enumerate(zip(results, projectors, files)):
+                if projector.aborted:
+                    continue
+                if result[0] != 0:
+                    return result
+                size = get_file_size(file)
+                log.info(f"speculative variant {round(adjusts[index], 2)}%: {round(size, 1)} KB")
+                if best_size < size <= self.config.size_limit:
+                    best, best_size = index, size
+
+            if best is None:
+                # 最も低いビットレートの結果 (中断したなら予測サイズ) から、再試行の size_adjust を決める
+                last = len(adjusts) - 1
+                size = projectors[last].projected if projectors[last].aborted else get_file_size(files[last])
+                new_adjust = adjusts[last] * self.config.size_limit / size * (1 - projectors[last].margin)
+                log.warning(f"no speculative variant fits, size_adjust -> {round(new_adjust, 2)}%")
+                entry.size_adjust = new_adjust
+                entry.bit_rate = self.calc_bit_rate(entry.media_info.duration, new_adjust / 100, entry.audio_bit_rate)
+                return None
+
+            shutil.move(str(files[best]), str(output))
+            entry.size_adjust = adjusts[best]
+            entry.bit_rate = bit_rates[best]
+            entry.resized_size = get_file_size(output)
+            entry.encode_progress = 1
+            self.call_main_thread(self.update_entries)
+            projectors[best].log_errors(entry.resized_size)
+            return results[best]
+
+        except BaseException:
+            self.quit_processes(entry)
+            raise
+
+        finally:
+            elapsed = time.perf_counter() - start - (entry.suspended_seconds - suspended_seconds)
+            entry.telemetry.add_step(f"speculative({len(adjusts)})", elapsed, entry.resized_size)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _encode_attempts(self, entry: ResizeEntry, output: Path, passlog: Optional[Path],
+                         segments: List[Tuple[float, float]]) -> Tuple[int, List[str]]:
+        """
+        サイズ超過時の再試行を含めてエンコードします
+
+        2パスの場合、1パス目の解析結果 (passlog) は再試行でもそのまま再利用します
+        """
+        retry = 0
+        while True:
+            # 2パスでは、再試行でも進捗の前半は1パス目の分
+            progress_range = (.5, 1.) if passlog else (0., 1.)
+
+            if passlog and not entry.telemetry.analyzed:
+                return_code, stdout = self.run_encoder(
+                    entry, self.build_encode_args(entry, output, pass_no=1, passlog=passlog),
+                    label="pass1", progress_range=(0., .5), track_size=False
+                )
+                if return_code != 0 or entry.skipped:
+                    return return_code, stdout
+
+                entry.telemetry.analyzed = True
+
+            projector = None
+            if self.config.overshoot_abort and retry < 2 and not segments:
+                projector = SizeProjector(
+                    self.config.size_limit,
+                    min_progress=self.config.overshoot_min_progress,
+                    margin=self.config.overshoot_margin / 100,
+                )
+
+            if segments:
+                return_code, stdout = self.run_segmented_encoder(entry, output, segments)
+            elif retry == 0 and self.config.speculative_encode:
+                result = self.run_speculative_encoder(entry, output, passlog, progress_range)
+                if result is not None or entry.skipped:
+                    return result or (0, [])
+                retry += 1
+                log.warning(f"retrying... ({retry})")
+                continue
+            else:
+                return_code, stdout = self.run_encoder(
+                    entry, self.build_encode_args(entry, output, pass_no=2 if passlog else 0, passlog=passlog),
+                    label="pass2" if passlog else "encode", progress_range=progress_range, projector=projector
+                )
+            if entry.skipped:
+                return return_code, stdout
+
+            target = self.config.size_limit
+            adjust = entry.size_adjust
+
+            if projector and projector.aborted:
+                # 予測サイズに比例させ、判定の余裕分だけ下げる
+                new_adjust = adjust * target / projector.projected * (1 - projector.margin)
+
+            else:
+                if return_code != 0:
+                    return return_code, stdout
+
+                entry.resized_size = get_file_size(output)
+                entry.encode_progress = 1
+                self.call_main_thread(self.update_entries)
+
+                if projector:
+                    projector.log_errors(entry.resized_size)
+
+                if entry.resized_size <= self.config.size_limit:
+                    return return_code, stdout
+
+                log.warning(f"OVER SIZE LIMIT ({entry.resized_size} <= {self.config.size_limit})")
+                if retry >= 2:
+                    return return_code, stdout
+
+                resized = entry.resized_size
+                over = resized - target
+                over_per = 1 - over / target
+                new_adjust = adjust * over_per * over_per
+
+            retry += 1
+            log.warning(f"retrying... ({retry})")
+
+            log.info(f"ReResize adjust: {adjust}% -> {new_adjust}%")
+
+            entry.size_adjust = new_adjust
+            entry.bit_rate = self.calc_bit_rate(
+                entry.media_info.duration,
+                new_adjust / 100, entry.audio_bit_rate
+            )
+
+    def encode(self, entry: ResizeEntry):
+        if any(p.returncode is None for p in entry.processes):
+            raise RuntimeError("already running encode process!")
+
+        output = self.get_output_path(entry)
+        entry.resized = output
+        entry.resized_size = 0
+        entry.processes = []
+        if entry.skipped or entry.stopped:
+            # 解析中・開始待ちの間に取り消された。分割の計画や試しエンコードも行わない
+            self._on_encode_cancelled(entry)
+            return
+
+        # パスログや分割した区間などの一時ファイルはすべてこのフォルダに作る (異常終了した場合は再開時に削除する)
+        entry.work_dir = Path(tempfile.mkdtemp(prefix="replayresizer_"))
+        self.set_job_state(entry, JobState.ENCODING, output=str(output.resolve()), work_dir=str(entry.work_dir))
+
+        passlog = None
+        segments = self.plan_encode_segments(entry)
+        if self.use_two_pass(entry) and not segments:
+            passlog = entry.work_dir / "ffmpeg2pass"
+
+        entry.telemetry.mode = "segment" if segments else "2pass" if passlog else "1pass"
+
+        try:
+            if self.config.sample_predict:
+                self.apply_sample_prediction(entry, entry.telemetry.mode)
+                self.call_main_thread(self.update_entries)
+
+            log.info(f"start encode: {entry} mode={entry.telemetry.mode}")
+            if entry.skipped or entry.stopped:
+                return_code, stdout = 0, []
+            else:
+                return_code, stdout = self._encode_attempts(entry, output, passlog, segments)
+
+        except Exception as e:
+            log.exception("exception in encoder read process")
+
+            if entry.is_script_order:
+                self.finish_script(entry)
+
+            self._on_failed(entry, PopupMessage(
+                "内部エラーが発生しました",
+                description="詳細はログファイルを参照してください。"
+            ).with_traceback(e))
+            return
+
+        finally:
+            shutil.rmtree(entry.work_dir, ignore_errors=True)
+            entry.work_dir = None
+
+        if entry.stopped:
+            self._on_encode_cancelled(entry)
+            return
+
+        self.call_main_thread(self.update_entries)
+        log.info(f"complete encode: {entry}")
+        log.info(f"return-code: {return_code}")
+
+        # if entry.order_options & OrderOption.DELETE_SOURCE_WHEN_COMPLETE:
+        #     entry.delete_source_file()
+
+        if entry.skipped:
+            self._on_encode_cancelled(entry)
+            return
+
+        if return_code != 0:
+            if entry.is_script_order:
+                self.finish_script(entry)
+
+            self._on_failed(entry, PopupMessage(
+                f"処理プロセスが コード {return_code} で終了しました",
+                description=entry.source.name,
+                content="\n".join(stdout)
+            ))
+            return
+
+        entry.telemetry.hit_target = entry.resized_size <= self.config.size_limit
+        log.info(f"encode telemetry: {entry.telemetry!r}")
+        self.encode_history.record(entry, self.config.size_limit)
+
+        entry.completed = True
+        self.set_job_state(entry, JobState.DONE, size=entry.resized_size)
+        self.call_main_thread(self._on_finished, entry)
+
+        if entry.is_script_order:
+            self.finish_script(entry)
+
+    def _on_encode_cancelled(self, entry: ResizeEntry):
+        if entry.stopped:
+            log.info(f"stopped while suspended: {entry!r}")  # 終了の処理は済んでいる
+            return
+
+        log.info("skipped! (go next)")
+        entry.delete_resize_file()
+        self.set_job_state(entry, JobState.SKIPPED)
+
+        if entry.is_script_order:
+            self.finish_script(entry)
+
+        self.call_main_thread(self.remove_entry, entry)
+
+    # static
+
+    @staticmethod
+    def setup_logging(level=logging.DEBUG, *, redirect_stdio=True):
+        root = logging.getLogger("replayresizer")
+        root.setLevel(logging.DEBUG)
+
+        if sys.__stderr__ is not None:  # call not in pythonW
+            sh = logging.StreamHandler(sys.__stderr__)
+            sh.setFormatter(logging.Formatter(
+                "[%(levelname)s,%(funcName)s:%(lineno)d,%(threadName)s] %(message)s"))
+            sh.setLevel(level)
+            root.addHandler(sh)
+
+        if redirect_stdio:
+            sys.stdout = IOLogger(name="stdout", method=log.info)
+            sys.stderr = IOLogger(name="stderr", method=log.error)
+
+        try:
+            with open("latest.log", "w") as _:
+                pass  # clean latest.log
+            fh = logging.FileHandler("latest.log", encoding="utf-8", delay=False)
+            fh.setFormatter(logging.Formatter(
+                "%(asctime)s,%(levelname)s,%(filename)s,%(funcName)s:%(lineno)d,%(threadName)s,%(message)s"))
+            root.addHandler(fh)
+        except OSError:
+            log.exception("setup error: file log handler")
@@ -1,10 +1,11 @@
 import os
 import re
 import subprocess
+import threading
 import traceback
 from logging import getLogger
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List
 
 from replayresizer.tools import get_file_size
 
@@ -21,6 +22,11 @@ class MediaInfo:
     def __init__(self, **info):
         self.info = info
         self.peak_gain = None  # type: Optional[float]
+        self.rms_db = None  # type: Optional[float]
+        self.loudness = None  # type: Optional[float]  # LUFS (近似)
+        self.spatial_complexity = None  # type: Optional[float]  # 輝度の勾配の平均 (0 - 1)
+        self.temporal_complexity = None  # type: Optional[float]  # フレーム間の差の平均 (0 - 1)
+        self.thumbnail = None  # type: Optional[Tuple[Tuple[int, int], bytes]]  # (size, rgb24)
 
         self._frame_rate = None
         self._wh = None
@@ -55,6 +61,37 @@ class MediaInfo:
         return str(self.info.get("codec_name", "n/a"))
 
 
+class EncodeTelemetry(object):
+    """エントリごとのエンコード記録 (どのモードで目標サイズに収まったか、何秒かかったか)"""
+
+    def __init__(self):
+        self.mode = ""
+        self.steps: List[Tuple[str, float, Optional[float]]] = []  # (label, seconds, size KB)
+        self.analyzed = False  # 2パスの1パス目が完了済み
+        self.hit_target = None  # type: Optional[bool]
+
+    def add_step(self, label: str, seconds: float, size: Optional[float] = None):
+        self.steps.append((label, seconds, size))
+
+    @property
+    def encode_seconds(self) -> float:
+        return sum(seconds for _, seconds, _ in self.steps)
+
+    @property
+    def encodes(self) -> int:
+        """出力ファイルを書き出したエンコードの回数"""
+        return sum(1 for _, _, size in self.steps if size is not None)
+
+    @property
+    def label(self) -> str:
+        return f"{self.mode} x{self.encodes} ({round(self.encode_seconds, 1)}s)"
+
+    def __repr__(self):
+        steps = ", ".join(f"{label}={round(seconds, 1)}s" for label, seconds, _ in self.steps)
+        return f"<{type(self).__name__} mode={self.mode!r} hit={self.hit_target} " \
+               f"total={round(self.encode_seconds, 1)}s steps=[{steps}]>"
+
+
 class ResizeEntry(object):
     def __init__(self, source: Path, *, size_limit: int):
         self.source = source
@@ -76,27 +113,67 @@ class ResizeEntry(object):
         self.encoder_params = ""
         self.fix_gain = None  # type: Optional[float]
         self.audio_codec = ""
+        self.audio_bit_rate = 96  # kbps
         self.video_codec = ""
         self.ext = ""
         self.encode_progress = 0  # type: Optional[float]
         self.size_adjust_first = 100
+        self.calibrated = False  # size_adjust を履歴から補正した
+        self.size_adjust_preset = None  # type: Optional[float]  # 補正前の size_adjust
+        self.sample_ratio = None  # type: Optional[float]  # 試しエンコードの映像ビットレート / 指定した映像ビットレート
+        self.telemetry = EncodeTelemetry()
 
         self.is_script_order = False
         self.order_options = 0
         self.custom_outname = None
         self.order_filename = None  # type: Optional[Path]
+        self.job_id = None  # type: Optional[str]  # ジャーナルのジョブ ID
+        self.queue_class = "watcher"  # type: str  # 待機キューの優先度の区分 (QueueClass)
+        self.file_key = None  # ソースファイルの識別キー (重複の確認用)
+        self.queue_priority = None  # type: Optional[tuple]  # キューに追加したときの優先度
+        self.queued_at = None  # type: Optional[float]  # キューに追加した時刻 (time.monotonic)
+        self.estimated_cost = None  # type: Optional[float]  # エンコード時間の見積もり (秒)
+        self.preempting = False  # 他のエントリを一時停止して開始した
+        self.preempted_by = None  # type: Optional[ResizeEntry]  # このエントリを一時停止して開始したエントリ
 
         # cache
         self.thumbnail_cache = None  # wx.Bitmap
-        self.process = None  # type: Optional[subprocess.Popen]
+        self.analyzed = False
+        self.analyze_lock = threading.Lock()
+        self.processes: List[subprocess.Popen] = []  # 分割エンコードでは複数
+        self.process_lock = threading.Lock()
+        self.work_dir = None  # type: Optional[Path]  # エンコード中の一時フォルダ
+        self.thread_leases: List[int] = []  # 実行中のプロセスに割り当てたスレッド数
+        self.suspended = False  # 優先度の高いエントリのために一時停止中
+        self.suspended_at = 0.
+        self.suspended_seconds = 0.  # 一時停止していた時間の合計
+        self.resume_event = threading.Event()  # 一時停止中はクリアされ、次のプロセスの開始を待たせる
+        self.resume_event.set()
+        self.stopped = False  # 一時停止したまま終了した。再開しても次のプロセスを開始しない
         self.completed = False
         self.skipped = False
+        self.failed = False
+
+    @property
+    def process(self) -> Optional[subprocess.Popen]:
+        return self.processes[-1] if self.processes else None
+
+    @process.setter
+    def process(self, process: Optional[subprocess.Popen]):
+        self.processes = [process] if process else []
 
     @property
     def is_encoding(self) -> bool:
-        return self.process is not None and self.process.returncode is None
+        return self.suspended or any(p.returncode is None for p in self.processes)
+
+    @property
+    def needs_encode(self) -> bool:
+        return self.is_script_order or self.source_size > self.size_limit
 
-        pass
+    @property
+    def is_processing(self) -> bool:
+        """ワーカーを占有している (完了・エラー前)"""
+        return not self.completed and not self.failed
 
     # @property
     # def completed(self):
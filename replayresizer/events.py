@@ -0,0 +1,157 @@
+"""
+watchdog のイベントの前処理
+
+録画中のファイルは書き込みのたびに変更イベントが発生するため、ResizerCore に渡す前に
+拡張子と対象パターンで対象外のイベントを捨て、パスごとに連続したイベントを1件にまとめます。
+"""
+import re
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, Optional, Set, Callable, Tuple
+
+from watchdog.events import FileSystemEventHandler, FileSystemEvent, FileCreatedEvent, FileModifiedEvent, \
+    EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED
+
+log = getLogger(__name__)
+
+SUFFIX_PATTERN = re.compile(r"^\\\.([A-Za-z0-9]+)\$$")  # "\.mp4$" 形式の対象パターン
+MAX_DECISIONS = 4096
+
+
+class FileKind:
+    TARGET = 1
+    ORDER = 2
+
+
+class EventCoalescer(FileSystemEventHandler):
+    def __init__(self, handler: FileSystemEventHandler, directory: Path, *,
+                 check_filename: Callable[[Path], bool], is_order: Callable[[Path], bool],
+                 targets=(), delay: float = .2):
+        """
+        :param handler: まとめたイベントを受け取るハンドラ (on_created / on_modified)
+        :param targets: コンパイル済みの対象パターン。すべて拡張子の形式なら拡張子で先に判定します
+        :param delay: 最後のイベントからこの時間経過したパスを渡します
+        """
+        self.handler = handler
+        self.directory = directory.resolve()
+        self.check_filename = check_filename
+        self.is_order = is_order
+        self.delay = delay
+        self.suffixes = self.get_target_suffixes(targets)  # type: Optional[Set[str]]
+
+        self.raw_events = 0
+        self.filtered_events = 0
+        self.coalesced_events = 0
+        self.delivered_events = 0
+
+        self._decisions: Dict[str, Optional[int]] = {}  # ファイル名 -> FileKind
+        self._pending: Dict[str, Tuple[int, float]] = {}  # パス -> (FileKind, 最後のイベントの時刻)
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._deliver_loop, name="EventCoalescer", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def get_target_suffixes(targets) -> Optional[Set[str]]:
+        suffixes = set()
+        for pattern in targets:
+            m = SUFFIX_PATTERN.search(pattern.pattern)
+            if not m:
+                return None
+            suffixes.add("." + m.group(1))
+        return suffixes
+
+    @property
+    def stats(self) -> str:
+        return f"raw={self.raw_events} filtered={self.filtered_events} " \
+               f"coalesced={self.coalesced_events} delivered={self.delivered_events}"
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
+
+    def classify(self, path: Path) -> Optional[int]:
+        name = path.name
+        try:
+            return self._decisions[name]
+        except KeyError:
+            pass
+
+        if self.is_order(path):
+            kind = FileKind.ORDER
+        elif self.suffixes is not None and path.suffix not in self.suffixes:
+            kind = None
+        else:
+            kind = FileKind.TARGET if self.check_filename(path) else None
+
+        if len(self._decisions) >= MAX_DECISIONS:
+            self._decisions.clear()
+        self._decisions[name] = kind
+        return kind
+
+    def dispatch(self, event: FileSystemEvent):
+        self.raw_events += 1
+
+        if event.is_directory:
+            self.filtered_events += 1
+            return
+
+        if event.event_type == EVENT_TYPE_MOVED:
+            src_path = event.dest_path
+            if Path(src_path).parent.resolve() != self.directory:
+                self.filtered_events += 1
+                return
+        elif event.event_type in (EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED):
+            src_path = event.src_path
+        else:
+            self.filtered_events += 1
+            return
+
+        kind = self.classify(Path(src_path))
+        if kind is None:
+            self.filtered_events += 1
+            return
+
+        with self._condition:
+            pending = src_path in self._pending
+            if kind == FileKind.TARGET and event.event_type == EVENT_TYPE_MODIFIED and not pending:
+                # 作成を検出していないファイルの変更 (処理済みのファイルなど) は無視する
+                self.filtered_events += 1
+                return
+
+            if pending:
+                self.coalesced_events += 1
+            self._pending[src_path] = (kind, time.monotonic())
+            self._condition.notify()
+
+    def _deliver_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+                now = time.monotonic()
+                ready = [(path, kind) for path, (kind, last) in self._pending.items() if now - last >= self.delay]
+                for path, _ in ready:
+                    del self._pending[path]
+
+                if not ready:
+                    wait = min(last for _, last in self._pending.values()) + self.delay - now
+                    self._condition.wait(max(.01, wait))
+                    continue
+
+            for path, kind in ready:
+                self.delivered_events += 1
+                try:
+                    if kind == FileKind.ORDER:
+                        self.handler.on_modified(FileModifiedEvent(path))
+                    else:
+                        self.handler.on_created(FileCreatedEvent(path))
+                except (Exception,):
+                    log.exception("exception in event handler")
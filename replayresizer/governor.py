@@ -0,0 +1,256 @@
+"""
+ffmpeg の CPU 使用の制御
+
+起動した ffmpeg / ffprobe の優先度と CPU アフィニティを設定し、同時に実行するエンコードで
+スレッド数の上限 (thread_budget) を分け合います。
+また、システムの負荷 (os.getloadavg) を監視し、自分のエンコード分を除いた負荷が高い間は
+エンコードを一時停止させます。アイドル待ちのモードでは、負荷が一定時間低いか、指定した時間帯の間だけ
+エンコードの開始を許可します。Windows では負荷を取得できないため、時間帯の指定だけが使えます。
+"""
+import datetime
+import os
+import re
+import subprocess
+import threading
+import time
+from logging import getLogger
+from typing import Callable, List, Optional, Iterable, Tuple
+
+from replayresizer.tools import is_windows
+
+log = getLogger(__name__)
+
+# Windows の優先度クラス
+IDLE_PRIORITY_CLASS = 0x40
+BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+
+
+def get_load_average() -> Optional[float]:
+    """直近1分の平均負荷。取得できなければ None"""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+def parse_quiet_hours(spec: str) -> Optional[Tuple[int, int]]:
+    """"HH:MM-HH:MM" を (開始, 終了) の 0 時からの分に変換します。終了が開始より前なら日をまたぐ"""
+    m = re.match(r"^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$", spec or "")
+    if not m:
+        return None
+    start = int(m.group(1)) * 60 + int(m.group(2))
+    end = int(m.group(3)) * 60 + int(m.group(4))
+    return start % 1440, end % 1440
+
+
+def in_quiet_hours(spec: str, now: datetime.datetime = None) -> bool:
+    hours = parse_quiet_hours(spec)
+    if hours is None:
+        return False
+    now = now or datetime.datetime.now()
+    minutes = now.hour * 60 + now.minute
+    start, end = hours
+    if start <= end:
+        return start <= minutes < end
+    return minutes >= start or minutes < end
+
+
+class ResourceGovernor(object):
+    def __init__(self, *, nice: int = 0, affinity: Iterable[int] = (), thread_budget: int = 0,
+                 load_limit: float = 0., load_resume: float = 0., check_interval: float = 5.):
+        """
+        :param nice: 子プロセスの nice 値 (Windows では 1 以上で「通常以下」、15 以上で「低」)
+        :param affinity: 子プロセスに割り当てる CPU 番号。空なら変更しない
+        :param thread_budget: 同時に実行するエンコードで分け合うスレッド数。0 なら制限しない
+        :param load_limit: CPU 1つあたりの負荷 (自分のエンコード分を除く) がこれを超えたら混雑とみなす。0 なら監視しない
+        :param load_resume: 混雑中に負荷がこれを下回ったら再開する (0 なら load_limit の 8 割)
+        """
+        self.nice = nice
+        self.affinity = list(affinity)
+        self.thread_budget = thread_budget
+        self.concurrency = 1  # 同時に実行するエンコード数 (max_workers)
+        self.load_limit = load_limit
+        self.load_resume = load_resume
+        self.check_interval = check_interval
+        self.busy = False
+        self.on_busy_changed: Optional[Callable[[bool], None]] = None  # 監視スレッドから呼ばれます
+        # アイドル待ち
+        self.deferred = False
+        self.idle_load = .3  # CPU 1つあたりの負荷がこれ未満ならアイドル
+        self.idle_seconds = 60.
+        self.quiet_hours = ""  # "HH:MM-HH:MM"
+        self.released = True  # アイドル待ちで、エンコードの開始を許可している
+        self.on_release_changed: Optional[Callable[[bool], None]] = None  # 監視スレッドから呼ばれます
+        self._idle_since = None  # type: Optional[float]
+        self._leases: List[int] = []  # 実行中のエンコードに割り当てたスレッド数
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def cpu_count(self) -> int:
+        return len(self.affinity) or os.cpu_count() or 1
+
+    # process
+
+    def apply(self, process: subprocess.Popen):
+        """起動したプロセスに優先度とアフィニティを設定します (どちらも未設定なら何もしません)"""
+        if not self.nice and not self.affinity or process.poll() is not None:
+            return
+
+        try:
+            if is_windows():
+                self._apply_windows(process)
+                return
+
+            if self.nice:
+                os.setpriority(os.PRIO_PROCESS, process.pid, self.nice)
+            if self.affinity and hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(process.pid, self.affinity)
+
+        except (OSError, ValueError, AttributeError):
+            log.warning(f"failed to apply process limits: pid={process.pid}", exc_info=True)
+
+    def _apply_windows(self, process: subprocess.Popen):
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32")
+        # noinspection PyProtectedMember,PyUnresolvedReferences
+        handle = int(process._handle)
+
+        if self.nice > 0:
+            kernel32.SetPriorityClass(handle, IDLE_PRIORITY_CLASS if self.nice >= 15 else BELOW_NORMAL_PRIORITY_CLASS)
+        if self.affinity:
+            mask = 0
+            for cpu in self.affinity:
+                mask |= 1 << cpu
+            kernel32.SetProcessAffinityMask(handle, ctypes.c_size_t(mask))
+
+    # threads
+
+    def lease_threads(self, fanout: int = 1) -> int:
+        """
+        ffmpeg 1つ分のスレッド数を割り当てます。0 なら ffmpeg の既定 (制限しない)
+
+        thread_budget を想定する同時実行数 (concurrency x fanout) で等分します。
+        実行中のプロセスのスレッド数は変えられないため、残りが足りなければ残りだけ (最低 1) とします。
+        終了時に release_threads() で返却してください
+
+        :param fanout: 1つのエンコードで同時に起動するプロセス数 (分割・投機的エンコードなど)
+        """
+        with self._lock:
+            if self.thread_budget <= 0:
+                self._leases.append(0)
+                return 0
+
+            share = max(1, self.thread_budget // max(1, self.concurrency * fanout))
+            threads = max(1, min(share, self.thread_budget - sum(self._leases)))
+            self._leases.append(threads)
+            return threads
+
+    def acquire_threads(self, threads: int):
+        """一時停止で返却したスレッド数を、再開時に割り当て直します"""
+        with self._lock:
+            self._leases.append(threads)
+
+    def release_threads(self, threads: int):
+        with self._lock:
+            try:
+                self._leases.remove(threads)
+            except ValueError:
+                pass
+
+    @property
+    def leased_threads(self) -> int:
+        """負荷から差し引く、自分のエンコードのスレッド数 (制限しない場合は CPU 数)"""
+        with self._lock:
+            return min(self.cpu_count, sum(t or self.cpu_count for t in self._leases))
+
+    # load
+
+    def start(self):
+        has_load = get_load_average() is not None
+        self._idle_since = None
+        self.released = not self.deferred or in_quiet_hours(self.quiet_hours)
+        if self.deferred and not has_load and parse_quiet_hours(self.quiet_hours) is None:
+            log.warning("deferred encoding needs quiet_hours on this platform (no load average), disabled")
+            self.released = True
+            self.deferred = False
+
+        if not (self.load_limit > 0 and has_load or self.deferred):
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._monitor_loop, name="ResourceGovernor", daemon=True)
+        self._thread.start()
+        log.info(f"load monitor started: limit={self.load_limit}/cpu deferred={self.deferred} "
+                 f"(idle<{self.idle_load}/cpu for {self.idle_seconds}s, quiet hours {self.quiet_hours or '-'})")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1)
+        if self.busy:
+            self._set_busy(False, 0.)
+
+    def get_external_load(self) -> Optional[float]:
+        """CPU 1つあたりの、自分のエンコードを除いた負荷"""
+        load = get_load_average()
+        if load is None:
+            return None
+        # 一時停止中はエンコードのスレッドが負荷に含まれない
+        own = 0 if self.busy else self.leased_threads
+        return max(0., load - own) / (os.cpu_count() or 1)
+
+    def check_release(self, load: Optional[float]) -> bool:
+        """アイドル待ちで、エンコードの開始を許可するか"""
+        if in_quiet_hours(self.quiet_hours):
+            return True
+        if load is None:
+            self._idle_since = None
+            return False
+
+        now = time.monotonic()
+        if load >= self.idle_load:
+            self._idle_since = None
+        elif self._idle_since is None:
+            self._idle_since = now
+        return self._idle_since is not None and now - self._idle_since >= self.idle_seconds
+
+    def _monitor_loop(self):
+        while not self._stop.wait(self.check_interval):
+            load = self.get_external_load()
+
+            if self.deferred:
+                released = self.check_release(load)
+                if released != self.released:
+                    self._set_released(released, load)
+
+            if load is None or self.load_limit <= 0:
+                continue
+
+            resume = self.load_resume or self.load_limit * .8
+            if not self.busy and load > self.load_limit:
+                self._set_busy(True, load)
+            elif self.busy and load < resume:
+                self._set_busy(False, load)
+
+    def _set_released(self, released: bool, load: Optional[float]):
+        self.released = released
+        log.info(f"deferred encoding {'released' if released else 'held'}: "
+                 f"load {'-' if load is None else round(load, 2)}/cpu")
+        if self.on_release_changed:
+            try:
+                self.on_release_changed(released)
+            except (Exception,):
+                log.exception("exception in on_release_changed")
+
+    def _set_busy(self, busy: bool, load: float):
+        self.busy = busy
+        log.info(f"system {'busy' if busy else 'idle'}: load {round(load, 2)}/cpu")
+        if self.on_busy_changed:
+            try:
+                self.on_busy_changed(busy)
+            except (Exception,):
+                log.exception("exception in on_busy_changed")
@@ -0,0 +1,121 @@
+"""
+wxPython を使わずにリサイズを実行するフロントエンド
+
+メインスレッドのイベントループは wx の代わりにキューで再現しており、
+ResizerCore のコールバックはすべて run() を実行しているスレッドで処理されます。
+"""
+import queue
+import threading
+from logging import getLogger
+from pathlib import Path
+from typing import List, Iterable, Optional
+
+from replayresizer.core import ResizerCore
+from replayresizer.entry import ResizeEntry, PopupMessage
+from replayresizer.tools import get_file_size_label
+
+log = getLogger(__name__)
+
+
+class HeadlessResizer(ResizerCore):
+    def __init__(self, app_directory: Path, *, config_file: Path = None):
+        ResizerCore.__init__(self, app_directory, config_file=config_file)
+        self._calls = queue.Queue()  # type: queue.Queue
+        self._stop = threading.Event()
+        self.finished: List[ResizeEntry] = []
+        self.failed: List[ResizeEntry] = []
+
+    def run(self, files: Iterable[Path] = (), *, watch=False) -> int:
+        """
+        files をキューに追加して処理します。files が無ければ、入力フォルダの未処理のファイルを処理します
+
+        :param watch: 入力フォルダを監視し続ける (stop() まで戻らない)。False ならキューが空になった時点で終了
+        :return: 終了コード (エラーのエントリがあれば 1)
+        """
+        if not self.check_ffmpeg():
+            log.error("ffmpeg / ffprobe is not available")
+            return 2
+
+        files = list(files)
+        input_directory = self.config.input_directory
+        if (watch or not files) and not (input_directory and Path(input_directory).is_dir()):
+            log.error(f"input directory not found: {self.config.input_directory!r}")
+            return 2
+
+        self.start_governor()
+        self.call_main_thread(self.resume_jobs)
+        for path in files:
+            self.call_main_thread(self.on_recorded, Path(path))
+
+        if watch:
+            self.call_main_thread(self.start_watchdog)
+        elif not files:
+            self.call_main_thread(self.scan_backlog, seed=False)
+
+        try:
+            self._loop(until_idle=not watch)
+        except KeyboardInterrupt:
+            log.info("interrupted, canceling running entries")
+            self.journal.close()  # 中断したジョブは次回の起動時に再開する
+            with self.lock:
+                self.entries.clear()
+            for entry in list(self.active_entries):
+                self.skip_entry(entry)
+            self._loop(until_idle=True, timeout=10)
+        finally:
+            self.stop_watchdog()
+            self.governor.stop()
+            self.journal.close()
+            self.media_cache.flush()
+
+        log.info(f"headless done: {len(self.finished)} finished, {len(self.failed)} failed, "
+                 f"queue wait {self.entries.wait_report()}")
+        return 1 if self.failed else 0
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, *, until_idle: bool, timeout: Optional[float] = None):
+        waited = 0.
+        while not self._stop.is_set():
+            try:
+                func = self._calls.get(timeout=.5)
+            except queue.Empty:
+                waited += .5
+                if until_idle and self.is_idle or timeout is not None and waited >= timeout:
+                    return
+                continue
+
+            try:
+                func()
+            except (Exception,):
+                log.exception("exception in headless main loop")
+
+    @property
+    def is_idle(self) -> bool:
+        return not self.entries and not self.active_entries and self._calls.empty() and not self.stability.pending
+
+    # frontend
+
+    def call_main_thread(self, func, *args, **kwargs):
+        self._calls.put(lambda: func(*args, **kwargs))
+
+    def _on_finished(self, entry: ResizeEntry):
+        self.clear_suspended(entry)
+        self.finished.append(entry)
+        if entry.resized and entry.resized_size:
+            print(f"{entry.source} -> {entry.resized} ({get_file_size_label(entry.resized_size)}, "
+                  f"{entry.telemetry.label})", flush=True)
+        else:
+            print(f"{entry.source} (no resize needed)", flush=True)
+        self.remove_entry(entry)
+
+    def _on_failed(self, entry: ResizeEntry, message: Optional[PopupMessage]):
+        self.failed.append(entry)
+        if message:
+            log.error(f"failed: {entry.source}: {message.title} {message.description or ''}".rstrip())
+            if message.content:
+                log.debug(message.content)
+        else:
+            log.warning(f"failed: {entry.source}")
+        ResizerCore._on_failed(self, entry, message)
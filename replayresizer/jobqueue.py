@@ -0,0 +1,158 @@
+"""
+待機中のエントリのキュー
+
+優先度 (小さいほど先) と追加順で並べるヒープと、ファイルの識別キーとパスによる索引を持ち、
+重複の確認と取り出しをエントリ数によらず行えるようにします。
+(同じパスに別のファイルが作り直された場合は識別キーが変わるため、パスでも確認します)
+
+優先度は (区分の優先度, スケジューリングのスコア) で、スコアは方針ごとに次のとおりです。
+  fifo:  0 (追加順)
+  sjf:   見積もったエンコード時間 (短いものから)
+  aging: 見積もり時間 - 待ち時間 * aging_rate
+         待ち時間は全エントリで同じ速さで増えるので、見積もり時間 + 追加時刻 * aging_rate で並べれば
+         並べ替えずに済みます
+"""
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Iterator, Hashable, Deque
+
+from replayresizer.entry import ResizeEntry
+
+
+class QueueClass:
+    ORDER = "order"  # オーダースクリプト
+    MANUAL = "manual"  # ポップアップへのドロップ
+    WATCHER = "watcher"  # 入力フォルダの監視・スキャン
+
+    DEFAULT_PRIORITY = {ORDER: 0, MANUAL: 1, WATCHER: 2}
+
+
+class QueuePolicy:
+    FIFO = "fifo"
+    SJF = "sjf"
+    AGING = "aging"
+
+    ALL = (FIFO, SJF, AGING)
+
+
+def get_schedule_score(policy: str, cost: float, queued_at: float, *, aging_rate: float = 1.) -> float:
+    """
+    :param cost: 見積もったエンコード時間 (秒)
+    :param queued_at: 追加時刻 (time.monotonic)
+    """
+    if policy == QueuePolicy.SJF:
+        return cost
+    if policy == QueuePolicy.AGING:
+        return cost + queued_at * aging_rate
+    return 0.
+
+
+def get_file_identity(path: Path) -> Optional[Hashable]:
+    """(デバイス, inode) によるファイルの識別キー。inode が得られなければ解決済みのパス"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    if stat.st_ino:
+        return stat.st_dev, stat.st_ino
+    return str(path.resolve())
+
+
+def get_path_key(path: Path) -> str:
+    """パスによる索引のキー (Windows では大文字・小文字を区別しない)"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+class JobQueue(object):
+    def __init__(self, *, max_waits: int = 1000):
+        self._heap: List[Tuple[tuple, int, ResizeEntry]] = []
+        self._live: Dict[int, ResizeEntry] = {}  # id(entry) -> entry  (削除済みは含まない)
+        self._index: Dict[Hashable, ResizeEntry] = {}
+        self._paths: Dict[str, ResizeEntry] = {}
+        self._counter = itertools.count()
+        self.waits: Deque[float] = deque(maxlen=max_waits)  # 開始したエントリの待ち時間 (秒)
+
+    def __len__(self):
+        return len(self._live)
+
+    def __bool__(self):
+        return bool(self._live)
+
+    def __contains__(self, entry: ResizeEntry):
+        return id(entry) in self._live
+
+    def __iter__(self) -> Iterator[ResizeEntry]:
+        """優先度順"""
+        return iter(self.peek(len(self._live)))
+
+    def push(self, entry: ResizeEntry, priority: tuple):
+        """
+        :param priority: 小さいほど先に取り出します。同じなら追加順
+        """
+        heapq.heappush(self._heap, (priority, next(self._counter), entry))
+        self._live[id(entry)] = entry
+        if entry.file_key is not None:
+            self._index.setdefault(entry.file_key, entry)
+        self._paths.setdefault(get_path_key(entry.source), entry)
+
+    def pop(self) -> ResizeEntry:
+        while self._heap:
+            _, _, entry = heapq.heappop(self._heap)
+            if self._live.pop(id(entry), None) is not None:
+                self._unindex(entry)
+                return entry
+        raise IndexError("pop from empty queue")
+
+    def peek(self, count: int) -> List[ResizeEntry]:
+        items = heapq.nsmallest(count, (item for item in self._heap if id(item[2]) in self._live))
+        return [entry for _, _, entry in items]
+
+    def remove(self, entry: ResizeEntry) -> bool:
+        """ヒープからは取り出し時に取り除きます"""
+        if self._live.pop(id(entry), None) is None:
+            return False
+        self._unindex(entry)
+        if not self._live:
+            self._heap.clear()
+        return True
+
+    def find(self, file_key: Hashable) -> Optional[ResizeEntry]:
+        return self._index.get(file_key)
+
+    def find_path(self, path: Path) -> Optional[ResizeEntry]:
+        return self._paths.get(get_path_key(path))
+
+    def clear(self):
+        self._heap.clear()
+        self._live.clear()
+        self._index.clear()
+        self._paths.clear()
+
+    def record_wait(self, entry: ResizeEntry):
+        """
+        取り出したエントリを開始した時点で、最初にキューに追加してからの待ち時間を記録します
+
+        (開始できずにキューに戻したエントリは、開始するまで記録しません)
+        """
+        if entry.queued_at is not None:
+            self.waits.append(time.monotonic() - entry.queued_at)
+
+    def wait_report(self) -> str:
+        """取り出したエントリの待ち時間の平均と p95"""
+        if not self.waits:
+            return "no waits"
+        waits = sorted(self.waits)
+        p95 = waits[max(0, math.ceil(len(waits) * .95) - 1)]
+        return f"n={len(waits)} mean={round(sum(waits) / len(waits), 1)}s p95={round(p95, 1)}s"
+
+    def _unindex(self, entry: ResizeEntry):
+        if entry.file_key is not None and self._index.get(entry.file_key) is entry:
+            del self._index[entry.file_key]
+        path_key = get_path_key(entry.source)
+        if self._paths.get(path_key) is entry:
+            del self._paths[path_key]
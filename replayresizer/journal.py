@@ -0,0 +1,138 @@
+"""
+ジョブの状態を追記するジャーナル (JSONL)
+
+エントリの状態 (queued → analyzing → encoding → done / failed / skipped) を1行ずつ追記し、
+異常終了した場合でも次回の起動時に未完了のジョブを再開できるようにします。
+書き込みは専用のスレッドでまとめて行うため、エンコードの読み込みループを止めません。
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from logging import getLogger
+from pathlib import Path
+from typing import List, Optional, Dict
+
+from replayresizer.entry import ResizeEntry
+
+log = getLogger(__name__)
+
+
+class JobState:
+    QUEUED = "queued"
+    ANALYZING = "analyzing"
+    ENCODING = "encoding"
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+    FINISHED = (DONE, FAILED, SKIPPED)
+
+
+class JobJournal(object):
+    def __init__(self, path: Path, *, flush_interval: float = 1.):
+        self._path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    def open(self) -> List[dict]:
+        """
+        ジャーナルを読み込み、未完了のジョブを返します
+
+        完了したジョブは削除して書き直し (コンパクション)、書き込みスレッドを開始します
+        """
+        jobs: Dict[str, dict] = {}
+        if self._path.is_file():
+            try:
+                with self._path.open(encoding="utf-8") as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # 書き込み途中で終了した行
+                        if isinstance(record, dict) and record.get("id"):
+                            jobs.setdefault(record["id"], {}).update(record)
+            except OSError:
+                log.warning(f"failed to load job journal: {self._path}", exc_info=True)
+
+        pending = [job for job in jobs.values() if job.get("state") not in JobState.FINISHED and job.get("source")]
+
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        try:
+            with tmp.open("w", encoding="utf-8") as file:
+                for job in pending:
+                    file.write(json.dumps(job, ensure_ascii=False) + "\n")
+            os.replace(tmp, self._path)
+        except OSError:
+            log.warning(f"failed to compact job journal: {self._path}", exc_info=True)
+
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="JobJournal", daemon=True)
+        self._writer.start()
+        log.debug(f"job journal opened: {len(pending)} pending jobs")
+        return pending
+
+    def close(self):
+        """残りを書き込んで終了します。以降の書き込みは無視されます"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(5)
+            self._writer = None
+
+    def write(self, entry: ResizeEntry, state: str, **values):
+        if self._closed or self._writer is None:
+            return
+
+        record = dict(id=self.get_job_id(entry), time=round(time.time(), 3), state=state)
+        if state == JobState.QUEUED:
+            record.update(
+                source=str(entry.source.resolve()),
+                size_limit=entry.size_limit,
+                is_script_order=entry.is_script_order,
+                custom_outname=entry.custom_outname,
+                order_options=entry.order_options,
+                queue_class=entry.queue_class,
+            )
+        record.update(values)
+        self._queue.put(record)
+
+    @staticmethod
+    def get_job_id(entry: ResizeEntry) -> str:
+        if entry.job_id is None:
+            entry.job_id = uuid.uuid4().hex[:16]
+        return entry.job_id
+
+    def _write_loop(self):
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0., deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                running = False
+                batch.pop()
+
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: List[dict]):
+        try:
+            with self._path.open("a", encoding="utf-8") as file:
+                for record in batch:
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError:
+            log.warning(f"failed to write job journal: {self._path}", exc_info=True)
@@ -28,6 +28,10 @@ class OrderScriptManager(object):
     def __init__(self):
         pass
 
+    @staticmethod
+    def is_script_file(file: Path) -> bool:
+        return ALLOW_NAME.search(file.name) is not None
+
     @staticmethod
     def process_script_entry(file: Path, *, size_limit: int) -> Optional[ResizeEntry]:
         m = ALLOW_NAME.search(file.name)
@@ -8,6 +8,7 @@ import wx.adv
 from replayresizer import layout
 from replayresizer.config import AutoActionWhen, CloseAction
 from replayresizer.entry import ResizeEntry, PopupMessage, OrderOption
+from replayresizer.jobqueue import QueueClass
 from replayresizer.images import icon
 from replayresizer.keyhandler import KeyHandler
 from replayresizer.tools import *
@@ -49,6 +50,7 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
         self._in_cursor = False
         self.pressed_shift = False
         self.action_count_lefts = -1
+        self.action_entry = None  # type: Optional[ResizeEntry]
 
         self.move_frame_position()
         self.draw_entry(None)
@@ -56,6 +58,7 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
         self.thumbnail.SetDropTarget(FileDropTarget(self.on_drop_files))
         self.thumbnail.Bind(wx.EVT_LEFT_DOWN, self.on_thumbnail_drag)
         self.thumbnail.Bind(wx.EVT_LEFT_DCLICK, self.on_thumbnail_open)
+        self.thumbnail.Bind(wx.EVT_RIGHT_DOWN, self.on_thumbnail_select)
         self.app.app.Bind(wx.EVT_MOTION, self.on_mouse)
 
     @property
@@ -106,6 +109,14 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
                     except (Exception,):
                         log.warning("Failed to loading wallpaper", exc_info=True)
 
+                # アイドル待ちのエントリなど、待機中の一覧だけを描画する
+                dc = wx.MemoryDC()
+                dc.SelectObject(bitmap)
+                gc = wx.GraphicsContext.Create(dc)  # type: wx.GraphicsContext
+                self._draw_jobs(gc, None)
+                del gc
+                del dc
+
                 self.thumbnail.SetBitmap(bitmap)
                 self.Refresh()
                 self.Layout()
@@ -149,6 +160,8 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
             if self.config.draw_media_info:
                 self._draw_media_info(gc, entry)
 
+            self._draw_jobs(gc, entry)
+
             self.thumbnail.SetBitmap(bitmap)
             self.Refresh()
             self.Layout()
@@ -198,6 +211,8 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
         elif entry.is_encoding:
             progress = min(100, max(0, int(round(entry.encode_progress * 100))))
             line1 = f"{get_file_size_label(entry.resized_size)}  /  {progress}%"
+            if entry.suspended:
+                line1 += "  (一時停止)"
             over_limit = entry.resized_size > self.config.size_limit
         elif entry.resized and entry.resized_size:
             line1 = get_file_size_label(entry.resized_size)
@@ -291,6 +306,8 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
                  ]]
         if self.config.normalized_volume:
             lines.append(f"PeakGain: {gain_orig:10} > {gain_resized}")
+        if entry.telemetry.steps:
+            lines.append(f"{'Encode':8}: {entry.telemetry.label}")
 
         lines.insert(0, filename)
         lines.insert(1, "")
@@ -311,6 +328,52 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
 
         pass
 
+    def _draw_jobs(self, gc: wx.GraphicsContext, entry: Optional[ResizeEntry]):
+        others = [e for e in self.app.active_entries if e is not entry]
+        if not others and not self.app.entries:
+            return
+
+        width, _ = self.thumbnail.GetSize()
+
+        lines = []
+        for e in others:
+            if e.is_encoding:
+                state = f"{min(100, max(0, int(round((e.encode_progress or 0) * 100))))}%"
+                if e.suspended:
+                    state = f"一時停止 {state}"
+            elif e.completed:
+                state = "完了"
+            elif e.failed:
+                state = "エラー"
+            else:
+                state = "解析中"
+            name = e.source.name if len(e.source.name) <= 24 else e.source.name[:23] + "…"
+            lines.append(f"{name}  {state}")
+
+        if self.app.entries:
+            if self.app.is_deferred:
+                lines.append(f"アイドル待ち: {len(self.app.entries)}")
+                for e in self.app.entries.peek(3):
+                    name = e.source.name if len(e.source.name) <= 24 else e.source.name[:23] + "…"
+                    if e.media_info:
+                        m, s = divmod(e.media_info.duration, 60)
+                        lines.append(f"{name}  {int(m)}:{int(s):02}")
+                    else:
+                        lines.append(f"{name}  解析中")
+            else:
+                lines.append(f"待機中: {len(self.app.entries)}")
+
+        text = "\n".join(lines)
+        font = wx.SystemSettings.GetFont(wx.SYS_DEFAULT_GUI_FONT)  # type: wx.Font
+        font.SetPixelSize(wx.Size(0, 12))
+        gc.SetFont(font, wx.Colour(255, 255, 255, 255))
+        gc.SetBrush(wx.Brush(wx.Colour(0, 0, 0, 140)))
+
+        text_width, text_height, descent, _ = gc.GetFullTextExtent(text)
+
+        gc.DrawRectangle(width - text_width - descent * 2, 0, text_width + descent * 2, text_height + descent * 2)
+        gc.DrawText(text, width - text_width - descent, descent)
+
     def _draw_popup_message(self, gc: wx.GraphicsContext, msg: PopupMessage):
         width, height = self.thumbnail.GetSize()
 
@@ -385,11 +448,11 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
 
         if event.GetEventObject() is self.button_done:
             self.action_count_lefts = -1
-            self.app.call_close_action(shift=self.pressed_shift)
+            self.app.call_close_action(self.current_entry, shift=self.pressed_shift)
 
         elif event.GetEventObject() is self.button_action:
             if self.current_entry and self.current_entry.is_encoding:
-                self.app.skip_current_entry()
+                self.app.skip_entry(self.current_entry)
             # self.frame.Hide()
             pass
 
@@ -417,16 +480,18 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
 
         open_explorer(entry.complete_file, select=True)
 
+    def on_thumbnail_select(self, _):
+        if not self._shown_popup:
+            self.app.select_next_entry()
+
     def on_drop_files(self, x, y, files):
-        current_resize = None
-        if self.current_entry and self.current_entry.resized:
-            current_resize = self.current_entry.resized.resolve()
+        current_resizes = {e.resized.resolve() for e in self.app.active_entries if e.resized}
 
         for file in files:
             file = Path(file).resolve()
             if file.is_file():
-                if file != current_resize:
-                    self.app.on_recorded(file)
+                if file not in current_resizes:
+                    self.app.on_recorded(file, queue_class=QueueClass.MANUAL)
                     return True
         return False
 
@@ -467,6 +532,7 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
             return
 
         self.action_count_lefts = self.config.auto_close_delay
+        self.action_entry = self.current_entry
         self.update_buttons()
         self._in_cursor = False
         wx.CallLater(1000, self._on_action_time).Start()
@@ -480,7 +546,8 @@ class PopupPanel(layout.PopupPanel, KeyHandler):
             wx.CallLater(1000, self._on_action_time).Start()
 
         elif self.action_count_lefts == 0:
-            self.app.call_close_action()
+            if self.action_entry is self.current_entry:
+                self.app.call_close_action(self.action_entry)
 
         else:
             pass
@@ -0,0 +1,157 @@
+"""
+エンコードプリセットの段階 (tier) の表
+
+設定の presets に、次の形式の辞書を任意の数だけ指定できます。空なら hq_* / lq_* / ulq_* の設定から作ります。
+
+    {"name": "AV1 (HQ)", "min_bit_rate": 1200,
+     "video_codec": "libsvtav1", "ext": "mp4", "encoder_params": "-preset 10",
+     "width": 1280, "height": 0, "fps_cap": 30, "fps_cap_above": 36,
+     "audio_codec": "libopus", "audio_bit_rate": 96, "size_adjust": 100}
+
+min_bit_rate は選択の条件で、制限サイズに収まる映像ビットレート (kbps) がこの値以上の段階のうち、
+最も min_bit_rate が大きいものが選ばれます。どれにも当てはまらなければ min_bit_rate が最小の段階を使います。
+表は読み込み時に min_bit_rate の降順に並べておき、エントリごとの選択は二分探索だけで行います。
+
+adaptive_resolution が有効な場合、段階の解像度とフレームレートを上限として select_ladder_rung() で
+1ピクセル・1フレームあたりのビット数 (bpp) が下限を下回らない最大の解像度とフレームレートを選びます。
+(段階の指定より下げるだけで、上げることはありません)
+"""
+import bisect
+from logging import getLogger
+from typing import List, Optional, Tuple, Iterable
+
+log = getLogger(__name__)
+
+
+class PresetTier(object):
+    def __init__(self, name: str, *, video_codec: str, ext: str, min_bit_rate: float = 0.,
+                 width: int = 0, height: int = 0, fps_cap: int = 0, fps_cap_above: float = None,
+                 audio_codec: Optional[str] = "aac", audio_bit_rate: int = 96,
+                 encoder_params: str = "", size_adjust: float = 100., bpp_floor: float = 0.):
+        """
+        :param fps_cap: ソースのフレームレートが fps_cap_above (省略時は fps_cap の 1.2 倍) を超える場合のフレームレート。0 なら変更しない
+        :param audio_codec: None なら音声を出力しない
+        :param bpp_floor: 解像度の自動選択での bpp の下限。0 なら設定の bpp_floor
+        """
+        if not name or not video_codec or not ext:
+            raise ValueError("name, video_codec and ext are required")
+
+        self.name = name
+        self.video_codec = video_codec
+        self.ext = ext
+        self.min_bit_rate = float(min_bit_rate)
+        self.width = int(width or 0)
+        self.height = int(height or 0)
+        self.fps_cap = int(fps_cap or 0)
+        self.fps_cap_above = float(fps_cap_above) if fps_cap_above is not None else self.fps_cap * 1.2
+        self.audio_codec = audio_codec or None
+        self.audio_bit_rate = int(audio_bit_rate) if self.audio_codec else 0
+        self.encoder_params = encoder_params or ""
+        self.size_adjust = float(size_adjust)
+        self.bpp_floor = float(bpp_floor or 0)
+
+    def get_frames(self, frame_rate: float) -> int:
+        """出力のフレームレート。0 ならソースのまま"""
+        return self.fps_cap if self.fps_cap and frame_rate > self.fps_cap_above else 0
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name!r} {self.video_codec}/{self.ext} min={self.min_bit_rate}kbps>"
+
+
+class PresetTable(object):
+    def __init__(self, tiers: List[PresetTier]):
+        if not tiers:
+            raise ValueError("no preset tiers")
+        self.tiers = sorted(tiers, key=lambda t: -t.min_bit_rate)
+        self._keys = [-t.min_bit_rate for t in self.tiers]  # 昇順
+
+    def select(self, bit_rate: float) -> PresetTier:
+        """bit_rate (kbps) で使える段階"""
+        index = bisect.bisect_left(self._keys, -bit_rate)
+        return self.tiers[min(index, len(self.tiers) - 1)]
+
+    def get(self, name: str) -> Optional[PresetTier]:
+        return next((t for t in self.tiers if t.name == name), None)
+
+    @classmethod
+    def from_config(cls, config) -> "PresetTable":
+        tiers = []
+        for value in config.presets or []:
+            try:
+                tiers.append(PresetTier(**value))
+            except (TypeError, ValueError) as e:
+                log.warning(f"invalid preset ignored: {value!r} ({e})")
+
+        if tiers:
+            return cls(tiers)
+        return cls(get_legacy_tiers(config))
+
+
+def select_ladder_rung(bit_rate: float, source_wh: Tuple[int, int], source_fps: Optional[float], *,
+                       heights: Iterable[int], fps_ladder: Iterable[float],
+                       bpp_floor: float, fps_floor: float = 30., max_height: int = 0,
+                       max_fps: float = 0.) -> Optional[Tuple[int, int, float, float]]:
+    """
+    映像ビットレート (kbps) で bpp が bpp_floor 以上になる解像度とフレームレートの組み合わせ
+
+    解像度の高いものを優先し、同じ解像度ならフレームレートの高いものを選びます。
+    fps_floor 未満のフレームレートは、それ以上のフレームレートでは最小の解像度でも下限に届かない場合だけ使います。
+    ソース (max_height / max_fps の指定があればそれ) より大きい解像度・フレームレートは使わず、上限そのものも候補に含めます。
+    どれも下限を下回る場合は最小の組み合わせを返します
+
+    :param max_height: 高さの上限。0 ならソースの高さ
+    :param max_fps: フレームレートの上限。0 ならソースのフレームレート
+    :return: (幅, 高さ, fps, bpp)。ソースの解像度が不明なら None
+    """
+    source_width, source_height = source_wh
+    if source_width <= 0 or source_height <= 0:
+        return None
+    source_fps = source_fps or 30.
+    top_height = min(max_height, source_height) if max_height > 0 else source_height
+    top_fps = min(max_fps, source_fps) if max_fps > 0 else source_fps
+
+    heights = sorted({int(h) for h in heights if 0 < h < top_height} | {top_height}, reverse=True)
+    rates = sorted({float(f) for f in fps_ladder if 0 < f < top_fps - .5} | {top_fps}, reverse=True)
+
+    candidates = []  # type: List[Tuple[float, int, int, float]]
+    for height in heights:
+        width = max(2, round(source_width * height / source_height / 2) * 2)
+        for fps in rates:
+            candidates.append((width * height * fps, width, height, fps))
+    fps_floor = min(fps_floor, top_fps)
+    candidates.sort(key=lambda c: (c[3] >= fps_floor, c[2], c[3]), reverse=True)
+
+    bits = bit_rate * 1000
+    for pixel_rate, width, height, fps in candidates:
+        if bits / pixel_rate >= bpp_floor:
+            return width, height, fps, bits / pixel_rate
+
+    pixel_rate, width, height, fps = min(candidates)
+    return width, height, fps, bits / pixel_rate
+
+
+def get_legacy_tiers(config) -> List[PresetTier]:
+    """設定画面の HQ / LQ / ULQ の項目から作る段階"""
+    return [
+        PresetTier(
+            "VP9 (HQ)", video_codec="libvpx-vp9", ext="webm", min_bit_rate=config.hq_bitrate,
+            width=config.hq_width, height=config.hq_height,
+            fps_cap=30 if config.hq_fps30 else 0, fps_cap_above=36,
+            audio_codec=None if config.hq_no_audio else "libopus",
+            encoder_params=config.hq_encoder_params, size_adjust=config.hq_size_adjust,
+        ),
+        PresetTier(
+            "H.264 (LQ)", video_codec="libx264", ext="mp4", min_bit_rate=config.ulq_bitrate,
+            width=config.lq_width, height=config.lq_height,
+            fps_cap=30 if config.lq_fps30 else 0, fps_cap_above=36,
+            audio_codec=None if config.lq_no_audio else "aac",
+            encoder_params=config.lq_encoder_params, size_adjust=config.lq_size_adjust,
+        ),
+        PresetTier(
+            "H.264 (ULQ)", video_codec="libx264", ext="mp4", min_bit_rate=float("-inf"),
+            width=config.ulq_width, height=config.ulq_height,
+            fps_cap=16 if config.ulq_fps16 else 0, fps_cap_above=20,
+            audio_codec=None if config.ulq_no_audio else "aac",
+            encoder_params=config.ulq_encoder_params, size_adjust=config.ulq_size_adjust,
+        ),
+    ]
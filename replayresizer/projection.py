@@ -0,0 +1,69 @@
+"""
+エンコード中のサイズ予測
+
+-progress の total_size と out_time_ms から最終サイズを外挿し、制限を確実に超えるエンコードを途中で打ち切るための判定を行います。
+判定のしきい値を調整できるよう、完了時には各時点の予測誤差をログに出力します。
+"""
+from logging import getLogger
+from typing import List, Tuple, Optional
+
+log = getLogger(__name__)
+
+CHECKPOINTS = (.1, .25, .5, .75)
+
+
+class SizeProjector(object):
+    def __init__(self, size_limit: float, *, min_progress: float = .15, margin: float = .03, stable_samples: int = 3):
+        """
+        :param size_limit: 制限サイズ (KB)
+        :param min_progress: 予測を信頼する最小の進捗
+        :param margin: 制限を超えたとみなす予測の超過率
+        :param stable_samples: 中断するまでに連続して超過と予測される回数
+        """
+        self.size_limit = size_limit
+        self.min_progress = min_progress
+        self.margin = margin
+        self.stable_samples = stable_samples
+        self.samples: List[Tuple[float, float, float]] = []  # (progress, size KB, projected KB)
+        self.aborted = False
+        self.cancelled = False  # 他の結果から不要と判断された
+        self._over_count = 0
+
+    @property
+    def projected(self) -> Optional[float]:
+        return self.samples[-1][2] if self.samples else None
+
+    def update(self, progress: float, size_kb: float) -> Optional[float]:
+        """進捗とサイズを記録し、予測サイズを返します"""
+        if progress <= 0 or size_kb <= 0:
+            return None
+
+        projected = size_kb / min(1., progress)
+        self.samples.append((progress, size_kb, projected))
+
+        if progress >= self.min_progress and projected > self.size_limit * (1 + self.margin):
+            self._over_count += 1
+        else:
+            self._over_count = 0
+        return projected
+
+    def should_abort(self) -> bool:
+        return not self.aborted and (self.cancelled or self._over_count >= self.stable_samples)
+
+    def cancel(self):
+        """次の進捗の更新でエンコードを中断させます"""
+        self.cancelled = True
+
+    def log_errors(self, actual_kb: float):
+        """各チェックポイントでの予測と実際のサイズの誤差をログに出力します"""
+        if not self.samples or actual_kb <= 0:
+            return
+
+        for checkpoint in CHECKPOINTS:
+            sample = next((s for s in self.samples if s[0] >= checkpoint), None)
+            if sample is None:
+                break
+            progress, _, projected = sample
+            error = (projected - actual_kb) / actual_kb * 100
+            log.info(f"size projection at {round(progress * 100)}%: {round(projected)} KB "
+                     f"(actual {round(actual_kb)} KB, error {error:+.1f}%)")
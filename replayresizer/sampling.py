@@ -0,0 +1,106 @@
+"""
+短い区間の試しエンコードによるサイズ予測
+
+再生時間全体に等間隔で配置した短い区間 (既定では 2秒 x 5) を本番と同じ設定で並列にエンコードし、
+映像の1秒あたりのバイト数から、本番の映像ビットレートを予測します。
+区間は映像のみで、区間ごとのコンテナのオーバーヘッドは差し引かないため、予測はわずかに大きめになります。
+"""
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from typing import List, Tuple, Callable, Optional
+
+from replayresizer.tools import subprocess_startup_info, get_file_size
+
+log = getLogger(__name__)
+
+
+class SamplePrediction(object):
+    def __init__(self, video_rate: float, seconds: float, excerpts: int):
+        """
+        :param video_rate: 試しエンコードの映像ビットレート (kbps)
+        :param seconds: 予測にかかった時間
+        """
+        self.video_rate = video_rate
+        self.seconds = seconds
+        self.excerpts = excerpts
+
+    def __repr__(self):
+        return f"<{type(self).__name__} video_rate={round(self.video_rate, 2)}kbps " \
+               f"excerpts={self.excerpts} seconds={round(self.seconds, 2)}>"
+
+
+def plan_excerpts(duration: float, count: int, length: float) -> List[Tuple[float, float]]:
+    """
+    再生時間を count 等分した各範囲の中央の区間 (開始秒, 終了秒)
+
+    区間の合計が再生時間の半分を超える短い動画では、本番と手間が変わらないため空を返します
+    """
+    if count <= 0 or length <= 0 or duration < count * length * 2:
+        return []
+    step = duration / count
+    return [(step * index + (step - length) / 2, step * index + (step + length) / 2) for index in range(count)]
+
+
+def predict_video_rate(build_commands: Callable[[Tuple[float, float], Path, Path], List[List[str]]],
+                       excerpts: List[Tuple[float, float]], ext: str, *, workers: int = 0,
+                       work_dir: Optional[Path] = None,
+                       on_started: Optional[Callable[[subprocess.Popen], None]] = None,
+                       lease_threads: Optional[Callable[[int], int]] = None,
+                       release_threads: Optional[Callable[[int], None]] = None) -> Optional[SamplePrediction]:
+    """
+    :param build_commands: (区間, 出力ファイル, passlog) から、区間をエンコードするコマンドの列 (2パスなら2つ)
+    :param workers: 同時に実行する区間の数。0 なら全区間
+    :param work_dir: 一時フォルダを作る場所。省略時はシステムの一時フォルダ
+    :param on_started: ffmpeg の起動直後に呼ばれます
+    :param lease_threads: 同時に実行する区間の数を受け取り、区間ごとの ffmpeg のスレッド数を返します (0 なら指定しない)
+    :param release_threads: 区間のエンコードを終えたときに、lease_threads の戻り値を返します
+    :return: いずれかの区間のエンコードに失敗したら None
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="replayresizer_", dir=work_dir))
+    start = time.perf_counter()
+    workers = workers or len(excerpts)
+
+    def _run(index: int) -> Optional[float]:
+        output = work_dir / f"sample_{index:03}.{ext}"
+        passlog = work_dir / f"sample_{index:03}"
+        threads = lease_threads(min(workers, len(excerpts))) if lease_threads else 0
+        try:
+            for command_args in build_commands(excerpts[index], output, passlog):
+                if threads:
+                    command_args = command_args[:-1] + ["-threads", str(threads)] + command_args[-1:]
+                log.debug("sample command_line: '%s'", "' '".join(command_args))
+                p = subprocess.Popen(
+                    command_args,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    stdin=subprocess.PIPE,
+                    startupinfo=subprocess_startup_info()
+                )
+                if on_started:
+                    on_started(p)
+                if p.wait() != 0:
+                    log.warning(f"sample encode returned {p.returncode} code! (excerpt {index})")
+                    return None
+        finally:
+            if release_threads:
+                release_threads(threads)
+        return get_file_size(output) if output.is_file() else None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sizes = list(pool.map(_run, range(len(excerpts))))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not sizes or any(size is None for size in sizes):
+        return None
+
+    seconds = sum(end - begin for begin, end in excerpts)
+    prediction = SamplePrediction(sum(sizes) * 1024 * 8 / 1000 / seconds, time.perf_counter() - start, len(sizes))
+    log.debug(f"predict_video_rate: {prediction!r}")
+    return prediction
@@ -0,0 +1,117 @@
+"""
+入力フォルダの未処理ファイルの検出
+
+処理済みのファイルを (パス, サイズ, 更新日時 ns) で索引に保存しておき、起動時や監視の再開時に
+os.scandir で一覧した結果と比較して、新しいファイルと変更されたファイルだけを返します。
+"""
+import json
+import os
+import threading
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, List, Tuple, Callable
+
+log = getLogger(__name__)
+
+
+class InputIndex(object):
+    def __init__(self, path: Path):
+        self._path = path
+        self._entries: Dict[str, Tuple[int, int]] = {}  # path -> (size, mtime_ns)
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not self._path.is_file():
+            return
+
+        try:
+            with self._path.open(encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            log.warning(f"failed to load input index: {self._path}", exc_info=True)
+            return
+
+        with self._lock:
+            self._entries = {key: tuple(value) for key, value in data.items()
+                             if isinstance(value, list) and len(value) == 2}
+        log.debug(f"input index loaded: {len(self._entries)} files")
+
+    def save(self):
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        with self._lock:
+            try:
+                with tmp.open("w", encoding="utf-8") as file:
+                    json.dump(self._entries, file, ensure_ascii=False)
+                os.replace(tmp, self._path)
+            except OSError:
+                log.warning(f"failed to save input index: {self._path}", exc_info=True)
+
+    def add(self, path: Path, *, save=True):
+        try:
+            path = path.resolve()
+            stat = path.stat()
+        except OSError:
+            return
+
+        with self._lock:
+            self._entries[str(path)] = (stat.st_size, stat.st_mtime_ns)
+        if save:
+            self.save()
+
+    def has_directory(self, directory: Path) -> bool:
+        """directory を一度でもスキャンしたか"""
+        with self._lock:
+            return str(directory.resolve()) in self._entries
+
+    def mark_directory(self, directory: Path):
+        with self._lock:
+            self._entries[str(directory.resolve())] = (-1, -1)
+
+    def scan(self, directory: Path, check_filename: Callable[[Path], bool],
+             is_order: Callable[[Path], bool]) -> Tuple[List[Path], List[Path]]:
+        """
+        directory を一覧し、索引と比較します
+
+        索引にあり、既に存在しないファイルは索引から削除します
+
+        :return: (オーダースクリプト, 新しいか変更された対象ファイル)
+        """
+        directory = directory.resolve()
+        orders = []  # type: List[Path]
+        files = []  # type: List[Path]
+        seen = set()
+
+        with os.scandir(directory) as it:
+            for item in it:
+                try:
+                    if not item.is_file():
+                        continue
+                    path = directory / item.name
+                    seen.add(str(path))
+
+                    if is_order(path):
+                        orders.append(path)
+                        continue
+
+                    if not check_filename(path):
+                        continue
+
+                    stat = item.stat()
+                except OSError:
+                    continue
+
+                with self._lock:
+                    known = self._entries.get(str(path))
+                if known != (stat.st_size, stat.st_mtime_ns):
+                    files.append(path)
+
+        prefix = str(directory)
+        with self._lock:
+            removed = [key for key in self._entries if os.path.dirname(key) == prefix and key not in seen]
+            for key in removed:
+                del self._entries[key]
+        if removed:
+            self.save()
+
+        files.sort(key=lambda p: p.name)
+        return orders, files
@@ -0,0 +1,84 @@
+"""
+分割エンコード用の補助関数
+
+ソースをキーフレーム位置で分割して各区間を並列にエンコードし、concat demuxer で無劣化結合します。
+"""
+import bisect
+import subprocess
+from logging import getLogger
+from pathlib import Path
+from typing import List, Tuple, Optional, Callable
+
+from replayresizer.errors import ProcessCodeError
+from replayresizer.tools import subprocess_startup_info
+
+log = getLogger(__name__)
+
+
+def get_keyframe_times(ffprobe_command: str, path: Path, *,
+                       on_started: Optional[Callable[[subprocess.Popen], None]] = None) -> List[float]:
+    """
+    映像ストリームのキーフレーム位置 (秒) を返します。パケットを読むだけでデコードはしません
+
+    :param on_started: ffprobe の起動直後に呼ばれます
+    """
+    p = subprocess.Popen(
+        [ffprobe_command, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", str(path)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        startupinfo=subprocess_startup_info()
+    )
+    if on_started:
+        on_started(p)
+
+    times = []
+    for line in p.stdout:
+        pts_time, _, flags = line.decode(errors="ignore").strip().partition(",")
+        if "K" in flags:
+            try:
+                times.append(float(pts_time))
+            except ValueError:
+                pass
+
+    if p.wait() != 0:
+        raise ProcessCodeError(p)
+
+    times.sort()
+    return times
+
+
+def plan_segments(keyframes: List[float], duration: float, count: int,
+                  min_length: float = 10.) -> List[Tuple[float, float]]:
+    """
+    再生時間を count 個に等分した位置に最も近いキーフレームで区切ります
+
+    :return: [(開始秒, 終了秒), ...]  分割できなければ空のリスト
+    """
+    count = min(count, int(duration // max(1., min_length)))
+    if count < 2 or not keyframes:
+        return []
+
+    cuts = []
+    for i in range(1, count):
+        target = duration * i / count
+        index = bisect.bisect_left(keyframes, target)
+        candidates = keyframes[max(0, index - 1):index + 1]
+        cut = min(candidates, key=lambda t: abs(t - target))
+
+        if cut - (cuts[-1] if cuts else 0.) < min_length or duration - cut < min_length:
+            continue
+        cuts.append(cut)
+
+    if not cuts:
+        return []
+
+    points = [0.] + cuts + [duration]
+    return list(zip(points[:-1], points[1:]))
+
+
+def write_concat_list(files: List[Path], list_path: Path):
+    with list_path.open("w", encoding="utf-8") as f:
+        for file in files:
+            escaped = str(file.resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
@@ -0,0 +1,143 @@
+"""
+録画の完了検出
+
+ファイルのサイズと更新日時を一定間隔で調べ、指定した時間変化せず、書き込み中のプロセスが
+ファイルを開いていない (排他で開ける) と判断できた時点で完了とみなします。
+"""
+import os
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Dict, Tuple, Optional
+
+from replayresizer.tools import is_windows
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = getLogger(__name__)
+
+
+def is_write_locked(path: Path) -> bool:
+    """
+    他のプロセスが書き込み中か
+
+    Windows では書き込みの共有を許可せずに開かれているファイルを、書き込みモードで開けないことを利用します
+    (開くだけで内容や名前は変更しないため、監視に余計なイベントが発生しません)。
+    それ以外では flock で排他ロックを試します (書き込み側がロックしていなければ常に False)
+    """
+    try:
+        if is_windows():
+            if not os.access(path, os.W_OK):
+                return False  # 読み取り専用のファイル
+            with open(path, "r+b"):
+                pass
+            return False
+
+        if fcntl is None:
+            return False
+
+        with open(path, "rb") as file:
+            try:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        return False
+
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+
+class StabilityWatcher(object):
+    def __init__(self, on_stable: Callable[[Path], None], *,
+                 stable_seconds: float = 1., poll_interval: float = .25):
+        """
+        :param on_stable: 完了したファイルで、監視スレッドから呼ばれます
+        """
+        self.on_stable = on_stable
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self._files: Dict[Path, Tuple[Optional[Tuple[int, int]], float, float]] = {}  # (size, mtime_ns), 変化した時刻, 登録時刻
+        self._condition = threading.Condition()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._files)
+
+    def watch(self, path: Path):
+        """path を監視します。監視中なら安定の待ち時間をやり直します"""
+        now = time.monotonic()
+        with self._condition:
+            added = self._files.get(path, (None, now, now))[2]
+            self._files[path] = (None, now, added)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll_loop, name="StabilityWatcher", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def discard(self, path: Path):
+        with self._condition:
+            self._files.pop(path, None)
+
+    def clear(self):
+        with self._condition:
+            self._files.clear()
+
+    def _poll_loop(self):
+        while True:
+            with self._condition:
+                while not self._files:
+                    self._condition.wait()
+                files = list(self._files.items())
+
+            for path, (last, changed, added) in files:
+                self._check(path, last, changed, added)
+
+            time.sleep(self.poll_interval)
+
+    def _check(self, path: Path, last: Optional[Tuple[int, int]], changed: float, added: float):
+        now = time.monotonic()
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            log.debug(f"stability: removed before completion: {path}")
+            self.discard(path)
+            return
+        except OSError:
+            return
+
+        state = (stat.st_size, stat.st_mtime_ns)
+        if last is None:
+            # 初回は更新日時からの経過時間を安定している時間とみなす (既に書き終わったファイルを待たない)
+            changed = now - max(0., time.time() - stat.st_mtime)
+            with self._condition:
+                if path in self._files:
+                    self._files[path] = (state, changed, added)
+
+        elif state != last:
+            with self._condition:
+                if path in self._files:
+                    self._files[path] = (state, now, added)
+            return
+
+        if now - changed < self.stable_seconds or is_write_locked(path):
+            return
+
+        with self._condition:
+            if self._files.pop(path, None) is None:
+                return
+
+        log.info(f"recording completed: {path.name} ({round(now - added, 2)}s after detection)")
+        try:
+            self.on_stable(path)
+        except (Exception,):
+            log.exception("exception in on_stable")
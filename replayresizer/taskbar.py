@@ -16,9 +16,9 @@ class TaskBar(wx.adv.TaskBarIcon):
 
         pass
 
-    def show(self, *, progress: int = None):
+    def show(self, *, progress: int = None, tooltip: str = None):
         if progress is None:
-            self.SetIcon(self._icon, self.title)
+            self.SetIcon(self._icon, tooltip or self.title)
             return
 
         progress = max(0, min(100, progress))
@@ -88,6 +88,6 @@ class TaskBar(wx.adv.TaskBarIcon):
         icon = wx.Icon()
         icon.CopyFromBitmap(bmp)
 
-        self.SetIcon(icon, self.title)
+        self.SetIcon(icon, tooltip or self.title)
         del gc
         del dc
@@ -11,7 +11,7 @@ import sys
 
 __all__ = ["get_file_size", "get_file_size_label", "get_bit_rate_label", "open_explorer",
            "colour_to_color16", "color16_to_colour", "get_codec_name", "is_windows",
-           "subprocess_startup_info", "WithLock", "BackgroundTask",
+           "subprocess_startup_info", "suspend_process", "resume_process", "WithLock", "BackgroundTask",
            "IOLogger"
            ]
 
@@ -62,6 +62,37 @@ def subprocess_startup_info():
     return startup_info
 
 
+def suspend_process(process: subprocess.Popen) -> bool:
+    """プロセスを一時停止します (Windows: NtSuspendProcess, それ以外: SIGSTOP)"""
+    return _signal_process(process, resume=False)
+
+
+def resume_process(process: subprocess.Popen) -> bool:
+    return _signal_process(process, resume=True)
+
+
+def _signal_process(process: subprocess.Popen, *, resume: bool) -> bool:
+    if process.poll() is not None:
+        return False
+
+    try:
+        if is_windows():
+            import ctypes
+            ntdll = ctypes.WinDLL("ntdll")
+            func = ntdll.NtResumeProcess if resume else ntdll.NtSuspendProcess
+            # noinspection PyProtectedMember,PyUnresolvedReferences
+            return func(int(process._handle)) == 0
+
+        import signal
+        os.kill(process.pid, signal.SIGCONT if resume else signal.SIGSTOP)
+        return True
+
+    except (OSError, AttributeError):
+        getLogger(__name__).warning(f"failed to {'resume' if resume else 'suspend'} process {process.pid}",
+                                    exc_info=True)
+        return False
+
+
 def color16_to_colour(color: int):
     value = ("000000" + hex(color)[2:])[-6:]
     try:
@@ -107,10 +138,14 @@ class WithLock:
 
 
 class BackgroundTask(threading.Thread):
-    def __init__(self, task, done):
+    def __init__(self, task, done, *, call_after=None):
+        """
+        :param call_after: done をメインスレッドで呼び出す関数。省略すると wx.CallAfter
+        """
         threading.Thread.__init__(self, daemon=True)
         self.task = task
         self.done = done
+        self.call_after = call_after
 
     def run(self) -> None:
         try:
@@ -119,8 +154,10 @@ class BackgroundTask(threading.Thread):
             getLogger(__name__).exception("exception in background task")
             return
 
-        from wx import CallAfter
-        CallAfter(lambda: self.done(result))
+        call_after = self.call_after
+        if call_after is None:
+            from wx import CallAfter as call_after
+        call_after(self.done, result)
 
 
 class IOLogger(io.StringIO):
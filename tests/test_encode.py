@@ -0,0 +1,39 @@
+"""エンコードの開始前に取り消されたエントリ"""
+from pathlib import Path
+
+import pytest
+
+from replayresizer.entry import ResizeEntry
+from replayresizer.headless import HeadlessResizer
+from replayresizer.journal import JobState
+
+
+@pytest.fixture
+def resizer(tmp_path: Path) -> HeadlessResizer:
+    main = HeadlessResizer(tmp_path, config_file=tmp_path / "appconfig.json")
+    main.config.job_journal = False
+    main.config.output_directory = str(tmp_path / "out")
+    main.config.sample_predict = True
+    return main
+
+
+def _fail(*_):
+    pytest.fail("called after the entry was cancelled")
+
+
+def test_skipped_entry_is_not_planned_or_sampled(resizer: HeadlessResizer, tmp_path: Path,
+                                                 monkeypatch: pytest.MonkeyPatch):
+    source = tmp_path / "replay.mp4"
+    source.write_bytes(b"\0" * 16)
+    entry = ResizeEntry(source, size_limit=resizer.config.size_limit)
+    entry.ext = "mp4"
+    entry.skipped = True
+    states = []
+    monkeypatch.setattr(resizer, "plan_encode_segments", _fail)
+    monkeypatch.setattr(resizer, "apply_sample_prediction", _fail)
+    monkeypatch.setattr(resizer, "set_job_state", lambda e, state, **_: states.append(state))
+
+    resizer.encode(entry)
+
+    assert states == [JobState.SKIPPED]
+    assert entry.work_dir is None
@@ -0,0 +1,76 @@
+"""watchdog のイベントの絞り込みとまとめ"""
+import re
+import threading
+from pathlib import Path
+
+import pytest
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, DirCreatedEvent
+
+from replayresizer.events import EventCoalescer
+
+
+class _Handler(object):
+    def __init__(self):
+        self.events = []  # type: list[tuple[str, str]]
+        self.delivered = threading.Event()
+
+    def on_created(self, event):
+        self.events.append(("created", event.src_path))
+        self.delivered.set()
+
+    def on_modified(self, event):
+        self.events.append(("modified", event.src_path))
+        self.delivered.set()
+
+
+@pytest.fixture
+def handler() -> _Handler:
+    return _Handler()
+
+
+@pytest.fixture
+def coalescer(handler: _Handler, tmp_path: Path):
+    coalescer = EventCoalescer(
+        handler, tmp_path,
+        check_filename=lambda path: not path.name.startswith("."),
+        is_order=lambda path: path.suffix == ".order",
+        targets=[re.compile(r"\.mp4$")], delay=.05,
+    )
+    yield coalescer
+    coalescer.stop()
+
+
+def test_modification_storm_is_delivered_once(coalescer: EventCoalescer, handler: _Handler, tmp_path: Path):
+    path = str(tmp_path / "replay.mp4")
+    coalescer.dispatch(FileCreatedEvent(path))
+    for _ in range(50):
+        coalescer.dispatch(FileModifiedEvent(path))
+
+    assert handler.delivered.wait(2)
+    assert handler.events == [("created", path)]
+    assert coalescer.coalesced_events == 50
+    assert coalescer.delivered_events == 1
+
+
+def test_filtered_events(coalescer: EventCoalescer, handler: _Handler, tmp_path: Path):
+    coalescer.dispatch(FileCreatedEvent(str(tmp_path / "replay.mkv")))  # 対象外の拡張子
+    coalescer.dispatch(FileCreatedEvent(str(tmp_path / ".replay.mp4")))  # 除外パターン
+    coalescer.dispatch(DirCreatedEvent(str(tmp_path / "folder.mp4")))
+    coalescer.dispatch(FileModifiedEvent(str(tmp_path / "old.mp4")))  # 作成を検出していないファイル
+
+    assert coalescer.filtered_events == 4
+    assert not handler.delivered.wait(.2)
+
+
+def test_order_is_delivered_as_modified(coalescer: EventCoalescer, handler: _Handler, tmp_path: Path):
+    path = str(tmp_path / "resize.order")
+    coalescer.dispatch(FileModifiedEvent(path))
+    coalescer.dispatch(FileModifiedEvent(path))
+
+    assert handler.delivered.wait(2)
+    assert handler.events == [("modified", path)]
+
+
+def test_suffix_prefilter_only_for_suffix_patterns():
+    assert EventCoalescer.get_target_suffixes([re.compile(r"\.mp4$"), re.compile(r"\.mkv$")]) == {".mp4", ".mkv"}
+    assert EventCoalescer.get_target_suffixes([re.compile(r"^replay")]) is None
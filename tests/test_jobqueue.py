@@ -0,0 +1,95 @@
+"""待機キューの優先度順の取り出し、削除と索引"""
+import time
+from pathlib import Path
+
+import pytest
+
+from replayresizer.entry import ResizeEntry
+from replayresizer.jobqueue import JobQueue
+
+
+def _entry(name: str, file_key=None) -> ResizeEntry:
+    entry = ResizeEntry(Path(name), size_limit=1)
+    entry.file_key = file_key
+    return entry
+
+
+def test_pop_by_priority_then_insertion_order():
+    queue = JobQueue()
+    a, b, c = _entry("a.mp4"), _entry("b.mp4"), _entry("c.mp4")
+    queue.push(a, (2, 0.))
+    queue.push(b, (1, 5.))
+    queue.push(c, (2, 0.))
+
+    assert [e.source.name for e in queue] == ["b.mp4", "a.mp4", "c.mp4"]
+    assert [queue.pop() for _ in range(3)] == [b, a, c]
+    assert not queue
+    assert not queue.waits  # 待ち時間は開始した時点で記録する
+
+
+def test_wait_counts_from_first_push_when_requeued():
+    queue = JobQueue()
+    a = _entry("a.mp4")
+    a.queued_at = time.monotonic() - 10.
+    queue.push(a, (0, 0.))
+    queue.push(queue.pop(), (0, 0.))  # 開始できずにキューに戻した
+
+    queue.record_wait(queue.pop())
+
+    assert len(queue.waits) == 1
+    assert queue.waits[0] >= 10.
+
+
+def test_removed_entry_is_skipped_on_pop():
+    queue = JobQueue()
+    a, b = _entry("a.mp4", ("dev", 1)), _entry("b.mp4", ("dev", 2))
+    queue.push(a, (0, 0.))
+    queue.push(b, (1, 0.))
+
+    assert queue.remove(a)
+    assert not queue.remove(a)
+    assert len(queue) == 1
+    assert queue.peek(2) == [b]
+    assert queue.pop() is b
+    with pytest.raises(IndexError):
+        queue.pop()
+
+
+def test_heap_is_cleared_when_last_entry_is_removed():
+    queue = JobQueue()
+    a = _entry("a.mp4")
+    queue.push(a, (0, 0.))
+    queue.remove(a)
+
+    assert queue._heap == []
+
+
+def test_index_follows_push_pop_and_remove():
+    queue = JobQueue()
+    a, b = _entry("a.mp4", ("dev", 1)), _entry("b.mp4", ("dev", 2))
+    queue.push(a, (0, 0.))
+    queue.push(b, (0, 0.))
+
+    assert queue.find(("dev", 1)) is a
+    assert queue.find_path(Path("b.mp4")) is b
+
+    queue.remove(a)
+    assert queue.find(("dev", 1)) is None
+    assert queue.find_path(Path("a.mp4")) is None
+
+    assert queue.pop() is b
+    assert queue.find(("dev", 2)) is None
+    assert queue.find_path(Path("b.mp4")) is None
+
+
+def test_same_path_can_be_queued_again_after_remove():
+    queue = JobQueue()
+    old, new = _entry("a.mp4", ("dev", 1)), _entry("a.mp4", ("dev", 9))
+    queue.push(old, (0, 0.))
+    queue.remove(old)
+    queue.push(new, (0, 0.))
+
+    assert queue.find_path(Path("a.mp4")) is new
+    assert queue.find(("dev", 9)) is new
+    assert queue.pop() is new  # 削除済みの old はヒープに残っていても返さない
+    assert not queue
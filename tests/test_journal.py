@@ -0,0 +1,91 @@
+"""ジョブのジャーナルと、前回終了時に未完了だったジョブの再開"""
+import json
+from pathlib import Path
+
+from replayresizer.entry import ResizeEntry
+from replayresizer.headless import HeadlessResizer
+from replayresizer.journal import JobJournal, JobState
+
+
+def _write_journal(path: Path, *records: dict):
+    with path.open("w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+
+
+def _read_journal(path: Path) -> list:
+    with path.open(encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def test_open_compacts_finished_jobs(tmp_path: Path):
+    path = tmp_path / "jobjournal.jsonl"
+    _write_journal(
+        path,
+        dict(id="done", state=JobState.QUEUED, source="a.mp4"),
+        dict(id="done", state=JobState.ENCODING, output="a.webm"),
+        dict(id="done", state=JobState.DONE, size=100),
+        dict(id="open", state=JobState.QUEUED, source="b.mp4", size_limit=1),
+        dict(id="open", state=JobState.ENCODING, output="b.webm"),
+        dict(id="lost", state=JobState.ENCODING),  # 追加の記録が無いジョブ
+    )
+    with path.open("a", encoding="utf-8") as file:
+        file.write('{"id": "open", "state": "do')  # 書き込み途中で終了した行
+
+    journal = JobJournal(path)
+    try:
+        pending = journal.open()
+    finally:
+        journal.close()
+
+    assert [(job["id"], job["state"], job["source"], job["output"]) for job in pending] == \
+           [("open", JobState.ENCODING, "b.mp4", "b.webm")]
+    assert _read_journal(path) == pending
+
+
+def test_written_states_are_merged_on_open(tmp_path: Path):
+    path = tmp_path / "jobjournal.jsonl"
+    entry = ResizeEntry(tmp_path / "replay.mp4", size_limit=1)
+    journal = JobJournal(path, flush_interval=0.)
+    journal.open()
+    journal.write(entry, JobState.QUEUED)
+    journal.write(entry, JobState.ANALYZING)
+    journal.close()
+    journal.write(entry, JobState.DONE)  # 閉じた後は書き込まない
+
+    journal = JobJournal(path)
+    try:
+        pending = journal.open()
+    finally:
+        journal.close()
+
+    assert len(pending) == 1
+    assert pending[0]["id"] == entry.job_id
+    assert pending[0]["state"] == JobState.ANALYZING
+    assert pending[0]["source"] == str(entry.source.resolve())
+
+
+def test_resume_deletes_partial_output_and_work_dir(tmp_path: Path):
+    source = tmp_path / "replay.mp4"
+    source.write_bytes(b"\0" * 16)
+    output = tmp_path / "replay.webm"
+    output.write_bytes(b"\0")
+    work_dir = tmp_path / "replayresizer_crashed"
+    work_dir.mkdir()
+    (work_dir / "ffmpeg2pass-0.log").write_text("")
+    _write_journal(
+        tmp_path / "jobjournal.jsonl",
+        dict(id="a", state=JobState.QUEUED, source=str(source), size_limit=1),
+        dict(id="a", state=JobState.ENCODING, output=str(output), work_dir=str(work_dir)),
+    )
+
+    resizer = HeadlessResizer(tmp_path, config_file=tmp_path / "appconfig.json")
+    resizer.pause_menu(paused=True)  # キューに残す
+    try:
+        resizer.resume_jobs()
+    finally:
+        resizer.journal.close()
+
+    assert not output.exists()
+    assert not work_dir.exists()
+    assert [entry.job_id for entry in resizer.entries] == ["a"]
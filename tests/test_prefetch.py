@@ -0,0 +1,60 @@
+"""待機中に先読み解析したエントリの開始"""
+from pathlib import Path
+
+import pytest
+
+from replayresizer.entry import ResizeEntry, MediaInfo
+from replayresizer.headless import HeadlessResizer
+
+
+@pytest.fixture
+def resizer(tmp_path: Path) -> HeadlessResizer:
+    main = HeadlessResizer(tmp_path, config_file=tmp_path / "appconfig.json")
+    main.config.job_journal = False
+    return main
+
+
+def _run_until_idle(resizer: HeadlessResizer, tasks: list):
+    while tasks or not resizer._calls.empty():
+        while tasks:
+            tasks.pop(0).join()
+        while not resizer._calls.empty():
+            resizer._calls.get()()
+
+
+def test_prefetched_entry_is_not_analyzed_again(resizer: HeadlessResizer, tmp_path: Path,
+                                                monkeypatch: pytest.MonkeyPatch):
+    source = tmp_path / "replay.mp4"
+    source.write_bytes(b"\0" * 4096)
+    entry = ResizeEntry(source, size_limit=1)
+    entry.bit_rate = 1000
+    analyzed = []
+    applied = []
+    tasks = []
+    start_background = resizer.start_background
+
+    def _start_background(task, done=None):
+        tasks.append(start_background(task, done))
+        return tasks[-1]
+
+    def _analyze_entry(e: ResizeEntry, **_):
+        analyzed.append(e)
+        e.media_info = MediaInfo(duration="10.0", width=1920, height=1080)
+
+    monkeypatch.setattr(resizer, "start_background", _start_background)
+    monkeypatch.setattr(resizer, "_analyze_entry", _analyze_entry)
+    monkeypatch.setattr(resizer, "check_ffmpeg", lambda: True)
+    monkeypatch.setattr(resizer, "apply_encode_params", applied.append)
+    monkeypatch.setattr(resizer, "encode", lambda e: None)
+
+    resizer.entries.push(entry, (0, 0.))
+    resizer.prefetch_entries()  # 待機中に先読み解析する
+    _run_until_idle(resizer, tasks)
+    assert analyzed == [entry]
+    assert entry.analyzed
+
+    assert resizer.process(resizer.entries.pop())
+    _run_until_idle(resizer, tasks)
+
+    assert analyzed == [entry]  # 開始時には解析しない
+    assert applied == [entry]
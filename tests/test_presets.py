@@ -0,0 +1,78 @@
+"""プリセットの段階の選択と、解像度・フレームレートの自動選択"""
+from replayresizer.presets import PresetTier, PresetTable, select_ladder_rung
+
+
+def _table() -> PresetTable:
+    return PresetTable([
+        PresetTier("low", video_codec="libx264", ext="mp4", min_bit_rate=float("-inf")),
+        PresetTier("high", video_codec="libvpx-vp9", ext="webm", min_bit_rate=1200),
+        PresetTier("mid", video_codec="libx264", ext="mp4", min_bit_rate=260),
+    ])
+
+
+def test_select_tier_by_min_bit_rate():
+    table = _table()
+
+    assert [t.name for t in table.tiers] == ["high", "mid", "low"]
+    assert table.select(5000).name == "high"
+    assert table.select(1200).name == "high"
+    assert table.select(1199.9).name == "mid"
+    assert table.select(260).name == "mid"
+    assert table.select(100).name == "low"
+    assert table.select(-50).name == "low"
+
+
+def test_select_falls_back_to_lowest_tier():
+    table = PresetTable([PresetTier("only", video_codec="libx264", ext="mp4", min_bit_rate=500)])
+
+    assert table.select(100).name == "only"
+
+
+def test_frames_capped_above_threshold():
+    tier = PresetTier("hq", video_codec="libx264", ext="mp4", fps_cap=30, fps_cap_above=36)
+
+    assert tier.get_frames(60.) == 30
+    assert tier.get_frames(30.) == 0
+    assert PresetTier("any", video_codec="libx264", ext="mp4").get_frames(60.) == 0
+
+
+def test_ladder_keeps_source_when_bits_are_enough():
+    rung = select_ladder_rung(8000, (1920, 1080), 60., heights=[1080, 720, 480], fps_ladder=[60, 30],
+                              bpp_floor=.05)
+
+    assert rung[:3] == (1920, 1080, 60.)
+
+
+def test_ladder_prefers_resolution_over_frame_rate():
+    # 1280x720@60 は bpp 0.043、1280x720@30 は 0.087
+    rung = select_ladder_rung(2400, (1920, 1080), 60., heights=[1080, 720, 480], fps_ladder=[60, 30],
+                              bpp_floor=.05)
+
+    assert rung[:3] == (1280, 720, 30.)
+    assert rung[3] >= .05
+
+
+def test_ladder_uses_low_frame_rate_only_below_floor():
+    rung = select_ladder_rung(400, (1920, 1080), 60., heights=[1080, 720, 480], fps_ladder=[60, 30, 15],
+                              bpp_floor=.05, fps_floor=30)
+
+    assert rung[1:3] == (480, 15.)
+
+
+def test_ladder_respects_tier_limits():
+    rung = select_ladder_rung(100000, (1920, 1080), 59.94, heights=[1080, 720], fps_ladder=[60, 30],
+                              bpp_floor=.05, max_height=720, max_fps=30.)
+
+    assert rung[:3] == (1280, 720, 30.)
+
+
+def test_ladder_without_source_size():
+    assert select_ladder_rung(1000, (0, 0), 30., heights=[720], fps_ladder=[30], bpp_floor=.05) is None
+
+
+def test_ladder_returns_smallest_when_nothing_fits():
+    rung = select_ladder_rung(50, (1920, 1080), 60., heights=[1080, 480], fps_ladder=[60, 30, 15],
+                              bpp_floor=.05)
+
+    assert rung[1:3] == (480, 15.)
+    assert rung[3] < .05
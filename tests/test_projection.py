@@ -0,0 +1,41 @@
+"""エンコード中のサイズ予測と中断の判定"""
+from replayresizer.projection import SizeProjector
+
+
+def test_projects_final_size_from_progress():
+    projector = SizeProjector(1000)
+
+    assert projector.update(0., 10.) is None
+    assert projector.update(.5, 400.) == 800.
+    assert projector.projected == 800.
+
+
+def test_aborts_after_stable_overshoot():
+    projector = SizeProjector(1000, min_progress=.15, margin=.03, stable_samples=3)
+
+    projector.update(.1, 200.)  # 予測 2000 KB だが、まだ信頼しない
+    assert not projector.should_abort()
+
+    projector.update(.2, 240.)
+    projector.update(.3, 360.)
+    assert not projector.should_abort()
+    projector.update(.4, 480.)
+    assert projector.should_abort()
+
+
+def test_overshoot_count_resets_within_margin():
+    projector = SizeProjector(1000, min_progress=.1, margin=.03, stable_samples=2)
+
+    projector.update(.2, 220.)  # 1100 KB
+    projector.update(.4, 410.)  # 1025 KB (余裕の範囲内)
+    projector.update(.6, 660.)  # 1100 KB
+    assert not projector.should_abort()
+
+
+def test_cancel_aborts_once():
+    projector = SizeProjector(1000)
+    projector.cancel()
+
+    assert projector.should_abort()
+    projector.aborted = True
+    assert not projector.should_abort()
@@ -0,0 +1,30 @@
+"""分割エンコードの区間の計画"""
+from replayresizer.segments import plan_segments
+
+
+def test_cuts_at_nearest_keyframes():
+    keyframes = [0., 9., 31., 59., 62., 88., 118.]
+
+    assert plan_segments(keyframes, 120., 4) == [(0., 31.), (31., 59.), (59., 88.), (88., 120.)]
+
+
+def test_segments_cover_whole_duration():
+    keyframes = [float(t) for t in range(0, 600, 2)]
+    segments = plan_segments(keyframes, 600., 5)
+
+    assert len(segments) == 5
+    assert segments[0][0] == 0. and segments[-1][1] == 600.
+    assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
+
+
+def test_short_segments_are_merged():
+    # 60秒付近のキーフレームが無く、近すぎる区切りは飛ばす
+    keyframes = [0., 25., 28., 95.]
+
+    assert plan_segments(keyframes, 120., 4) == [(0., 28.), (28., 95.), (95., 120.)]
+
+
+def test_no_split_when_too_short_or_no_keyframes():
+    assert plan_segments([0., 5., 10., 15.], 15., 4) == []
+    assert plan_segments([], 600., 4) == []
+    assert plan_segments([0., 300.], 600., 1) == []
@@ -0,0 +1,120 @@
+"""一時停止したエントリの再開と、一時停止したまま終了したエントリの状態"""
+from pathlib import Path
+
+import pytest
+
+from replayresizer.entry import ResizeEntry, PopupMessage
+from replayresizer.headless import HeadlessResizer
+
+
+@pytest.fixture
+def resizer(tmp_path: Path) -> HeadlessResizer:
+    main = HeadlessResizer(tmp_path, config_file=tmp_path / "appconfig.json")
+    main.config.job_journal = False
+    return main
+
+
+@pytest.fixture
+def entry(resizer: HeadlessResizer, tmp_path: Path) -> ResizeEntry:
+    source = tmp_path / "replay.mp4"
+    source.write_bytes(b"\0" * 16)
+    entry = ResizeEntry(source, size_limit=resizer.config.size_limit)
+    resizer.active_entries.append(entry)
+    assert resizer.suspend_entry(entry, force=True)
+    assert entry.is_encoding and not entry.resume_event.is_set()
+    return entry
+
+
+def _run_calls(resizer: HeadlessResizer):
+    while not resizer._calls.empty():
+        resizer._calls.get()()
+
+
+def test_failed_while_suspended(resizer: HeadlessResizer, entry: ResizeEntry):
+    resizer._on_failed(entry, PopupMessage("failed"))
+
+    assert not entry.suspended
+    assert entry.resume_event.is_set()
+    assert not entry.is_encoding
+    _run_calls(resizer)
+    assert entry not in resizer.active_entries
+
+
+def test_finished_while_suspended(resizer: HeadlessResizer, entry: ResizeEntry):
+    resizer._on_finished(entry)
+
+    assert not entry.suspended
+    assert entry.resume_event.is_set()
+    assert not entry.is_encoding
+    assert entry not in resizer.active_entries
+
+
+def test_skipped_while_suspended(resizer: HeadlessResizer, entry: ResizeEntry):
+    entry.skipped = True
+    resizer.remove_entry(entry)
+
+    assert not entry.suspended
+    assert entry.resume_event.is_set()
+    assert not entry.is_encoding
+    assert resizer.suspended_entries == []
+
+
+def test_threads_released_after_failed_while_suspended(resizer: HeadlessResizer, tmp_path: Path):
+    resizer.governor.thread_budget = 8
+    source = tmp_path / "long.mp4"
+    source.write_bytes(b"\0" * 16)
+    entry = ResizeEntry(source, size_limit=resizer.config.size_limit)
+    resizer.active_entries.append(entry)
+    threads = resizer.lease_entry_threads(entry)
+    assert resizer.suspend_entry(entry, force=True)
+
+    resizer._on_failed(entry, PopupMessage("failed"))
+    resizer.release_entry_threads(entry, threads)  # エンコードのスレッドの終了処理
+    resizer.release_entry_threads(entry, threads)
+
+    assert entry.thread_leases == []
+    assert resizer.governor.leased_threads == 0
+
+
+def test_no_process_started_after_failed_while_suspended(resizer: HeadlessResizer, entry: ResizeEntry):
+    resizer._on_failed(entry, PopupMessage("failed"))
+
+    assert entry.stopped
+    assert resizer.run_encoder(entry, ["ffmpeg-not-found", "-y", "out.mp4"]) == (-1, [])
+    assert entry.processes == []
+
+
+def _suspended_entry(resizer: HeadlessResizer, source: Path, priority: tuple) -> ResizeEntry:
+    source.write_bytes(b"\0" * 16)
+    entry = ResizeEntry(source, size_limit=resizer.config.size_limit)
+    entry.queue_priority = priority
+    resizer.active_entries.append(entry)
+    assert resizer.suspend_entry(entry, force=True)
+    return entry
+
+
+def test_resume_in_priority_order(resizer: HeadlessResizer, tmp_path: Path):
+    low = _suspended_entry(resizer, tmp_path / "low.mp4", (2, 0.))
+    high = _suspended_entry(resizer, tmp_path / "high.mp4", (0, 0.))
+
+    resizer.next_entry()
+
+    assert not high.suspended
+    assert low.suspended
+
+
+def test_victim_waits_for_preempting_entry(resizer: HeadlessResizer, tmp_path: Path):
+    victim = _suspended_entry(resizer, tmp_path / "victim.mp4", (2, 0.))
+    preempting = ResizeEntry(tmp_path / "order.mp4", size_limit=resizer.config.size_limit)
+    victim.preempted_by = preempting
+    resizer.entries.push(preempting, (0, 0.))
+
+    assert resizer.is_preempted(victim)  # 待機中
+
+    resizer.entries.remove(preempting)
+    assert resizer.suspend_entry(preempting, force=True)
+    assert resizer.is_preempted(victim)  # 一時停止中
+
+    resizer.resume_entry(preempting)
+    assert not resizer.is_preempted(victim)
+    assert victim.preempted_by is None